@@ -3,7 +3,7 @@ import requests
 import time
 import os
 import logging
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, jsonify, render_template, request, Response, stream_with_context
 
 import os
 import requests
@@ -13,8 +13,11 @@ import logging
 import time
 import re
 import uuid
-from threading import Lock
+from threading import Lock, Thread
 from pathlib import Path
+from datetime import datetime, timezone
+from itertools import groupby
+from operator import itemgetter
 
 try:
     from flask_cors import CORS
@@ -23,7 +26,6 @@ except Exception:
     _HAS_CORS = False
 
 from elevenlabs import ElevenLabs
-import base64
 
 
 from google import genai
@@ -69,78 +71,55 @@ OPENSKY_CLIENT_SECRET = os.environ.get("OPENSKY_CLIENT_SECRET")
 # 2. Motor de optimización (implementación Python)
 # ===================================================================
 
-from math import radians, cos, sin, asin, sqrt
+from math import radians, cos, isfinite
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    km = 6371 * c
-    return km
+import numpy as np
+
+from geo import haversine_distance, haversine_pairs, haversine_matrix, to_float_array, simplify_track, EARTH_RADIUS_KM
+from route_optimizer import optimize_tour, ENGINES as ROUTE_ENGINES
+from operator_matcher import OperatorMapping
+from state_vectors import decode_states, POSITION_COLUMNS
+from jobs import JobQueue, JobQueueFull, JobError
+from services.http_client import http_client, RateLimiter
+from services.fast_json import response_json
+from services.geocode_cache import GeocodeCache, normalize_query
+from services.cache import TTLCache
+from services.tts_cache import tts_cache, tts_cache_key
+from services.classification_cache import ClassificationCache, ClassificationQueue
+from services.history_store import HistoryStore
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+from flight_state import SnapshotPoller, FlightSnapshot, EMPTY_SNAPSHOT, ConflictRegistry, AlertLog, EventLog, COMPACT_FIELDS, diff_snapshots, select_fields, to_columns, freeze_flight
 
 
 def find_shortest_tour(points):
+    """Compatibilidad: devuelve [distancia_km, puntos_ordenados] usando route_optimizer.optimize_tour."""
     if not points or len(points) <= 1:
         return [0, points]
-    n = len(points)
-    tour = [0]
-    unvisited = set(range(1, n))
-    while unvisited:
-        current = tour[-1]
-        nearest = min(unvisited, key=lambda j: haversine_distance(points[current][0], points[current][1], points[j][0], points[j][1]))
-        tour.append(nearest)
-        unvisited.remove(nearest)
-    total_distance = 0
-    for i in range(len(tour) - 1):
-        current = tour[i]
-        next_point = tour[i + 1]
-        total_distance += haversine_distance(points[current][0], points[current][1], points[next_point][0], points[next_point][1])
-    improved = True
-    iterations = 0
-    max_iterations = 100
-    while improved and iterations < max_iterations:
-        improved = False
-        iterations += 1
-        for i in range(n - 1):
-            for j in range(i + 2, n):
-                if j - i == 1:
-                    continue
-                curr_dist = (
-                    haversine_distance(points[tour[i]][0], points[tour[i]][1], points[tour[i+1]][0], points[tour[i+1]][1]) +
-                    haversine_distance(points[tour[j]][0], points[tour[j]][1], points[tour[(j+1) % n]][0], points[tour[(j+1) % n]][1])
-                )
-                new_dist = (
-                    haversine_distance(points[tour[i]][0], points[tour[i]][1], points[tour[j]][0], points[tour[j]][1]) +
-                    haversine_distance(points[tour[i+1]][0], points[tour[i+1]][1], points[tour[(j+1) % n]][0], points[tour[(j+1) % n]][1])
-                )
-                if new_dist < curr_dist:
-                    tour[i+1:j+1] = reversed(tour[i+1:j+1])
-                    total_distance = total_distance - curr_dist + new_dist
-                    improved = True
-                    break
-            if improved:
-                break
-    ruta_optimizada = [points[i] for i in tour]
-    total_distance = 0
-    for i in range(len(tour) - 1):
-        a = tour[i]
-        b = tour[i + 1]
-        total_distance += haversine_distance(points[a][0], points[a][1], points[b][0], points[b][1])
-    return [total_distance, ruta_optimizada]
+    tour, total_distance, _stats = optimize_tour(points)
+    return [total_distance, [points[i] for i in tour]]
+
+
+# Tope del time_budget_ms que puede pedir un cliente en /api/optimize-route
+ROUTE_TIME_BUDGET_MS_MAX = float(os.environ.get("ROUTE_TIME_BUDGET_MS_MAX", "2000"))
 
 
-def optimize_route_wolfram(origen, destino, restricciones):
+def optimize_route_wolfram(origen, destino, restricciones, engine=None, time_budget_ms=None):
+    """
+    Optimiza el camino abierto origen -> restricciones -> destino con origen y
+    destino anclados en los extremos. engine y time_budget_ms se pasan a
+    route_optimizer.optimize_tour (None usa ROUTE_ENGINE / ROUTE_TIME_BUDGET_MS).
+    """
     try:
         puntos_de_control = [origen] + restricciones + [destino]
         logger.info("Calculando ruta óptima para %d puntos", len(puntos_de_control))
-        distancia_total, ruta_final = find_shortest_tour(puntos_de_control)
-        logger.info("Ruta calculada: %.2f km", distancia_total)
+        tour, distancia_total, stats = optimize_tour(puntos_de_control, engine=engine, fixed_end=True, time_budget_ms=time_budget_ms)
+        ruta_final = [puntos_de_control[i] for i in tour]
+        logger.info("Ruta calculada: %.2f km en %.1f ms (%d movimientos)", distancia_total, stats["total_ms"], stats["moves"])
         return {
             "Status": "Optimizado con Éxito",
             "RutaTotalKM": round(distancia_total, 2),
             "RutaOptimizada": ruta_final,
+            "Estadisticas": stats,
             "Mensaje": "Ruta calculada con éxito. Listo para el análisis de IA."
         }
     except Exception as e:
@@ -152,15 +131,125 @@ def optimize_route_wolfram(origen, destino, restricciones):
 # 3. SISTEMA DE MONITOREO OPENSKY (Simulador + API Real)
 # ===================================================================
 
+# Separación mínima 3D (km) y altitud por defecto (m) usadas en la detección de conflictos
+CONFLICT_THRESHOLD_KM = 5.0
+DEFAULT_ALTITUDE_M = 3000
+# Kilómetros por grado de latitud con el radio terrestre de haversine_distance (6371 km)
+KM_PER_DEG_LAT = EARTH_RADIUS_KM * radians(1)
+
+
+def spatial_candidate_pairs(flights, threshold_km=CONFLICT_THRESHOLD_KM):
+    """
+    Fase amplia de la detección de conflictos: agrupa los vuelos en celdas
+    de ~threshold_km (latitud/longitud) y bandas de altitud de threshold_km,
+    y devuelve solo los pares (i, j), i < j, que caen en celdas vecinas.
+
+    Es conservadora: todo par que brute force encontraría a menos de
+    threshold_km aparece en la lista, ordenada como en el doble bucle original.
+    """
+    cell_lat = threshold_km / KM_PER_DEG_LAT
+    entries = []
+    max_abs_lat = 0.0
+    for idx, f in enumerate(flights):
+        lat = f.get('lat')
+        lon = f.get('lon')
+        if lat is None or lon is None:
+            continue
+        try:
+            lat = float(lat)
+            lon = float(lon)
+        except Exception:
+            continue
+        if not (isfinite(lat) and isfinite(lon)):
+            # haversine_distance nunca da < threshold con NaN/inf
+            continue
+        alt = f.get('alt') if f.get('alt') is not None else DEFAULT_ALTITUDE_M
+        try:
+            band = int(float(alt) // (threshold_km * 1000.0))
+        except Exception:
+            # Altitud inválida => separación vertical 0, compatible con cualquier banda
+            band = None
+        entries.append((idx, lat, lon, band))
+        max_abs_lat = max(max_abs_lat, abs(lat))
+
+    # Una celda de longitud debe medir al menos threshold_km en la latitud más
+    # alejada del ecuador presente; el 1% extra absorbe el error de la cota.
+    if max_abs_lat >= 89.0:
+        n_lon_cells = 1
+        cell_lon = 360.0
+    else:
+        cell_lon = min(threshold_km * 1.01 / (KM_PER_DEG_LAT * cos(radians(max_abs_lat))), 360.0)
+        n_lon_cells = max(int(360.0 // cell_lon), 1)
+
+    grid = {}
+    for idx, lat, lon, band in entries:
+        ci = int((lat + 90.0) // cell_lat)
+        cj = int(((lon + 180.0) % 360.0) // cell_lon) % n_lon_cells
+        grid.setdefault((ci, cj), []).append((idx, band))
+
+    pairs = set()
+    for (ci, cj), members in grid.items():
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                other = grid.get((ci + di, (cj + dj) % n_lon_cells))
+                if not other:
+                    continue
+                for i, band_i in members:
+                    for j, band_j in other:
+                        if i >= j:
+                            continue
+                        if band_i is not None and band_j is not None and abs(band_i - band_j) > 1:
+                            continue
+                        pairs.add((i, j))
+    return sorted(pairs)
+
+
 class FlightMonitor:
+    """
+    Monitor de tráfico con estado copy-on-write: cada refresco construye
+    registros nuevos y los publica de golpe como un FlightSnapshot inmutable
+    (self.snapshot). Los lectores toman la referencia vigente sin lock.
+    """
+
     def __init__(self):
-        self.flights = []
+        self.snapshot = EMPTY_SNAPSHOT
+        self._refresh_lock = Lock()
         self.conflict_zones = [
             {"lat": 19.5, "lon": -99.5, "radius": 15, "name": "CDMX Centro"},
             {"lat": 19.4, "lon": -99.3, "radius": 10, "name": "Zona Este"}
         ]
-        self.known_conflicts = set()
+        # Conflictos ya alertados: TTL, re-armado al separarse y tope de tamaño
+        self.known_conflicts = ConflictRegistry(
+            ttl=float(os.environ.get("CONFLICT_TTL_S", "600")),
+            max_entries=int(os.environ.get("CONFLICT_REGISTRY_MAX", "10000")),
+            rearm_after=float(os.environ.get("CONFLICT_REARM_S", "20")),
+        )
+        # CONFLICT_BRUTE_FORCE=1 vuelve a la comparación de todos los pares (verificación)
+        self.brute_force_conflicts = os.environ.get("CONFLICT_BRUTE_FORCE", "0") == "1"
         self._generate_mock_flights()
+
+    @property
+    def flights(self):
+        """Vuelos del snapshot vigente (tupla de FrozenFlight)."""
+        return self.snapshot.flights
+
+    @flights.setter
+    def flights(self, flights):
+        self._publish(flights)
+
+    def _publish(self, flights, conflicts=(), alerts=()):
+        # Un solo reemplazo de referencia: atómico para los lectores
+        snapshot = FlightSnapshot(self.snapshot.version + 1, time.time(), flights, conflicts, alerts)
+        self.snapshot = snapshot
+        return snapshot
+
+    def refresh(self):
+        """Consulta OpenSky, detecta conflictos y publica un snapshot nuevo. Devuelve el snapshot."""
+        with self._refresh_lock:
+            flights = [freeze_flight(f) for f in self.fetch_opensky_data()]
+            conflicts, alerts = self.detect_conflicts(flights=flights)
+            return self._publish(flights, conflicts, alerts)
+
     def _generate_mock_flights(self):
         self.flights = [
             {"icao24": "a0a1b2c3", "callsign": "AM456", "lat": 19.45, "lon": -99.25, "alt": 2500, "velocity": 450, "heading": 90, "type": "pasajero", "origin": "BENITO JUÁREZ", "destination": "QUERÉTARO"},
@@ -169,6 +258,10 @@ class FlightMonitor:
             {"icao24": "l2m3n4o5", "callsign": "CARGO-01", "lat": 19.52, "lon": -99.50, "alt": 3500, "velocity": 480, "heading": 45, "type": "carga", "origin": "CDMX", "destination": "TOLUCA"}
         ]
     def fetch_opensky_data(self):
+        """
+        Devuelve una lista nueva de registros de vuelo (OpenSky cliente, HTTP o
+        simulación). No modifica el snapshot publicado; eso lo hace refresh().
+        """
         try:
             bounds = os.environ.get("OPENSKY_BOUNDS", "18.0,-100.0,21.0,-98.0").split(",")
             if len(bounds) == 4:
@@ -188,7 +281,9 @@ class FlightMonitor:
                             states_obj = client.get_states(time_secs=0, bbox=(lat_min, lat_max, lon_min, lon_max))
                             flights = []
                             if states_obj and getattr(states_obj, 'states', None):
-                                for sv in states_obj.states:
+                                # Vista reutilizada por fila: sin un objeto por aeronave
+                                states_iter = states_obj.states.iter_view() if hasattr(states_obj.states, 'iter_view') else states_obj.states
+                                for sv in states_iter:
                                     try:
                                         lat = getattr(sv, 'latitude', None)
                                         lon = getattr(sv, 'longitude', None)
@@ -213,9 +308,9 @@ class FlightMonitor:
                                     except Exception:
                                         continue
                             if flights:
-                                self.flights = validate_flights_batch_with_gemini(flights)
-                                logger.info("OpenSky (client) fetched %d flights, validated with Gemini", len(self.flights))
-                                return self.flights
+                                flights = enrich_flights(flights)
+                                logger.info("OpenSky (client) fetched %d flights", len(flights))
+                                return flights
                         else:
                             logger.warning("OpenSky client class 'OpenSkyApi' not found in module 'services.opensky_api'.")
                     else:
@@ -228,80 +323,150 @@ class FlightMonitor:
                     for flight in http_flights:
                         flight['type'] = classify_flight(flight.get('callsign'))
                     
-                    self.flights = validate_flights_batch_with_gemini(http_flights)
-                    logger.info("OpenSky (HTTP) fetched %d flights, validated with Gemini", len(self.flights))
-                    return self.flights
+                    flights = enrich_flights(http_flights)
+                    logger.info("OpenSky (HTTP) fetched %d flights", len(flights))
+                    return flights
             except Exception as e:
                 logger.warning("OpenSky HTTP fetch failed: %s", e)
-            for flight in self.flights:
+            flights = []
+            for previous in self.flights:
+                # Registro nuevo por vuelo; el snapshot publicado no se toca
+                flight = dict(previous)
                 flight["lat"] += random.uniform(-0.02, 0.02)
                 flight["lon"] += random.uniform(-0.02, 0.02)
                 try:
                     flight["alt"] = (flight.get("alt") or 3000) + random.randint(-100, 100)
                 except Exception:
                     flight["alt"] = flight.get("alt", 3000)
-            logger.info(f"Monitoreo (mock): {len(self.flights)} vuelos activos en CDMX")
-            return self.flights
+                flights.append(flight)
+            logger.info(f"Monitoreo (mock): {len(flights)} vuelos activos en CDMX")
+            return flights
         except Exception as e:
             logger.error("Error fetching OpenSky (general): %s", e)
             return []
-    def detect_conflicts(self):
+    @staticmethod
+    def _candidate_pairs(flights, brute_force):
+        """Devuelve los pares candidatos como dos arrays de índices (i < j) en orden lexicográfico."""
+        n = len(flights)
+        if brute_force:
+            return np.triu_indices(n, k=1)
+        pairs = spatial_candidate_pairs(flights, CONFLICT_THRESHOLD_KM)
+        if not pairs:
+            return np.empty(0, dtype=int), np.empty(0, dtype=int)
+        idx = np.asarray(pairs, dtype=int)
+        return idx[:, 0], idx[:, 1]
+
+    @staticmethod
+    def _altitude_array(flights):
+        """Altitudes en metros (por defecto DEFAULT_ALTITUDE_M) y máscara de valores no numéricos."""
+        alts = np.empty(len(flights), dtype=float)
+        invalid = np.zeros(len(flights), dtype=bool)
+        for k, f in enumerate(flights):
+            alt = f.get('alt') if f.get('alt') is not None else DEFAULT_ALTITUDE_M
+            try:
+                alts[k] = float(alt)
+            except Exception:
+                alts[k] = 0.0
+                invalid[k] = True
+        return alts, invalid
+
+    def detect_conflicts(self, brute_force=None, flights=None):
+        """
+        Detecta conflictos de proximidad entre vuelos y entradas en zonas restringidas.
+        Por defecto solo compara pares de celdas vecinas (spatial_candidate_pairs);
+        brute_force=True (o CONFLICT_BRUTE_FORCE=1) compara todos los pares.
+        Las distancias de todos los pares y zonas se calculan en lote con NumPy.
+        flights permite evaluar una lista aún no publicada (por defecto, el snapshot vigente).
+        """
+        if brute_force is None:
+            brute_force = self.brute_force_conflicts
+        if flights is None:
+            flights = self.flights
         conflicts = []
         alerts = []
-        for i in range(len(self.flights)):
-            for j in range(i + 1, len(self.flights)):
-                f1, f2 = self.flights[i], self.flights[j]
-                # Skip if coordinates are missing
-                lat1 = f1.get('lat')
-                lon1 = f1.get('lon')
-                lat2 = f2.get('lat')
-                lon2 = f2.get('lon')
-                if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
-                    continue
-                try:
-                    dist_horizontal = haversine_distance(lat1, lon1, lat2, lon2)
-                except Exception:
-                    continue
-                # Use a safe default altitude when missing (meters)
-                alt1 = f1.get('alt') if f1.get('alt') is not None else 3000
-                alt2 = f2.get('alt') if f2.get('alt') is not None else 3000
-                try:
-                    dist_vertical = abs(float(alt1) - float(alt2)) / 1000.0
-                except Exception:
-                    dist_vertical = 0.0
-                dist_3d = (dist_horizontal**2 + dist_vertical**2)**0.5
-                if dist_3d < 5:
-                    # Build a stable conflict id even if icao24 missing
-                    icao1 = f1.get('icao24') or f1.get('callsign') or str(i)
-                    icao2 = f2.get('icao24') or f2.get('callsign') or str(j)
-                    conflict_id = f"{icao1}-{icao2}"
-                    if conflict_id not in self.known_conflicts:
-                        self.known_conflicts.add(conflict_id)
-                        conflicts.append({"type": "proximitad", "flight1": f1.get('callsign'), "flight2": f2.get('callsign'), "distance_km": round(dist_3d, 2), "severity": "crítica" if dist_3d < 2 else "alta"})
-                        alerts.append({"title": "⚠️ Conflicto de Proximidad", "message": f"{f1.get('callsign')} y {f2.get('callsign')} a {dist_3d:.1f} km", "severity": "danger"})
-        for flight in self.flights:
-            # Skip flights without coordinates
-            f_lat = flight.get('lat')
-            f_lon = flight.get('lon')
-            if f_lat is None or f_lon is None:
-                continue
-            for zone in self.conflict_zones:
-                try:
-                    dist = haversine_distance(f_lat, f_lon, zone['lat'], zone['lon'])
-                except Exception:
-                    continue
-                if dist < zone['radius']:
-                    zone_id = f"{flight.get('icao24') or flight.get('callsign')}-{zone['name']}"
-                    if zone_id not in self.known_conflicts:
-                        self.known_conflicts.add(zone_id)
-                        severity_level = "crítica" if dist < zone['radius']/2 else "alta"
-                        alerts.append({"title": f"⚡ Zona Restringida: {zone['name']}", "message": f"{flight.get('callsign')} en zona de restricción", "severity": "warning" if severity_level == "alta" else "danger"})
+        now = time.time()
+        active_keys = []
+        if not flights:
+            self.known_conflicts.sweep(active_keys, now)
+            return conflicts, alerts
+        # Coordenadas faltantes o no numéricas quedan como NaN y nunca generan conflicto
+        lats = to_float_array([f.get('lat') for f in flights])
+        lons = to_float_array([f.get('lon') for f in flights])
+        alts, alt_invalid = self._altitude_array(flights)
+
+        ii, jj = self._candidate_pairs(flights, brute_force)
+        if len(ii):
+            dist_horizontal = haversine_pairs(lats[ii], lons[ii], lats[jj], lons[jj])
+            # Una altitud inválida cuenta como separación vertical 0
+            dist_vertical = np.where(alt_invalid[ii] | alt_invalid[jj], 0.0, np.abs(alts[ii] - alts[jj]) / 1000.0)
+            dist_3d = np.sqrt(dist_horizontal**2 + dist_vertical**2)
+            for k in np.flatnonzero(dist_3d < CONFLICT_THRESHOLD_KM):
+                i, j, d = int(ii[k]), int(jj[k]), float(dist_3d[k])
+                f1, f2 = flights[i], flights[j]
+                # Build a stable conflict id even if icao24 missing
+                icao1 = f1.get('icao24') or f1.get('callsign') or str(i)
+                icao2 = f2.get('icao24') or f2.get('callsign') or str(j)
+                conflict_key = ConflictRegistry.pair_key(icao1, icao2)
+                active_keys.append(conflict_key)
+                if self.known_conflicts.observe(conflict_key, now):
+                    conflicts.append({"type": "proximitad", "flight1": f1.get('callsign'), "flight2": f2.get('callsign'), "distance_km": round(d, 2), "severity": "crítica" if d < 2 else "alta"})
+                    alerts.append({"title": "⚠️ Conflicto de Proximidad", "message": f"{f1.get('callsign')} y {f2.get('callsign')} a {d:.1f} km", "severity": "danger"})
+
+        if self.conflict_zones:
+            # Matriz vuelos x zonas; np.nonzero recorre en orden (vuelo, zona) como el bucle original
+            zone_points = [[z['lat'], z['lon']] for z in self.conflict_zones]
+            zone_radius = np.array([z['radius'] for z in self.conflict_zones], dtype=float)
+            zone_dist = haversine_matrix(np.column_stack([lats, lons]), zone_points)
+            for fi, zi in zip(*np.nonzero(zone_dist < zone_radius[None, :])):
+                flight = flights[fi]
+                zone = self.conflict_zones[zi]
+                dist = float(zone_dist[fi, zi])
+                zone_key = ConflictRegistry.zone_key(flight.get('icao24') or flight.get('callsign'), zone['name'])
+                active_keys.append(zone_key)
+                if self.known_conflicts.observe(zone_key, now):
+                    severity_level = "crítica" if dist < zone['radius']/2 else "alta"
+                    alerts.append({"title": f"⚡ Zona Restringida: {zone['name']}", "message": f"{flight.get('callsign')} en zona de restricción", "severity": "warning" if severity_level == "alta" else "danger"})
+        self.known_conflicts.sweep(active_keys, now)
         return conflicts, alerts
 
 
 # Instancia global del monitor
 flight_monitor = FlightMonitor()
 
+# Refresco en segundo plano: un solo hilo es dueño de flight_monitor y publica snapshots.
+# FLIGHT_POLLER=0 vuelve al refresco síncrono en cada petición.
+FLIGHT_POLLER_ENABLED = os.environ.get("FLIGHT_POLLER", "1") == "1"
+FLIGHT_REFRESH_INTERVAL = float(os.environ.get("FLIGHT_REFRESH_INTERVAL", "10"))
+# Tiempo máximo (s) que una petición espera el primer snapshot tras arrancar el poller
+FLIGHT_FIRST_SNAPSHOT_TIMEOUT = float(os.environ.get("FLIGHT_FIRST_SNAPSHOT_TIMEOUT", "15"))
+# Snapshots retenidos para responder /api/vuelos?since=<version> con un delta
+FLIGHT_SNAPSHOT_HISTORY = int(os.environ.get("FLIGHT_SNAPSHOT_HISTORY", "30"))
+
+# Alertas recientes con id creciente (para /api/alerts-poll y /api/stream)
+ALERT_LOG_SIZE = int(os.environ.get("ALERT_LOG_SIZE", "500"))
+
+
+def refresh_flights():
+    """Refresco del poller: publica el snapshot nuevo y registra sus alertas en la bitácora."""
+    snapshot = flight_monitor.refresh()
+    alert_log.extend(snapshot.alerts, version=snapshot.version)
+    return snapshot
+
+
+flight_poller = SnapshotPoller(refresh_flights, FLIGHT_REFRESH_INTERVAL, history=FLIGHT_SNAPSHOT_HISTORY)
+alert_log = AlertLog(ALERT_LOG_SIZE, on_append=flight_poller.notify)
+
+
+def get_flight_snapshot():
+    """Devuelve el snapshot vigente, arrancando el poller (o refrescando en línea si está desactivado)."""
+    if not FLIGHT_POLLER_ENABLED:
+        return flight_poller.refresh_once()
+    flight_poller.start()
+    snapshot = flight_poller.current()
+    if snapshot.version == 0:
+        snapshot = flight_poller.wait_for_version(0, timeout=FLIGHT_FIRST_SNAPSHOT_TIMEOUT)
+    return snapshot
+
 
 # -----------------------------
 # OpenSky HTTP helper (from app_min.py)
@@ -316,7 +481,7 @@ def obtener_token_opensky():
     try:
         url = "https://auth.opensky-network.org/auth/realms/opensky-network/protocol/openid-connect/token"
         data = {"grant_type": "client_credentials", "client_id": OPENSKY_CLIENT_ID, "client_secret": OPENSKY_CLIENT_SECRET}
-        r = requests.post(url, data=data, timeout=10)
+        r = http_client.post(url, data=data)
         r.raise_for_status()
         j = r.json()
         _opensky_token_cache["access_token"] = j.get("access_token")
@@ -334,58 +499,24 @@ def obtener_vuelos_opensky(lamin, lomin, lamax, lomax):
     if token:
         headers["Authorization"] = f"Bearer {token}"
     params = {"lamin": lamin, "lomin": lomin, "lamax": lamax, "lomax": lomax}
-    r = requests.get(url, headers=headers, params=params, timeout=10)
+    r = http_client.get(url, headers=headers, params=params)
     r.raise_for_status()
-    data = r.json()
-    vuelos = []
-    now_ts = int(time.time())
-    for s in data.get("states", []):
-        lat = s[6] if len(s) > 6 else None
-        lon = s[5] if len(s) > 5 else None
-        # Require coordinates
-        if lat is None or lon is None:
-            continue
-        # Coerce to float and skip if invalid
-        try:
-            lat = float(lat)
-            lon = float(lon)
-        except Exception:
-            continue
-        # Altitude (may be None)
-        alt = None
-        if len(s) > 7 and s[7] is not None:
-            try:
-                alt = float(s[7])
-            except Exception:
-                alt = None
-        # Velocity
-        velocity = None
-        if len(s) > 9 and s[9] is not None:
-            try:
-                velocity = float(s[9])
-            except Exception:
-                velocity = None
-        # Heading / true_track
-        heading = None
-        if len(s) > 10 and s[10] is not None:
-            try:
-                heading = float(s[10])
-            except Exception:
-                heading = None
-        callsign = (s[1] or "").strip() if len(s) > 1 else ""
-        vuelos.append({
-            "icao24": s[0] if len(s) > 0 else None,
-            "callsign": callsign,
-            "origin_country": s[2] if len(s) > 2 else None,
-            "lat": lat,
-            "lon": lon,
-            "alt": alt,
-            "velocity": velocity,
-            "heading": heading,
-            "type": "desconocido",
-            "destination": None,
-            "fetched_at": now_ts
-        })
+    data = response_json(r)
+    return decode_flight_records(data.get("states"))
+
+
+def decode_flight_records(states, now_ts=None):
+    """
+    Registros de vuelo (solo con posición) a partir del `states` de OpenSky,
+    decodificado por columnas en una pasada.
+    """
+    cols = decode_states(states, POSITION_COLUMNS)
+    cols = cols.take(cols.valid_position())
+    now_ts = int(time.time()) if now_ts is None else now_ts
+    vuelos = [
+        {"icao24": icao24 or None, "callsign": callsign, "origin_country": country or None, "lat": lat, "lon": lon, "alt": alt, "velocity": velocity, "heading": heading, "type": "desconocido", "destination": None, "fetched_at": now_ts}
+        for icao24, callsign, country, lat, lon, alt, velocity, heading in zip(*(cols.column_list(name) for name in POSITION_COLUMNS))
+    ]
     return vuelos
 
 
@@ -504,7 +635,7 @@ def call_gemini_analysis(route_data_str):
         }
         timeout = float(os.environ.get('GEMINI_MICROSERVICE_TIMEOUT', 6.0))
         try:
-            r = requests.post(url, json=payload, timeout=timeout)
+            r = http_client.post(url, json=payload, timeout=timeout)
             r.raise_for_status()
             j = r.json()
             # Devolver campos comunes si existen
@@ -543,60 +674,160 @@ def call_gemini_analysis(route_data_str):
         return 'Análisis IA no disponible.'
 
 
+# Caché de geocodificación: LRU en memoria + SQLite, precargada con aeropuertos y ciudades
+GEOCODE_CACHE_DB = os.environ.get("GEOCODE_CACHE_DB", str(Path(__file__).resolve().parent / 'data' / 'geocode_cache.sqlite3'))
+GEOCODE_SEED_FILE = os.environ.get("GEOCODE_SEED_FILE", str(Path(__file__).resolve().parent / 'data' / 'geocode_seed.json'))
+geocode_cache = GeocodeCache(
+    db_path=GEOCODE_CACHE_DB or None,
+    maxsize=int(os.environ.get("GEOCODE_CACHE_SIZE", "2048")),
+    ttl=float(os.environ.get("GEOCODE_CACHE_TTL_S", str(30 * 86400))),
+    negative_ttl=float(os.environ.get("GEOCODE_NEGATIVE_TTL_S", "3600")),
+)
+if GEOCODE_SEED_FILE and Path(GEOCODE_SEED_FILE).exists():
+    geocode_cache.warm_up(GEOCODE_SEED_FILE)
+
+# Política de uso de Nominatim: como máximo 1 petición/s (límite por proceso).
+# Lo aplica http_client a cada intento, reintentos incluidos.
+nominatim_limiter = RateLimiter(float(os.environ.get("NOMINATIM_RATE_PER_S", "1.0")))
+http_client.set_rate_limit("nominatim.openstreetmap.org", nominatim_limiter)
+# Pool acotado para geocodificar los puntos de una ruta en paralelo
+GEOCODE_WORKERS = int(os.environ.get("GEOCODE_WORKERS", "4"))
+_geocode_executor = ThreadPoolExecutor(max_workers=max(GEOCODE_WORKERS, 1), thread_name_prefix="geocode")
+
+
 def call_geocode_address(address):
     """
     Geocodifica una dirección usando Nominatim (OpenStreetMap).
     OpenRouter fue removido; esta función usa únicamente Nominatim.
+    Consulta primero geocode_cache; "sin resultados" también se cachea
+    (con TTL corto), los errores de red no.
     """
+    found, cached = geocode_cache.get(address)
+    if found:
+        if cached is None:
+            logger.info("Geocoding (caché negativa) sin resultados para '%s'.", address)
+        return cached
     try:
         nominatim_url = "https://nominatim.openstreetmap.org/search"
         params = { 'q': address, 'format': 'json', 'limit': 1 }
         headers = { 'User-Agent': 'TakeYouOff/1.0 (+https://example.org)' }
-        r = requests.get(nominatim_url, params=params, headers=headers, timeout=8)
+        r = http_client.get(nominatim_url, params=params, headers=headers)
         r.raise_for_status()
         results = r.json()
         if results and isinstance(results, list) and len(results) > 0:
             lat = float(results[0].get('lat'))
             lon = float(results[0].get('lon'))
             logger.info("Geocoding Nominatim OK para '%s' -> %s,%s", address, lat, lon)
+            geocode_cache.set(address, (lat, lon))
             return lat, lon
+        if isinstance(results, list):
+            geocode_cache.set(address, None)
     except Exception as e:
         logger.warning("Nominatim geocoding failed for '%s': %s", address, e)
     logger.warning("Geocoding falló para '%s'.", address)
     return None
 
 
-def call_elevenlabs_alert(message, save_to_file=False):
-    if not ELEVENLABS_CLIENT:
-        logger.warning("ALERTA: Cliente ElevenLabs no inicializado. No se generará audio.")
-        return None
+def _literal_location(val):
+    """Coordenadas dadas como [lat, lon] o {"lat", "lon"}; None si no lo son."""
     try:
-        logger.info("ALERTA: Generando audio de voz con ElevenLabs...")
-        audio_iter = ELEVENLABS_CLIENT.text_to_speech.convert(text=message, voice_id="EXAVITQu4vr4xnSDxMaL", model_id="eleven_multilingual_v2", output_format="mp3_22050_32")
-        try:
-            audio_bytes = b"".join(audio_iter)
-        except TypeError:
-            audio_bytes = b""
-            for chunk in audio_iter:
-                if isinstance(chunk, (bytes, bytearray)):
-                    audio_bytes += bytes(chunk)
-                else:
-                    audio_bytes += str(chunk).encode('utf-8')
-        if save_to_file:
-            audio_filename = f"alert_{uuid.uuid4().hex[:8]}.mp3"
-            audio_path = AUDIO_FOLDER / audio_filename
-            with open(audio_path, 'wb') as f:
-                f.write(audio_bytes)
-            audio_url = f"/static/audio/{audio_filename}"
-            logger.info("ALERTA: Audio guardado en %s", audio_url)
-            return audio_url
-        b64 = base64.b64encode(audio_bytes).decode('ascii')
-        data_url = f"data:audio/mpeg;base64,{b64}"
-        return data_url
-    except Exception as e:
-        logger.error("Error al generar audio con ElevenLabs: %s", e)
-        logger.error("Detalles:", exc_info=True)
+        if isinstance(val, (list, tuple)) and len(val) == 2:
+            return [float(val[0]), float(val[1])]
+    except Exception:
+        pass
+    try:
+        if isinstance(val, dict) and 'lat' in val and 'lon' in val:
+            return [float(val['lat']), float(val['lon'])]
+    except Exception:
+        pass
+    return None
+
+
+def resolve_waypoints(values):
+    """
+    Resuelve una lista de puntos (coordenadas o direcciones) a [lat, lon] o None,
+    en el mismo orden. Las direcciones se deduplican dentro de la petición
+    (misma clave normalizada que la caché) y se geocodifican en paralelo en
+    _geocode_executor; nominatim_limiter mantiene el ritmo global.
+    """
+    resolved = [_literal_location(v) for v in values]
+    pending = {}
+    for i, val in enumerate(values):
+        if resolved[i] is None and isinstance(val, str) and val.strip():
+            pending.setdefault(normalize_query(val) or val.strip(), (val.strip(), []))[1].append(i)
+    if not pending:
+        return resolved
+    queries = list(pending.values())
+    if len(queries) == 1:
+        results = [call_geocode_address(queries[0][0])]
+    else:
+        results = list(_geocode_executor.map(call_geocode_address, [q for q, _ in queries]))
+    for (query, indexes), coords in zip(queries, results):
+        for i in indexes:
+            resolved[i] = [coords[0], coords[1]] if coords else None
+    return resolved
+
+
+TTS_VOICE_ID = "EXAVITQu4vr4xnSDxMaL"
+TTS_MODEL_ID = "eleven_multilingual_v2"
+TTS_OUTPUT_FORMAT = "mp3_22050_32"
+
+
+def _tts_chunks(message):
+    """Itera los fragmentos MP3 de ElevenLabs según llegan (sin acumularlos)."""
+    audio_iter = ELEVENLABS_CLIENT.text_to_speech.convert(text=message, voice_id=TTS_VOICE_ID, model_id=TTS_MODEL_ID, output_format=TTS_OUTPUT_FORMAT)
+    if isinstance(audio_iter, (bytes, bytearray)):
+        yield bytes(audio_iter)
+        return
+    for chunk in audio_iter:
+        if isinstance(chunk, (bytes, bytearray)):
+            yield bytes(chunk)
+        elif chunk:
+            yield str(chunk).encode('utf-8')
+
+
+def alert_audio_key(message):
+    return tts_cache_key(message, TTS_VOICE_ID, TTS_MODEL_ID, TTS_OUTPUT_FORMAT)
+
+
+# Audio de alerta bajo demanda: las respuestas JSON solo llevan una URL. Si la
+# frase ya está en la caché TTS es el MP3 estático; si no, /api/audio/<clave>
+# la sintetiza al pedirla, reenvía los fragmentos según llegan de ElevenLabs
+# y la guarda en la caché para las siguientes veces.
+audio_streams = TTLCache(
+    maxsize=int(os.environ.get("AUDIO_STREAM_CACHE_SIZE", "256")),
+    ttl=float(os.environ.get("AUDIO_STREAM_TTL_S", "900")),
+)
+# Espera máxima de un cliente a la síntesis que ya hizo otro para la misma clave
+AUDIO_STREAM_WAIT_S = float(os.environ.get("AUDIO_STREAM_WAIT_S", "60"))
+
+
+def register_alert_audio(message):
+    """URL de audio de una alerta (None sin cliente ElevenLabs)."""
+    if not ELEVENLABS_CLIENT or not message:
         return None
+    key = alert_audio_key(message)
+    if key in tts_cache:
+        return tts_cache.url_for(key)
+    audio_streams.set(key, message)
+    return f"/api/audio/{key}"
+
+
+# Frases fijas que se sintetizan al arrancar con TTS_PRESYNTH=1 (las que
+# llevan cifras cambian en cada alerta y se cachean al usarse)
+TTS_PRESYNTH_PHRASES = (
+    "ALERTA: Riesgo detectado en la ruta. Revisa el informe de IA en pantalla.",
+)
+
+
+def presynthesize_alert_phrases():
+    if not ELEVENLABS_CLIENT:
+        return 0
+    return tts_cache.presynthesize([(alert_audio_key(p), p) for p in TTS_PRESYNTH_PHRASES], lambda text: b"".join(_tts_chunks(text)))
+
+
+if os.environ.get("TTS_PRESYNTH", "0").lower() in ("1", "true", "yes"):
+    Thread(target=presynthesize_alert_phrases, name="tts-presynth", daemon=True).start()
 
 
 # ===================================================================
@@ -608,103 +839,287 @@ def index():
     return render_template('index.html')
 
 
-@app.route('/api/optimize-route', methods=['POST'])
-def optimize_route():
-    data = request.json or {}
+# Análisis Gemini y audio TTS de optimize-route: se lanzan en paralelo y la respuesta
+# espera como máximo AI_DEADLINE_S; lo que siga pendiente continúa como trabajo
+# "route-ai" de job_queue y se consulta en /api/jobs/<id>.
+AI_DEADLINE_S = float(os.environ.get("AI_DEADLINE_S", "8"))
+AI_WORKERS = max(int(os.environ.get("AI_WORKERS", "4")), 1)
+_ai_executor = ThreadPoolExecutor(max_workers=AI_WORKERS, thread_name_prefix="ai")
+
+
+def build_route_alert_message(ruta_km, is_critical, gemini_analysis=None):
+    if is_critical:
+        return f"ALERTA CRÍTICA: La ruta óptima excede los {int(ruta_km)} kilómetros y presenta alto riesgo. Verifique el análisis de Gemini."
+    short_analysis = None
+    try:
+        if isinstance(gemini_analysis, str) and len(gemini_analysis) > 0:
+            short_analysis = gemini_analysis.split('\n')[0]
+    except Exception:
+        short_analysis = None
+    if short_analysis:
+        return f"ALERTA: Riesgo detectado en la ruta. Resumen: {short_analysis}"
+    return "ALERTA: Riesgo detectado en la ruta. Revisa el informe de IA en pantalla."
+
+
+def start_route_ai(datos_para_gemini, ruta_km, is_critical, force_audio):
+    """
+    Lanza el análisis de Gemini y, si corresponde, registra el audio de alerta
+    (una URL de /api/audio; la síntesis ocurre cuando el navegador la pide).
+    En rutas críticas el texto del audio no depende de Gemini y la URL está
+    lista de inmediato; con force_audio el texto usa el resumen de Gemini y se
+    registra al terminar éste. Devuelve {"analisis": Future, "audio": Future}.
+    """
+    futures = {"analisis": _ai_executor.submit(call_gemini_analysis, json.dumps(datos_para_gemini))}
+    if is_critical:
+        audio_future = Future()
+        audio_future.set_result(register_alert_audio(build_route_alert_message(ruta_km, True)))
+        futures["audio"] = audio_future
+    elif force_audio:
+        audio_future = Future()
+
+        def _after_analysis(analysis_future):
+            try:
+                analysis = analysis_future.result()
+            except Exception:
+                analysis = None
+            audio_future.set_result(register_alert_audio(build_route_alert_message(ruta_km, False, analysis)))
+
+        futures["analisis"].add_done_callback(_after_analysis)
+        futures["audio"] = audio_future
+    return futures
+
+
+def collect_ai_results(futures):
+    """Resultados de las tareas terminadas (None si fallaron) y nombres de las pendientes."""
+    results, pending = {}, []
+    for name, future in futures.items():
+        if not future.done():
+            pending.append(name)
+            continue
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            logger.warning("Tarea de IA '%s' falló: %s", name, e)
+            results[name] = None
+    return results, pending
+
+
+def finish_route_ai(futures, payload, cache_key):
+    """
+    Trabajo "route-ai": espera el análisis y el audio pendientes de una ruta,
+    guarda la respuesta completa en la caché de rutas y la devuelve.
+    """
+    wait_futures(list(futures.values()))
+    results, _ = collect_ai_results(futures)
+    complete = dict(payload, analisis_ia_texto=results.get("analisis"), audio_alert_url=results.get("audio"))
+    route_cache.set(cache_key, (time.time(), complete))
+    return complete
+
+
+# Caché de respuestas de /api/optimize-route (recálculo, Gemini y audio incluidos).
+# Clave: coordenadas resueltas redondeadas (restricciones ordenadas) + opciones.
+ROUTE_CACHE_PRECISION = int(os.environ.get("ROUTE_CACHE_PRECISION", "4"))
+route_cache = TTLCache(
+    maxsize=int(os.environ.get("ROUTE_CACHE_SIZE", "256")),
+    ttl=float(os.environ.get("ROUTE_CACHE_TTL_S", "300")),
+)
+
+
+def route_cache_key(origen, destino, restricciones, **options):
+    """Clave canónica: el orden de las restricciones y ruido bajo ROUTE_CACHE_PRECISION no cuentan."""
+    def canon(point):
+        return (round(float(point[0]), ROUTE_CACHE_PRECISION), round(float(point[1]), ROUTE_CACHE_PRECISION))
+    return (canon(origen), canon(destino), tuple(sorted(canon(p) for p in restricciones)), tuple(sorted(options.items())))
+
+
+def compute_optimize_route(data, bypass_cache=False):
+    """
+    Cálculo completo de /api/optimize-route sin depender de la petición HTTP
+    (se usa tanto en el endpoint síncrono como en la cola de trabajos).
+    Devuelve (payload, cache_status, age_s); los errores de entrada o del
+    motor se señalan con JobError(mensaje, código HTTP).
+    """
     origen_list = data.get('origen')
     destino_list = data.get('destino')
     restricciones = data.get('restricciones', [])
-    def resolve_location(val):
-        try:
-            if isinstance(val, (list, tuple)) and len(val) == 2:
-                return [float(val[0]), float(val[1])]
-        except Exception:
-            pass
-        try:
-            if isinstance(val, dict) and 'lat' in val and 'lon' in val:
-                return [float(val['lat']), float(val['lon'])]
-        except Exception:
-            pass
-        if isinstance(val, str) and val.strip():
-            coords = call_geocode_address(val.strip())
-            if coords:
-                return [coords[0], coords[1]]
-        return None
     if DEV_MOCK:
         try:
             lat1, lon1 = float(origen_list[0]), float(origen_list[1])
             lat2, lon2 = float(destino_list[0]), float(destino_list[1])
         except Exception:
-            return jsonify({"error": "Formato inválido en origen/destino para modo mock."}), 400
+            raise JobError("Formato inválido en origen/destino para modo mock.", 400)
         mock_coords = [{"lat": lat1, "lon": lon1}, {"lat": (lat1+lat2)/2, "lon": (lon1+lon2)/2}, {"lat": lat2, "lon": lon2}]
         mock_km = round(random.uniform(30, 600))
-        return jsonify({"status": "success", "ruta_km": mock_km, "ruta_coordenadas": mock_coords, "is_critical_alert": (mock_km > 500 or len(restricciones) >= 3), "analisis_ia_texto": "Modo MOCK: análisis simulado.", "audio_alert_url": None, "analisis_simulacion": {"riesgo_alto": round(10 + len(restricciones) * 5 + mock_km / 100), "riesgo_exito": round(90 - len(restricciones) * 5 - mock_km / 100)}})
+        return {"status": "success", "ruta_km": mock_km, "ruta_coordenadas": mock_coords, "is_critical_alert": (mock_km > 500 or len(restricciones) >= 3), "analisis_ia_texto": "Modo MOCK: análisis simulado.", "audio_alert_url": None, "analisis_simulacion": {"riesgo_alto": round(10 + len(restricciones) * 5 + mock_km / 100), "riesgo_exito": round(90 - len(restricciones) * 5 - mock_km / 100)}}, None, None
+    engine = data.get('engine')
+    if engine is not None and (not isinstance(engine, str) or engine not in ROUTE_ENGINES):
+        raise JobError(f"Motor de optimización desconocido: {engine}. Opciones: {sorted(ROUTE_ENGINES)}", 400)
+    try:
+        time_budget_ms = float(data['time_budget_ms']) if data.get('time_budget_ms') is not None else None
+    except (TypeError, ValueError):
+        raise JobError("time_budget_ms debe ser numérico.", 400)
+    if time_budget_ms is not None:
+        # Sin límite (0) solo por configuración del servidor: un cliente no puede desactivar la cota de latencia
+        if not isfinite(time_budget_ms) or time_budget_ms <= 0:
+            raise JobError("time_budget_ms debe ser un número finito mayor que 0.", 400)
+        time_budget_ms = min(time_budget_ms, ROUTE_TIME_BUDGET_MS_MAX)
+    # ai_deadline_ms=0 devuelve la geometría de inmediato y deja IA y audio en un trabajo
     try:
-        def valid_coord(c):
+        ai_deadline_ms = float(data['ai_deadline_ms']) if data.get('ai_deadline_ms') is not None else None
+    except (TypeError, ValueError):
+        raise JobError("ai_deadline_ms debe ser numérico.", 400)
+    if ai_deadline_ms is None:
+        ai_deadline_s = AI_DEADLINE_S
+    else:
+        # Un cliente solo puede acortar la espera, nunca alargarla más allá de AI_DEADLINE_S
+        if not isfinite(ai_deadline_ms) or ai_deadline_ms < 0:
+            raise JobError("ai_deadline_ms debe ser un número finito mayor o igual que 0.", 400)
+        ai_deadline_s = min(ai_deadline_ms / 1000.0, AI_DEADLINE_S)
+    # Origen, destino y restricciones se resuelven en un solo lote concurrente
+    extra = list(restricciones) if isinstance(restricciones, (list, tuple)) else []
+    waypoints = resolve_waypoints([origen_list, destino_list] + extra)
+    origen_coords, destino_coords = waypoints[0], waypoints[1]
+    if not origen_coords or not destino_coords:
+        raise JobError("No se pudieron resolver 'origen' o 'destino' a coordenadas válidas. Pueden ser listas [lat, lon] o direcciones.", 400)
+    logger.info("Llamando al motor de optimización (optimize_route_wolfram)...")
+    resolved_restrictions = [rc for rc in waypoints[2:] if rc]
+    force_audio = bool(data.get('force_audio', False))
+    cache_key = route_cache_key(origen_coords, destino_coords, resolved_restrictions, n_restricciones=len(restricciones), force_audio=force_audio, engine=engine, time_budget_ms=time_budget_ms)
+    cached = None if bypass_cache else route_cache.get(cache_key)
+    if cached is not None:
+        stored_at, payload = cached
+        return payload, 'HIT', int(time.time() - stored_at)
+    wolfram_result = optimize_route_wolfram(origen_coords, destino_coords, resolved_restrictions, engine=engine, time_budget_ms=time_budget_ms)
+    if wolfram_result is None:
+        raise JobError("Motor de optimización no respondió. Contacte al Modelador.", 503)
+    ruta_km = 0
+    wolfram_result_dict = wolfram_result
+    if isinstance(wolfram_result_dict, dict):
+        if 'RutaTotalKM' in wolfram_result_dict:
             try:
-                return isinstance(c, (list, tuple)) and len(c) == 2 and all(isinstance(float(x), float) for x in c)
-            except Exception:
-                return False
-        origen_coords = resolve_location(origen_list)
-        destino_coords = resolve_location(destino_list)
-        if not origen_coords or not destino_coords:
-            return jsonify({"error": "No se pudieron resolver 'origen' o 'destino' a coordenadas válidas. Pueden ser listas [lat, lon] o direcciones."}), 400
-        logger.info("Llamando al motor de optimización (optimize_route_wolfram)...")
-        resolved_restrictions = []
-        if isinstance(restricciones, (list, tuple)):
-            for r in restricciones:
-                rc = resolve_location(r)
-                if rc:
-                    resolved_restrictions.append(rc)
-        wolfram_result = optimize_route_wolfram(origen_coords, destino_coords, resolved_restrictions)
-        if wolfram_result is None:
-            return jsonify({"error": "Motor de optimización no respondió. Contacte al Modelador."}), 503
-        ruta_km = 0
-        wolfram_result_dict = wolfram_result
-        if isinstance(wolfram_result_dict, dict):
-            if 'RutaTotalKM' in wolfram_result_dict:
+                ruta_km = float(wolfram_result_dict['RutaTotalKM'])
+            except (ValueError, TypeError):
+                ruta_km = 0
+    wolfram_coords = wolfram_result_dict.get('RutaOptimizada', [])
+    ruta_coordenadas_normalizadas = []
+    if isinstance(wolfram_coords, list):
+        for p in wolfram_coords:
+            if isinstance(p, (list, tuple)) and len(p) == 2:
                 try:
-                    ruta_km = float(wolfram_result_dict['RutaTotalKM'])
+                    ruta_coordenadas_normalizadas.append({"lat": float(p[0]), "lon": float(p[1])})
                 except (ValueError, TypeError):
-                    ruta_km = 0
-        wolfram_coords = wolfram_result_dict.get('RutaOptimizada', [])
-        ruta_coordenadas_normalizadas = []
-        if isinstance(wolfram_coords, list):
-            for p in wolfram_coords:
-                if isinstance(p, (list, tuple)) and len(p) == 2:
-                    try:
-                        ruta_coordenadas_normalizadas.append({"lat": float(p[0]), "lon": float(p[1])})
-                    except (ValueError, TypeError):
-                        logger.warning("Advertencia: Coordenadas de Wolfram no son numéricas.")
-                        pass
-        datos_para_gemini = {"RutaTotalKM": round(ruta_km, 2), "NumeroRestricciones": len(restricciones), "PuntoOrigen": origen_list, "PuntoDestino": destino_list, "RutaTienePuntosIntermedios": len(ruta_coordenadas_normalizadas) > 2}
-        wolfram_result_str = json.dumps(datos_para_gemini)
-        is_critical = (ruta_km > 500 or len(restricciones) >= 3)
-        gemini_analysis = call_gemini_analysis(wolfram_result_str)
-        audio_alert_url = None
-        audio_alert_data = None
-        force_audio = bool(data.get('force_audio', False))
-        should_generate_audio = is_critical or force_audio
-        if should_generate_audio:
-            if is_critical:
-                alert_message = f"ALERTA CRÍTICA: La ruta óptima excede los {int(ruta_km)} kilómetros y presenta alto riesgo. Verifique el análisis de Gemini."
-            else:
-                short_analysis = None
-                try:
-                    if isinstance(gemini_analysis, str) and len(gemini_analysis) > 0:
-                        short_analysis = gemini_analysis.split('\n')[0]
-                except Exception:
-                    short_analysis = None
-                if short_analysis:
-                    alert_message = f"ALERTA: Riesgo detectado en la ruta. Resumen: {short_analysis}"
-                else:
-                    alert_message = f"ALERTA: Riesgo detectado en la ruta. Revisa el informe de IA en pantalla."
-            logger.info("Generando audio de alerta (force_audio=%s, is_critical=%s)", force_audio, is_critical)
-            audio_alert_data = call_elevenlabs_alert(alert_message, save_to_file=False)
-        return jsonify({"status": "success", "ruta_km": int(ruta_km), "ruta_coordenadas": ruta_coordenadas_normalizadas, "is_critical_alert": is_critical, "analisis_ia_texto": gemini_analysis, "audio_alert_url": audio_alert_url, "audio_alert_data": audio_alert_data, "analisis_simulacion": {"riesgo_alto": round(10 + len(restricciones) * 5 + ruta_km / 100), "riesgo_exito": round(90 - len(restricciones) * 5 - ruta_km / 100)}})
+                    logger.warning("Advertencia: Coordenadas de Wolfram no son numéricas.")
+                    pass
+    datos_para_gemini = {"RutaTotalKM": round(ruta_km, 2), "NumeroRestricciones": len(restricciones), "PuntoOrigen": origen_list, "PuntoDestino": destino_list, "RutaTienePuntosIntermedios": len(ruta_coordenadas_normalizadas) > 2}
+    is_critical = (ruta_km > 500 or len(restricciones) >= 3)
+    if is_critical or force_audio:
+        logger.info("Generando audio de alerta (force_audio=%s, is_critical=%s)", force_audio, is_critical)
+    ai_futures = start_route_ai(datos_para_gemini, ruta_km, is_critical, force_audio)
+    wait_futures(list(ai_futures.values()), timeout=ai_deadline_s)
+    ai_results, ai_pending = collect_ai_results(ai_futures)
+    payload = {"status": "success", "ruta_km": int(ruta_km), "ruta_coordenadas": ruta_coordenadas_normalizadas, "is_critical_alert": is_critical, "analisis_ia_texto": ai_results.get("analisis"), "audio_alert_url": ai_results.get("audio"), "optimizer_stats": wolfram_result_dict.get('Estadisticas'), "analisis_simulacion": {"riesgo_alto": round(10 + len(restricciones) * 5 + ruta_km / 100), "riesgo_exito": round(90 - len(restricciones) * 5 - ruta_km / 100)}}
+    cache_status = 'BYPASS' if bypass_cache else 'MISS'
+    if not ai_pending:
+        route_cache.set(cache_key, (time.time(), payload))
+        return payload, cache_status, None
+    # Geometría ya disponible; análisis y audio siguen como trabajo de job_queue
+    # (/api/jobs/<id>), que al terminar deja la respuesta completa en la caché
+    try:
+        job = job_queue.submit("route-ai", finish_route_ai, ai_futures, payload, cache_key, lane="ai")
+    except JobQueueFull:
+        # Sin sitio en la cola: se espera aquí en lugar de perder el resultado
+        return finish_route_ai(ai_futures, payload, cache_key), cache_status, None
+    return dict(payload, ai_pending=ai_pending, job_id=job.id, status_url=f"/api/jobs/{job.id}"), cache_status, None
+
+
+@app.route('/api/optimize-route', methods=['POST'])
+def optimize_route():
+    data = request.json or {}
+    # Cache-Control: no-cache en la petición fuerza el recálculo
+    bypass_cache = 'no-cache' in (request.headers.get('Cache-Control') or '')
+    try:
+        payload, cache_status, age = compute_optimize_route(data, bypass_cache)
+    except JobError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         logger.exception("Error en el endpoint optimize-route: %s", e)
         return jsonify({"error": f"Error interno del servidor: {e}"}), 500
+    response = jsonify(payload)
+    if cache_status:
+        response.headers['X-Route-Cache'] = cache_status
+    if age is not None:
+        response.headers['Age'] = str(age)
+    return response
+
+
+@app.route('/api/audio/<token>', methods=['GET'])
+def stream_alert_audio(token):
+    """
+    MP3 de una alerta registrada con register_alert_audio. Si no está en la
+    caché TTS se reenvían los fragmentos de ElevenLabs según llegan y, al
+    terminar, el audio completo entra en la caché. Una sola síntesis por
+    clave: los demás clientes que la piden a la vez esperan a que termine y
+    reciben el MP3 de la caché.
+    """
+    cached = tts_cache.get(token)
+    if cached is not None:
+        return Response(cached, mimetype='audio/mpeg', headers={"Cache-Control": "public, max-age=86400"})
+    message = audio_streams.get(token)
+    if message is None:
+        return jsonify({"error": "Audio desconocido o expirado."}), 404
+    if not ELEVENLABS_CLIENT:
+        return jsonify({"error": "Cliente ElevenLabs no inicializado."}), 503
+    inflight = tts_cache.begin_synthesis(token)
+    if inflight is not None:
+        inflight.wait(AUDIO_STREAM_WAIT_S)
+        data = tts_cache.get(token)
+        if data is None:
+            return jsonify({"error": "No se pudo generar el audio."}), 502
+        return Response(data, mimetype='audio/mpeg', headers={"Cache-Control": "public, max-age=86400"})
+    chunks = _tts_chunks(message)
+    try:
+        # El primer fragmento se pide antes de responder: si la síntesis falla
+        # todavía se puede devolver un error en lugar de un MP3 truncado
+        first = next(chunks, b"")
+    except Exception as e:
+        tts_cache.end_synthesis(token)
+        logger.error("Error al generar audio con ElevenLabs: %s", e)
+        return jsonify({"error": "No se pudo generar el audio."}), 502
+    parts = [first]
+    state = {"complete": False, "finished": False}
+
+    def finish():
+        # Al terminar o al cerrarse la respuesta (cliente desconectado): la
+        # síntesis ya se está pagando, así que se completa para la caché y
+        # para los clientes que esperan
+        if state["finished"]:
+            return
+        state["finished"] = True
+        if not state["complete"]:
+            try:
+                parts.extend(chunks)
+                state["complete"] = True
+            except Exception as e:
+                logger.error("Audio %s interrumpido: %s", token, e)
+        tts_cache.end_synthesis(token, b"".join(parts) if state["complete"] else None)
+
+    def generate():
+        yield first
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            logger.error("Audio %s interrumpido: %s", token, e)
+            state["finished"] = True
+            tts_cache.end_synthesis(token)
+            return
+        state["complete"] = True
+        finish()
+
+    response = Response(stream_with_context(generate()), mimetype='audio/mpeg', headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(finish)
+    return response
 
 
 @app.route('/health', methods=['GET'])
@@ -716,17 +1131,226 @@ def health():
 # 6. NUEVOS ENDPOINTS PARA OPTI-RUTA SKY (OpenSky Monitoring)
 # ===================================================================
 
+def _requested_fields(fmt):
+    """Campos pedidos con ?fields=all|compact|a,b,c (por defecto: todos en json, compactos en columns)."""
+    value = (request.args.get('fields') or ('compact' if fmt == 'columns' else 'all')).strip()
+    if value == 'all':
+        return None
+    if value == 'compact':
+        return COMPACT_FIELDS
+    return tuple(f.strip() for f in value.split(',') if f.strip())
+
+
 @app.route('/api/vuelos', methods=['GET'])
 def get_vuelos():
+    """
+    Vuelos del snapshot vigente.
+
+    - since=<cursor>: el "cursor" ("<epoch>.<versión>") de una respuesta
+      anterior. Si es de esta instancia y la versión sigue retenida, solo el
+      delta (added / changed / removed, como en /api/stream) con "delta":
+      true; si no (versión descartada, reinicio u otro worker), la lista
+      completa con "delta": false.
+    - format=columns: vuelos como columnas en lugar de una lista de dicts.
+    - fields=all|compact|a,b,c: proyección de campos.
+    - ETag por instancia, versión y representación: If-None-Match devuelve 304 sin cuerpo.
+    """
     try:
-        flight_monitor.fetch_opensky_data()
-        conflicts, alerts = flight_monitor.detect_conflicts()
-        return jsonify({"status": "ok", "vuelos": flight_monitor.flights, "conflictos": conflicts, "alerts": alerts, "total_vuelos": len(flight_monitor.flights), "total_conflictos": len(conflicts)})
+        snapshot = get_flight_snapshot()
+        fmt = request.args.get('format', 'json')
+        if fmt not in ('json', 'columns'):
+            return jsonify({"error": "format debe ser 'json' o 'columns'."}), 400
+        fields = _requested_fields(fmt)
+        since = flight_poller.parse_cursor(request.args.get('since'))
+        etag = f"{flight_poller.cursor(snapshot.version)}-{fmt}-{request.args.get('fields', '')}-{since if since is not None else ''}"
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        def encode(flights):
+            return to_columns(flights, fields) if fmt == 'columns' else select_fields(flights, fields)
+
+        base = since is not None and flight_poller.get_version(since)
+        if base and since <= snapshot.version:
+            delta = diff_snapshots(base, snapshot)
+            if fields is not None:
+                delta["changed"] = [{k: v for k, v in c.items() if k == "key" or k in fields} for c in delta["changed"]]
+                delta["changed"] = [c for c in delta["changed"] if len(c) > 1]
+            delta["added"] = encode(delta["added"])
+            alerts = [e["alert"] for e in alert_log.since(0) if (e["version"] or 0) > since]
+            payload = {"status": "ok", "delta": True, "format": fmt, **delta, "cursor": flight_poller.cursor(delta["version"]), "alerts": alerts, "total_conflictos": len(snapshot.conflicts)}
+        else:
+            payload = {"status": "ok", "delta": False, "format": fmt, "version": snapshot.version, "cursor": flight_poller.cursor(snapshot.version), "timestamp": snapshot.timestamp, "vuelos": encode(snapshot.flights), "conflictos": list(snapshot.conflicts), "alerts": list(snapshot.alerts), "total_vuelos": len(snapshot.flights), "total_conflictos": len(snapshot.conflicts)}
+        response = jsonify(payload)
+        response.set_etag(etag)
+        # Los navegadores revalidan con If-None-Match en cada poll
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         logger.error(f"Error en endpoint vuelos: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+# Stream SSE: segundos entre heartbeats y duración máxima de una conexión
+# (el navegador reconecta solo con EventSource; así los workers se reciclan)
+SSE_HEARTBEAT_S = float(os.environ.get("SSE_HEARTBEAT_S", "15"))
+SSE_MAX_STREAM_S = float(os.environ.get("SSE_MAX_STREAM_S", "300"))
+# Cada stream ocupa un hilo del worker durante SSE_MAX_STREAM_S: por encima de
+# SSE_MAX_STREAMS se responde 503 y el navegador pasa a polling (la mitad de
+# GUNICORN_THREADS por defecto, para dejar hilos al resto de peticiones)
+SSE_MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", str(max(int(os.environ.get("GUNICORN_THREADS", "16")) // 2, 1))))
+SSE_RETRY_AFTER_S = int(os.environ.get("SSE_RETRY_AFTER_S", "60"))
+_sse_lock = Lock()
+sse_streams = {"active": 0, "max": SSE_MAX_STREAMS, "opened": 0, "rejected": 0}
+
+
+def _sse_acquire():
+    with _sse_lock:
+        if sse_streams["active"] >= SSE_MAX_STREAMS:
+            sse_streams["rejected"] += 1
+            return False
+        sse_streams["active"] += 1
+        sse_streams["opened"] += 1
+        return True
+
+
+def _sse_releaser():
+    """Función que libera el hueco de un stream una sola vez (al cerrar la respuesta o si falla la apertura)."""
+    released = [False]
+
+    def release():
+        with _sse_lock:
+            if not released[0]:
+                released[0] = True
+                sse_streams["active"] -= 1
+    return release
+
+
+def _json_default(value):
+    # Escalares NumPy u otros objetos que json no conoce
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _sse_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_json_default))
+    return "\n".join(lines) + "\n\n"
+
+
+def _parse_int(value, default=None):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+@app.route('/api/stream', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events con vuelos y alertas. Al conectar envía un evento
+    'snapshot' completo; después 'delta' por cada snapshot nuevo (solo vuelos
+    añadidos, campos cambiados y claves eliminadas) y 'alert' por cada alerta
+    de la bitácora, y 'job' por cada cambio de estado de la cola de trabajos.
+    El id de evento es "<cursor>:<alert_id>:<job_event_id>" (cursor =
+    "<epoch>.<versión>"); al reconectar con Last-Event-ID solo se reenvían
+    las alertas y eventos de trabajos posteriores y, si esa versión sigue
+    retenida, un delta en lugar del snapshot completo. Un id de otra
+    instancia (reinicio u otro worker) se trata como una conexión nueva.
+    """
+    if not _sse_acquire():
+        response = jsonify({"error": "Demasiados streams abiertos; use /api/vuelos y /api/alerts-poll.", "fallback": ["/api/vuelos", "/api/alerts-poll"]})
+        response.headers['Retry-After'] = str(SSE_RETRY_AFTER_S)
+        return response, 503
+    release = _sse_releaser()
+    try:
+        return _open_event_stream(release)
+    except Exception:
+        release()
+        raise
+
+
+def _open_event_stream(release):
+    snapshot = get_flight_snapshot()
+    resume = (request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or '').split(':')
+    resume_version = flight_poller.parse_cursor(resume[0])
+    if resume_version is None:
+        # Los ids de alertas y trabajos también son de la otra instancia
+        resume = []
+    last_alert_id = _parse_int(resume[1] if len(resume) > 1 else None, alert_log.last_id)
+    last_alert_id = min(last_alert_id, alert_log.last_id)
+    last_job_id = _parse_int(resume[2] if len(resume) > 2 else None, job_events.last_id)
+    last_job_id = min(last_job_id, job_events.last_id)
+    resume_base = flight_poller.get_version(resume_version) if resume_version is not None else None
+
+    def generate():
+        nonlocal last_alert_id, last_job_id
+        current = snapshot
+        started = time.monotonic()
+
+        def event_id():
+            return f"{flight_poller.cursor(current.version)}:{last_alert_id}:{last_job_id}"
+
+        yield f"retry: 3000\n\n"
+        if resume_base is not None and resume_base.version <= current.version:
+            # Reconexión con una versión retenida: basta el delta
+            yield _sse_event("delta", dict(diff_snapshots(resume_base, current), cursor=flight_poller.cursor(current.version)), event_id())
+        else:
+            yield _sse_event("snapshot", {"version": current.version, "cursor": flight_poller.cursor(current.version), "epoch": flight_poller.epoch, "timestamp": current.timestamp, "vuelos": list(current.flights), "conflictos": list(current.conflicts), "total_vuelos": len(current.flights)}, event_id())
+        while time.monotonic() - started < SSE_MAX_STREAM_S:
+            version = current.version
+            seen_alert, seen_job = last_alert_id, last_job_id
+            flight_poller.wait_for(lambda: flight_poller.current().version > version or alert_log.last_id > seen_alert or job_events.last_id > seen_job, timeout=SSE_HEARTBEAT_S)
+            if flight_poller.stopped:
+                break
+            latest = flight_poller.current()
+            sent = False
+            if latest.version > current.version:
+                delta = dict(diff_snapshots(current, latest), cursor=flight_poller.cursor(latest.version))
+                current = latest
+                yield _sse_event("delta", delta, event_id())
+                sent = True
+            for entry in alert_log.since(last_alert_id):
+                last_alert_id = entry["id"]
+                yield _sse_event("alert", entry, event_id())
+                sent = True
+            for entry in job_events.since(last_job_id):
+                last_job_id = entry["id"]
+                yield _sse_event("job", entry, event_id())
+                sent = True
+            if not sent:
+                yield ": keep-alive\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+    response.call_on_close(release)
+    return response
+
+
+@app.route('/api/alerts-poll', methods=['GET'])
+def alerts_poll():
+    """
+    Alternativa sin streaming: alertas con id > since_id. Sin since_id, o si
+    epoch no es el de esta instancia (los ids vuelven a empezar tras un
+    reinicio), solo devuelve el último id y el epoch vigente.
+    """
+    try:
+        get_flight_snapshot()
+        since_id = _parse_int(request.args.get('since_id'))
+        if request.args.get('epoch', flight_poller.epoch) != flight_poller.epoch:
+            since_id = None
+        alerts = alert_log.since(since_id) if since_id is not None else []
+        return jsonify({"status": "ok", "alerts": alerts, "last_id": alert_log.last_id, "epoch": flight_poller.epoch})
+    except Exception as e:
+        logger.error(f"Error en alerts-poll: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/conflict-analysis', methods=['POST'])
 def analyze_conflict():
     try:
@@ -744,55 +1368,231 @@ def analyze_conflict():
         return jsonify({"error": str(e)}), 500
 
 
+def compute_emergency_route(data):
+    """Cálculo de /api/emergency-route (síncrono o como trabajo del carril de emergencia)."""
+    flight_position = data.get('flight_position')
+    destination = data.get('destination')
+    restricted_zones = data.get('restricted_zones', [])
+    if not flight_position or not destination:
+        raise JobError("flight_position y destination requeridos", 400)
+    extra = list(restricted_zones) if isinstance(restricted_zones, (list, tuple)) else []
+    waypoints = resolve_waypoints([flight_position, destination] + extra)
+    fp_coords, dst_coords = waypoints[0], waypoints[1]
+    if not fp_coords or not dst_coords:
+        raise JobError("No se pudieron resolver flight_position o destination a coordenadas válidas.", 400)
+    resolved_restrictions = [rc for rc in waypoints[2:] if rc]
+    result = optimize_route_wolfram(fp_coords, dst_coords, resolved_restrictions)
+    if result is None:
+        raise JobError("No se pudo calcular ruta de emergencia", 503)
+    alert_msg = f"Ruta de emergencia calculada: {result['RutaTotalKM']} kilómetros. Siga las coordenadas en pantalla."
+    return {"status": "success", "emergency_route": result['RutaOptimizada'], "total_km": result['RutaTotalKM'], "audio_alert": None, "audio_alert_url": register_alert_audio(alert_msg), "optimizer_stats": result.get('Estadisticas'), "timestamp": str(__import__('datetime').datetime.now())}
+
+
 @app.route('/api/emergency-route', methods=['POST'])
 def emergency_route():
     try:
-        data = request.json or {}
-        flight_position = data.get('flight_position')
-        destination = data.get('destination')
-        restricted_zones = data.get('restricted_zones', [])
-        if not flight_position or not destination:
-            return jsonify({"error": "flight_position y destination requeridos"}), 400
-        def _resolve(val):
-            try:
-                if isinstance(val, (list, tuple)) and len(val) == 2:
-                    return [float(val[0]), float(val[1])]
-            except Exception:
-                pass
-            if isinstance(val, str):
-                coords = call_geocode_address(val)
-                if coords:
-                    return [coords[0], coords[1]]
-            return None
-        fp_coords = _resolve(flight_position)
-        dst_coords = _resolve(destination)
-        if not fp_coords or not dst_coords:
-            return jsonify({"error": "No se pudieron resolver flight_position o destination a coordenadas válidas."}), 400
-        resolved_restrictions = []
-        if isinstance(restricted_zones, (list, tuple)):
-            for r in restricted_zones:
-                rc = _resolve(r)
-                if rc:
-                    resolved_restrictions.append(rc)
-        result = optimize_route_wolfram(fp_coords, dst_coords, resolved_restrictions)
-        if result is None:
-            return jsonify({"error": "No se pudo calcular ruta de emergencia"}), 503
-        alert_msg = f"Ruta de emergencia calculada: {result['RutaTotalKM']} kilómetros. Siga las coordenadas en pantalla."
-        audio_data = call_elevenlabs_alert(alert_msg, save_to_file=False)
-        return jsonify({"status": "success", "emergency_route": result['RutaOptimizada'], "total_km": result['RutaTotalKM'], "audio_alert": None, "audio_alert_data": audio_data, "timestamp": str(__import__('datetime').datetime.now())})
+        return jsonify(compute_emergency_route(request.json or {}))
+    except JobError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         logger.error(f"Error en emergency-route: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+# -----------------------------
+# Cola de trabajos para cálculos lentos: carril "emergency" con hilos propios
+# para que una ráfaga de rutas normales no retrase una emergencia.
+# -----------------------------
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_EMERGENCY_WORKERS = int(os.environ.get("JOB_EMERGENCY_WORKERS", "2"))
+job_events = EventLog(int(os.environ.get("JOB_EVENT_LOG_SIZE", "500")), on_append=flight_poller.notify)
+job_queue = JobQueue(
+    # "ai": análisis y audio de rutas que no terminaron antes de AI_DEADLINE_S
+    lanes={"emergency": JOB_EMERGENCY_WORKERS, "normal": JOB_WORKERS, "ai": AI_WORKERS},
+    max_queue=int(os.environ.get("JOB_MAX_QUEUE", "100")),
+    retention_s=float(os.environ.get("JOB_RETENTION_S", "600")),
+    max_retained=int(os.environ.get("JOB_MAX_RETAINED", "500")),
+    on_event=lambda job: job_events.publish(job=job.summary()),
+)
+
+
+def _job_route_optimize(data):
+    # El resultado trae la geometría en cuanto está; IA y audio pendientes
+    # siguen como trabajo "route-ai" (status_url), igual que en el endpoint síncrono
+    payload, _, _ = compute_optimize_route(data)
+    return payload
+
+
+JOB_KINDS = {
+    "optimize-route": (_job_route_optimize, "normal"),
+    "emergency-route": (compute_emergency_route, "emergency"),
+}
+
+
+def _job_response(job, status_code=200):
+    body = {"job": job.summary(), "status_url": f"/api/jobs/{job.id}"}
+    if job.status == "done":
+        body["result"] = job.result
+    elif job.status == "error":
+        body["error_status"] = job.error_status
+    return jsonify(body), status_code
+
+
+@app.route('/api/jobs/<kind>', methods=['POST'])
+def submit_job(kind):
+    """Encola optimize-route o emergency-route; responde 202 con el id del trabajo."""
+    if kind not in JOB_KINDS:
+        return jsonify({"error": f"Tipo de trabajo desconocido: {kind}. Opciones: {sorted(JOB_KINDS)}"}), 404
+    fn, lane = JOB_KINDS[kind]
+    try:
+        job = job_queue.submit(kind, fn, dict(request.json or {}), lane=lane)
+    except JobQueueFull as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    return _job_response(job, 202)
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Estado y resultado de un trabajo; ?wait=<s> espera hasta 30 s a que termine."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo desconocido o expirado."}), 404
+    try:
+        wait_s = min(max(float(request.args.get('wait', 0)), 0.0), 30.0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "wait debe ser numérico."}), 400
+    if wait_s:
+        job.wait(wait_s)
+    return _job_response(job)
+
+
+@app.route('/api/jobs', methods=['GET'])
+def get_jobs_stats():
+    return jsonify({"status": "ok", **job_queue.stats()})
+
+
+# Histórico escrito por collector.py (misma base por defecto); aquí solo se lee
+HISTORY_DB = os.environ.get("HISTORY_DB", str(Path(__file__).resolve().parent / 'data' / 'history.sqlite3'))
+HISTORY_TRACK_MAX_S = float(os.environ.get("HISTORY_TRACK_MAX_S", str(7 * 86400)))
+HISTORY_REPLAY_MAX_S = float(os.environ.get("HISTORY_REPLAY_MAX_S", str(6 * 3600)))
+HISTORY_SIMPLIFY_M = float(os.environ.get("HISTORY_SIMPLIFY_M", "50"))
+try:
+    history_store = HistoryStore(HISTORY_DB) if HISTORY_DB else None
+except Exception as e:
+    logger.warning(f"Histórico no disponible en {HISTORY_DB}: {e}")
+    history_store = None
+
+
+def _history_time(name, default):
+    """Parámetro de tiempo en epoch (s) o ISO 8601 (UTC si no trae zona)."""
+    value = (request.args.get(name) or '').strip()
+    if not value:
+        return default
+    try:
+        ts = float(value)
+    except ValueError:
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"{name} debe ser epoch en segundos o fecha ISO 8601.")
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        ts = parsed.timestamp()
+    # nan/inf pasarían las comparaciones de rango y fallarían ya en pleno streaming
+    if not isfinite(ts):
+        raise ValueError(f"{name} debe ser un instante finito.")
+    return ts
+
+
+def _history_range(max_span_s, default_span_s):
+    """(desde, hasta) de ?from=&to=, limitado a max_span_s. Lanza ValueError si no es válido."""
+    end = _history_time('to', time.time())
+    start = _history_time('from', end - default_span_s)
+    if start > end:
+        raise ValueError("from debe ser anterior a to.")
+    if end - start > max_span_s:
+        raise ValueError(f"El rango máximo es de {int(max_span_s)} s.")
+    return start, end
+
+
+def _simplify_tolerance_km():
+    value = request.args.get('tolerance_m')
+    tolerance_m = HISTORY_SIMPLIFY_M if value in (None, '') else float(value)
+    if not isfinite(tolerance_m):
+        raise ValueError("tolerance_m debe ser finito.")
+    return max(tolerance_m, 0.0) / 1000.0
+
+
+def _track_lines(rows, tolerance_km):
+    """
+    Agrupa filas ordenadas por aeronave y tiempo y genera una línea NDJSON por
+    trayectoria, simplificada con Douglas–Peucker. Solo una trayectoria está
+    en memoria a la vez.
+    """
+    for icao24, group in groupby(rows, key=itemgetter(1)):
+        group = list(group)
+        lats = [r[4] for r in group]
+        lons = [r[5] for r in group]
+        keep = simplify_track(lats, lons, tolerance_km)
+        last = group[-1]
+        points = [[group[i][0], round(lats[i], 5), round(lons[i], 5), group[i][6]] for i in keep.tolist()]
+        yield json.dumps({"icao24": icao24, "callsign": last[2], "tipo": last[9], "n_raw": len(group), "points": points},
+                         separators=(',', ':')) + "\n"
+
+
+def _ndjson_response(lines):
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/api/tracks/<icao24>', methods=['GET'])
+def get_track(icao24):
+    """
+    Trayectoria de una aeronave desde el histórico local (?from=&to=, por
+    defecto las últimas 24 h; ?tolerance_m= para la simplificación).
+    """
+    if history_store is None:
+        return jsonify({"error": "Histórico no disponible."}), 503
+    try:
+        start, end = _history_range(HISTORY_TRACK_MAX_S, 86400)
+        tolerance_km = _simplify_tolerance_km()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = history_store.query(start, end, icao24=icao24)
+    return _ndjson_response(_track_lines(rows, tolerance_km))
+
+
+@app.route('/api/replay', methods=['GET'])
+def get_replay():
+    """
+    Trayectorias de todas las aeronaves en ?from=&to= (por defecto la última
+    hora), opcionalmente dentro de ?bbox=lat_min,lon_min,lat_max,lon_max.
+    Una línea NDJSON por aeronave y día UTC.
+    """
+    if history_store is None:
+        return jsonify({"error": "Histórico no disponible."}), 503
+    try:
+        start, end = _history_range(HISTORY_REPLAY_MAX_S, 3600)
+        tolerance_km = _simplify_tolerance_km()
+        bbox = None
+        if request.args.get('bbox'):
+            bbox = tuple(float(v) for v in request.args['bbox'].split(','))
+            if len(bbox) != 4 or not all(isfinite(v) for v in bbox):
+                raise ValueError("bbox debe ser lat_min,lon_min,lat_max,lon_max.")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = history_store.query(start, end, bbox=bbox, by_aircraft=True)
+    return _ndjson_response(_track_lines(rows, tolerance_km))
+
+
 @app.route('/api/statistics', methods=['GET'])
 def get_statistics():
     try:
-        total_flights = len(flight_monitor.flights)
-        cargo_flights = len([f for f in flight_monitor.flights if f['type'] == 'carga'])
-        passenger_flights = total_flights - cargo_flights
-        avg_alt = sum(f['alt'] for f in flight_monitor.flights if f.get('alt') is not None) / total_flights if total_flights > 0 else 0
-        return jsonify({"status": "ok", "total_flights": total_flights, "cargo_flights": cargo_flights, "passenger_flights": passenger_flights, "average_altitude": round(avg_alt, 0), "conflict_zones": len(flight_monitor.conflict_zones), "active_monitoring": True})
+        # Resumen precalculado al publicar el snapshot: sin recorrer la lista por petición
+        snapshot = get_flight_snapshot()
+        return jsonify({"status": "ok", **snapshot.stats, "version": snapshot.version, "conflict_zones": len(flight_monitor.conflict_zones), "active_monitoring": True, "poller": flight_poller.stats(), "conflict_registry": flight_monitor.known_conflicts.stats(), "http": http_client.stats(), "geocode_cache": geocode_cache.stats(), "nominatim_limiter": nominatim_limiter.stats(), "route_cache": route_cache.stats(), "tts_cache": tts_cache.stats(), "classification_cache": classification_cache.stats(), "classification_queue": classification_queue.stats(), "jobs": job_queue.stats(), "sse": dict(sse_streams)})
     except Exception as e:
         logger.error(f"Error en statistics: {e}")
         return jsonify({"error": str(e)}), 500
@@ -802,22 +1602,15 @@ def get_statistics():
 # 7. NUEVAS FUNCIONES PARA CLASIFICACIÓN Y VALIDACIÓN DE VUELOS
 # ===================================================================
 
-# Cargar el mapping de operadores
-_operator_mapping = None
+# Mapping de operadores compilado en un trie; se recarga si cambia el archivo
+operator_mapping = OperatorMapping(
+    Path(__file__).resolve().parent / 'data' / 'operator_mapping.json',
+    reload_interval_s=float(os.environ.get("OPERATOR_MAPPING_RELOAD_S", "5")),
+)
+
+
 def load_operator_mapping():
-    global _operator_mapping
-    if _operator_mapping is None:
-        try:
-            import json
-            from pathlib import Path
-            mapping_path = Path(__file__).resolve().parent / 'data' / 'operator_mapping.json'
-            with open(mapping_path, 'r') as f:
-                _operator_mapping = json.load(f)
-            logger.info("Operator mapping cargado correctamente")
-        except Exception as e:
-            logger.warning(f"Error al cargar operator_mapping.json: {e}")
-            _operator_mapping = {"cargo_prefixes": [], "commercial_prefixes": []}
-    return _operator_mapping
+    return operator_mapping.mapping
 
 
 def obtener_token():
@@ -830,31 +1623,12 @@ def classify_flight(callsign):
     Clasifica un vuelo basado en su callsign.
     Retorna: 'carga', 'comercial', o 'desconocido'
     """
-    if not callsign or not isinstance(callsign, str):
-        return "desconocido"
-    
-    callsign_upper = callsign.strip().upper()
-    if not callsign_upper:
-        return "desconocido"
-    
-    # Cargar el mapping
-    mapping = load_operator_mapping()
-    
-    # Verificar prefijos de carga
-    cargo_prefixes = mapping.get("cargo_prefixes", [])
-    for prefix in cargo_prefixes:
-        if callsign_upper.startswith(prefix.upper()):
-            return "carga"
-    
-    # Verificar prefijos comerciales
-    commercial_prefixes = mapping.get("commercial_prefixes", [])
-    for prefix in commercial_prefixes:
-        if callsign_upper.startswith(prefix.upper()):
-            return "comercial"
-    
-    # Por defecto, si no se encuentra, considerarlo comercial
-    # (la mayoría de vuelos desconocidos son comerciales)
-    return "comercial"
+    return operator_mapping.classify(callsign)
+
+
+def classify_flights(callsigns):
+    """Versión por lotes de classify_flight (un solo acceso al matcher para toda la lista)."""
+    return operator_mapping.classify_many(callsigns)
 
 
 def validate_and_enrich_flight_with_gemini(flight_data):
@@ -862,6 +1636,7 @@ def validate_and_enrich_flight_with_gemini(flight_data):
     Usa Gemini API para validar y enriquecer la información de un vuelo.
     Verifica que la clasificación sea correcta y añade información contextual.
     """
+    flight_data = dict(flight_data)
     try:
         # Primero clasificar con el método tradicional
         basic_type = classify_flight(flight_data.get('callsign'))
@@ -933,34 +1708,45 @@ IMPORTANTE: Responde SOLO con JSON válido, sin texto adicional."""
     return flight_data
 
 
-def validate_flights_batch_with_gemini(flights):
+# Veredictos de Gemini por icao24 y por prefijo de operador: solo las
+# aeronaves no vistas se envían a Gemini, en lotes de GEMINI_CLASSIFY_BATCH.
+CLASSIFY_CACHE_DB = os.environ.get("CLASSIFY_CACHE_DB", str(Path(__file__).resolve().parent / 'data' / 'classification_cache.sqlite3'))
+classification_cache = ClassificationCache(
+    db_path=CLASSIFY_CACHE_DB or None,
+    ttl=float(os.environ.get("CLASSIFY_CACHE_TTL_S", str(7 * 86400))),
+    low_confidence_ttl=float(os.environ.get("CLASSIFY_LOW_CONFIDENCE_TTL_S", "3600")),
+    prefix_min_confidence=float(os.environ.get("CLASSIFY_PREFIX_MIN_CONFIDENCE", "0.8")),
+    unresolved_ttl=float(os.environ.get("CLASSIFY_UNRESOLVED_TTL_S", "900")),
+)
+GEMINI_CLASSIFY_BATCH = int(os.environ.get("GEMINI_CLASSIFY_BATCH", "20"))
+# Tope de lotes por refresco; los vuelos restantes se clasifican en los siguientes
+GEMINI_CLASSIFY_MAX_BATCHES = int(os.environ.get("GEMINI_CLASSIFY_MAX_BATCHES", "5"))
+
+
+def _apply_verdict(flight, verdict, verified=True):
+    flight['type'] = verdict.get('type') or classify_flight(flight.get('callsign'))
+    flight['verified'] = verified
+    flight['confidence'] = verdict.get('confidence', 0.5)
+    flight['operator_name'] = verdict.get('operator_name') or 'Desconocido'
+
+
+def gemini_classify_batch(batch, api_key):
     """
-    Valida múltiples vuelos en batch usando Gemini para mejor rendimiento.
+    Clasifica un lote de vuelos con Gemini. Devuelve [{"index", "type",
+    "confidence", "operator_name"}] con índices relativos al lote, o None si
+    la respuesta no trae JSON válido.
     """
-    if not flights:
-        return []
-    
-    try:
-        GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
-        if not GOOGLE_API_KEY:
-            # Sin Gemini, clasificar todos con método básico
-            for flight in flights:
-                flight['type'] = classify_flight(flight.get('callsign'))
-                flight['verified'] = False
-            return flights
-        
-        # Preparar resumen de vuelos para análisis en batch
-        flight_summary = []
-        for i, flight in enumerate(flights[:20]):  # Limitar a 20 vuelos por batch
-            flight_summary.append({
-                'index': i,
-                'callsign': flight.get('callsign', 'N/A'),
-                'origin_country': flight.get('origin_country', 'N/A'),
-                'alt': flight.get('alt', 'N/A'),
-                'velocity': flight.get('velocity', 'N/A')
-            })
-        
-        prompt = f"""Eres un experto en aviación. Clasifica estos vuelos como "carga" o "comercial":
+    flight_summary = []
+    for i, flight in enumerate(batch):
+        flight_summary.append({
+            'index': i,
+            'callsign': flight.get('callsign', 'N/A'),
+            'origin_country': flight.get('origin_country', 'N/A'),
+            'alt': flight.get('alt', 'N/A'),
+            'velocity': flight.get('velocity', 'N/A')
+        })
+
+    prompt = f"""Eres un experto en aviación. Clasifica estos vuelos como "carga" o "comercial":
 
 {json.dumps(flight_summary, indent=2)}
 
@@ -968,47 +1754,133 @@ Responde en formato JSON: {{"flights": [{{"index": 0, "type": "carga" o "comerci
 
 IMPORTANTE: Responde SOLO con JSON válido."""
 
+    genai.configure(api_key=api_key)
+    model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    response = model.generate_content(prompt)
+
+    # Parsear respuesta
+    response_text = response.text.strip()
+    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    if not json_match:
+        return None
+    return json.loads(json_match.group()).get('flights', [])
+
+
+def apply_cached_classifications(flights):
+    """
+    Copia los vuelos aplicando los veredictos cacheados (por icao24 u
+    operador) o, sin veredicto, la clasificación básica por callsign con
+    verified=False. Devuelve (vuelos, {clave: [vuelos sin veredicto]}).
+    """
+    # Trabajar sobre copias: los registros de entrada pueden estar publicados (FrozenFlight)
+    flights = [dict(f) for f in flights]
+    unseen = {}
+    for flight in flights:
+        verdict = classification_cache.lookup(flight.get('icao24'), flight.get('callsign'))
+        if verdict is not None and verdict['type'] is None:
+            # Gemini ya la recibió sin dar veredicto: no se reenvía hasta que caduque
+            flight['type'] = classify_flight(flight.get('callsign'))
+            flight['verified'] = False
+            continue
+        if verdict is not None:
+            _apply_verdict(flight, verdict)
+            flight['verification_source'] = verdict['source']
+            continue
+        flight['type'] = classify_flight(flight.get('callsign'))
+        flight['verified'] = False
+        # Una sola consulta por aeronave aunque aparezca repetida
+        unseen.setdefault(flight.get('icao24') or flight.get('callsign'), []).append(flight)
+    return flights, unseen
+
+
+def store_gemini_verdicts(batch, gemini_flights):
+    """
+    Guarda en la caché los veredictos de un lote; devuelve {índice: veredicto}.
+    Los vuelos sin veredicto (omitidos o respuesta None) quedan como sin
+    resolver durante CLASSIFY_UNRESOLVED_TTL_S.
+    """
+    verdicts = {}
+    for gemini_flight in gemini_flights or []:
+        idx = gemini_flight.get('index')
+        if not isinstance(idx, int) or not 0 <= idx < len(batch) or idx in verdicts:
+            continue
+        verdict = {"type": gemini_flight.get('type', 'desconocido'), "confidence": gemini_flight.get('confidence', 0.5), "operator_name": gemini_flight.get('operator_name', 'Desconocido')}
+        classification_cache.store(batch[idx].get('icao24'), batch[idx].get('callsign'), verdict['type'], verdict['confidence'], verdict['operator_name'])
+        verdicts[idx] = verdict
+    for idx, flight in enumerate(batch):
+        if idx not in verdicts:
+            classification_cache.store_unresolved(flight.get('icao24'))
+    return verdicts
+
+
+def validate_flights_batch_with_gemini(flights):
+    """
+    Valida múltiples vuelos usando Gemini de forma síncrona. Los veredictos ya
+    cacheados (por icao24 o por operador) se reaplican sin llamar a Gemini; el
+    resto se envía en lotes y su resultado entra en la caché. Sin veredicto,
+    queda la clasificación básica por callsign con verified=False.
+    El refresco de vuelos usa enrich_flights() (no bloqueante) en su lugar.
+    """
+    if not flights:
+        return []
+    flights, unseen = apply_cached_classifications(flights)
+    GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+    if not unseen or not GOOGLE_API_KEY:
+        return flights
+
+    pending = list(unseen.values())
+    batches = [pending[i:i + GEMINI_CLASSIFY_BATCH] for i in range(0, len(pending), GEMINI_CLASSIFY_BATCH)]
+    validated = 0
+    for batch in batches[:GEMINI_CLASSIFY_MAX_BATCHES]:
         try:
-            genai.configure(api_key=GOOGLE_API_KEY)
-            model = genai.GenerativeModel('gemini-2.0-flash-exp')
-            response = model.generate_content(prompt)
-            
-            # Parsear respuesta
-            response_text = response.text.strip()
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            
-            if json_match:
-                result = json.loads(json_match.group())
-                gemini_flights = result.get('flights', [])
-                
-                # Aplicar resultados de Gemini
-                for gemini_flight in gemini_flights:
-                    idx = gemini_flight.get('index')
-                    if idx is not None and idx < len(flights):
-                        flights[idx]['type'] = gemini_flight.get('type', 'desconocido')
-                        flights[idx]['verified'] = True
-                        flights[idx]['confidence'] = gemini_flight.get('confidence', 0.5)
-                        flights[idx]['operator_name'] = gemini_flight.get('operator_name', 'Desconocido')
-                
-                logger.info(f"Validados {len(gemini_flights)} vuelos con Gemini en batch")
-            else:
-                # Fallback a clasificación básica
-                for flight in flights:
-                    flight['type'] = classify_flight(flight.get('callsign'))
-                    flight['verified'] = False
-                    
+            gemini_flights = gemini_classify_batch([group[0] for group in batch], GOOGLE_API_KEY)
         except Exception as e:
             logger.warning(f"Error en validación batch con Gemini: {e}")
-            for flight in flights:
-                flight['type'] = classify_flight(flight.get('callsign'))
-                flight['verified'] = False
-                
-    except Exception as e:
-        logger.error(f"Error en validate_flights_batch_with_gemini: {e}")
-        for flight in flights:
-            flight['type'] = classify_flight(flight.get('callsign'))
-            flight['verified'] = False
-    
+            continue
+        for idx, verdict in store_gemini_verdicts([group[0] for group in batch], gemini_flights).items():
+            for flight in batch[idx]:
+                _apply_verdict(flight, verdict)
+                flight['verification_source'] = "gemini"
+            validated += 1
+    logger.info(f"Validados {validated} vuelos con Gemini en {min(len(batches), GEMINI_CLASSIFY_MAX_BATCHES)} lotes ({len(flights) - sum(map(len, pending))} desde caché)")
+    return flights
+
+
+def _classify_queued_batch(batch):
+    """Lote de ClassificationQueue: consulta a Gemini y deja los veredictos en la caché."""
+    GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+    if not GOOGLE_API_KEY:
+        return
+    # Pudieron clasificarse (p. ej. por prefijo) mientras esperaban en la cola
+    batch = [f for f in batch if classification_cache.lookup(f.get('icao24'), f.get('callsign')) is None]
+    if not batch:
+        return
+    gemini_flights = gemini_classify_batch(batch, GOOGLE_API_KEY)
+    verdicts = store_gemini_verdicts(batch, gemini_flights)
+    logger.info(f"Gemini (segundo plano): {len(verdicts)}/{len(batch)} vuelos clasificados")
+    # Respuesta sin JSON o incompleta: cuenta como fallo para que la cola aplique la pausa
+    if gemini_flights is None:
+        raise ValueError("respuesta de Gemini sin JSON")
+    if len(verdicts) < len(batch):
+        raise ValueError(f"Gemini omitió {len(batch) - len(verdicts)} de {len(batch)} vuelos")
+
+
+# Clasificación con Gemini fuera del ciclo de refresco: los vuelos se publican
+# con la clasificación por callsign y los veredictos se aplican en los
+# snapshots siguientes, cuando ya están en la caché.
+classification_queue = ClassificationQueue(
+    _classify_queued_batch,
+    batch_size=GEMINI_CLASSIFY_BATCH,
+    maxsize=int(os.environ.get("CLASSIFY_QUEUE_MAX", "500")),
+    error_backoff_s=float(os.environ.get("CLASSIFY_ERROR_BACKOFF_S", "5")),
+)
+
+
+def enrich_flights(flights):
+    """Aplica veredictos cacheados y encola el resto para Gemini sin bloquear."""
+    flights, unseen = apply_cached_classifications(flights)
+    if unseen and os.environ.get('GOOGLE_API_KEY'):
+        classification_queue.submit([group[0] for group in unseen.values()])
     return flights
 
 
@@ -5,11 +5,16 @@ import signal
 import sys
 import logging
 from typing import Optional
-from app import obtener_token, classify_flight
+from app import obtener_token, classify_flights
 
 import requests
 import os
 
+from services.http_client import http_client
+from services.fast_json import response_json
+from services.history_store import HistoryStore
+from state_vectors import decode_states, POSITION_COLUMNS
+
 # Configuración del logger en español
 logger = logging.getLogger("colector")
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
@@ -24,10 +29,15 @@ LAT_MAX = 33.0
 LON_MIN = -118.0
 LON_MAX = -86.0
 
-# Nota: Se ha eliminado la integración con MongoDB. El colector procesa
-# los datos y los muestra en logs, pero ya no intenta persistirlos en una DB.
-cliente = None
-db = None
+# Histórico local (sustituye a MongoDB): una partición SQLite por día, un
+# INSERT por lote en cada sondeo y borrado de días completos por retención.
+HISTORY_DB = os.environ.get("HISTORY_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "history.sqlite3"))
+HISTORY_RETENTION_DAYS = float(os.environ.get("HISTORY_RETENTION_DAYS", "28"))
+try:
+    historial = HistoryStore(HISTORY_DB, retention_days=HISTORY_RETENTION_DAYS) if HISTORY_DB else None
+except Exception as e:
+    logger.warning(f"⚠️ Histórico no disponible en {HISTORY_DB}: {e}")
+    historial = None
 
 
 def apagar(signum, frame):
@@ -51,42 +61,31 @@ def obtener_estados():
         "lomax": LON_MAX,
     }
     headers = {"Authorization": f"Bearer {token}", "User-Agent": "Colector/1.0"}
-    resp = requests.get(url, headers=headers, params=params, timeout=15)
+    resp = http_client.get(url, headers=headers, params=params)
     resp.raise_for_status()
-    return resp.json()
+    return response_json(resp)
 
 
 def procesar_y_guardar(estados_json: dict):
-    """Procesa los datos de los vuelos. La persistencia en DB fue removida."""
+    """Procesa los datos de los vuelos y guarda el sondeo en el histórico local."""
     marca_tiempo = int(time.time())
-    estados = estados_json.get("states", [])
+    # Decodificación por columnas; solo se conservan las filas con posición
+    cols = decode_states(estados_json.get("states"), POSITION_COLUMNS)
+    cols = cols.take(cols.valid_position())
+    # Clasificación en lote: un solo acceso al matcher de operadores
+    tipos = classify_flights(cols.callsign.tolist())
     
-    for estado in estados:
-        icao24 = estado[0]
-        callsign = estado[1].strip() if estado[1] else ""
-        lat = estado[6]
-        lon = estado[5]
-        if lat is None or lon is None:
-            continue
-        
-        tipo = classify_flight(callsign)
-        
-        doc = {
-            "icao24": icao24,
-            "callsign": callsign if callsign else "N/A",
-            "pais_origen": estado[2],
-            "latitud": lat,
-            "longitud": lon,
-            "altitud": estado[7],
-            "velocidad": estado[9],
-            "direccion": estado[10],
-            "tipo": tipo,
-            "fecha_captura": marca_tiempo,
-        }
-        # Antes: se escribía en MongoDB. Actualmente la persistencia fue retirada
-        # para eliminar dependencias y configuraciones externas. De momento
-        # solo registramos la llegada de cada vuelo procesado.
-        logger.debug(f"Procesado vuelo {icao24} ({callsign}) tipo: {tipo} -> {doc['latitud']}, {doc['longitud']}")
+    filas = [
+        (icao24, callsign if callsign else "N/A", pais or None, lat, lon, alt, velocidad, direccion, tipo)
+        for (icao24, callsign, pais, lat, lon, alt, velocidad, direccion), tipo
+        in zip(zip(*(cols.column_list(name) for name in POSITION_COLUMNS)), tipos)
+    ]
+    if historial is None:
+        logger.debug(f"Procesados {len(filas)} vuelos (sin histórico)")
+        return 0
+    guardados = historial.append_snapshot(marca_tiempo, filas)
+    logger.debug(f"Guardados {guardados} vuelos en el histórico ({marca_tiempo})")
+    return guardados
 
 
 def main():
@@ -106,6 +105,8 @@ def main():
             time.sleep(1)
             dormido += 1
 
+    if historial is not None:
+        historial.close()
     logger.info("✅ Colector detenido correctamente.")
 
 
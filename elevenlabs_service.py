@@ -1,8 +1,10 @@
 import os
 import logging
-import requests
 from typing import Optional, Dict
 
+from services.http_client import http_client
+from services.tts_cache import tts_cache, tts_cache_key
+
 logger = logging.getLogger(__name__)
 
 class ElevenLabsService:
@@ -24,7 +26,7 @@ class ElevenLabsService:
         return self.enabled
     
     def generate_alert_audio(self, alert_text: str, alert_type: str = "warning") -> Optional[bytes]:
-        """Genera audio para una alerta usando ElevenLabs"""
+        """Genera audio para una alerta usando ElevenLabs (las frases repetidas salen de la caché TTS)"""
         if not self.is_available():
             return None
         
@@ -57,14 +59,16 @@ class ElevenLabsService:
                 }
             }
             
-            response = requests.post(url, json=data, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                logger.info(f"Audio generado exitosamente para alerta: {alert_text[:50]}...")
-                return response.content
-            else:
+            def synthesize():
+                response = http_client.post(url, json=data, headers=headers)
+                if response.status_code == 200:
+                    logger.info(f"Audio generado exitosamente para alerta: {alert_text[:50]}...")
+                    return response.content
                 logger.error(f"Error al generar audio: {response.status_code} - {response.text}")
                 return None
+
+            key = tts_cache_key(alert_text, self.voice_id, data["model_id"], "mp3", **data["voice_settings"])
+            return tts_cache.get_or_synthesize(key, synthesize)
                 
         except Exception as e:
             logger.error(f"Error al generar audio con ElevenLabs: {e}")
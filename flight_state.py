@@ -0,0 +1,464 @@
+"""
+Estado de vuelos compartido entre el hilo de refresco y los handlers HTTP.
+
+Un único SnapshotPoller es dueño del FlightMonitor: cada intervalo llama a la
+función de refresco (OpenSky + clasificación + detección de conflictos), que
+construye registros nuevos (copy-on-write) y publica un FlightSnapshot nuevo.
+Los handlers solo leen el snapshot vigente, así que N pestañas abiertas
+cuestan una sola consulta a OpenSky por intervalo.
+
+Con gunicorn el hilo se arranca perezosamente en la primera petición de cada
+worker (después del fork), por lo que hay un poller por proceso. Las
+versiones son un contador de ese proceso: SnapshotPoller.epoch las distingue
+entre procesos y reinicios (cursores, ETag e ids de eventos lo incluyen).
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class FrozenFlight(dict):
+    """
+    Registro de vuelo de solo lectura. Es un dict (jsonify lo serializa tal
+    cual) pero cualquier mutación lanza TypeError; para cambiar campos se
+    crea un registro nuevo con evolve().
+    """
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("FrozenFlight es de solo lectura; usa evolve()")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    update = pop = popitem = clear = setdefault = _readonly
+
+    def evolve(self, **changes):
+        data = dict(self)
+        data.update(changes)
+        return FrozenFlight(data)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenFlight, (dict(self),))
+
+
+def freeze_flight(flight):
+    return flight if isinstance(flight, FrozenFlight) else FrozenFlight(flight)
+
+
+def summarize_flights(flights):
+    """Resumen precalculado para /api/statistics (misma fórmula que el endpoint original)."""
+    total = len(flights)
+    cargo = sum(1 for f in flights if f.get('type') == 'carga')
+    alt_sum = sum(f['alt'] for f in flights if f.get('alt') is not None)
+    return {
+        "total_flights": total,
+        "cargo_flights": cargo,
+        "passenger_flights": total - cargo,
+        "average_altitude": round(alt_sum / total, 0) if total > 0 else 0,
+    }
+
+
+class FlightSnapshot:
+    """
+    Foto inmutable del espacio aéreo: versión creciente, hora de publicación,
+    vuelos (FrozenFlight), conflictos, alertas y el resumen estadístico.
+    Se publica reemplazando una sola referencia, así que los lectores nunca
+    necesitan lock ni ven una lista a medio actualizar.
+    """
+
+    __slots__ = ("version", "timestamp", "flights", "conflicts", "alerts", "stats")
+
+    def __init__(self, version, timestamp, flights, conflicts, alerts):
+        flights = tuple(freeze_flight(f) for f in flights)
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "timestamp", timestamp)
+        object.__setattr__(self, "flights", flights)
+        object.__setattr__(self, "conflicts", tuple(conflicts))
+        object.__setattr__(self, "alerts", tuple(alerts))
+        object.__setattr__(self, "stats", summarize_flights(flights))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FlightSnapshot es inmutable")
+
+    def __repr__(self):
+        return f"<FlightSnapshot v{self.version} vuelos={len(self.flights)} conflictos={len(self.conflicts)}>"
+
+
+EMPTY_SNAPSHOT = FlightSnapshot(0, 0.0, (), (), ())
+
+
+def flight_key(flight):
+    """Identificador estable de un vuelo entre snapshots (icao24, o callsign si falta)."""
+    return flight.get('icao24') or flight.get('callsign')
+
+
+def diff_snapshots(old, new):
+    """
+    Delta entre dos snapshots para los clientes de streaming:
+    - added: registros completos de vuelos nuevos
+    - changed: {"key": ..., <solo los campos que cambiaron>}
+    - removed: claves de vuelos que ya no están
+    Los conflictos (pocos) se envían completos.
+    """
+    previous = {flight_key(f): f for f in old.flights}
+    current = {}
+    added, changed = [], []
+    for f in new.flights:
+        key = flight_key(f)
+        current[key] = f
+        before = previous.get(key)
+        if before is None:
+            added.append(f)
+        elif before is not f and before != f:
+            fields = {k: v for k, v in f.items() if before.get(k, v) != v or k not in before}
+            fields.update({k: None for k in before if k not in f})
+            fields["key"] = key
+            changed.append(fields)
+    removed = [key for key in previous if key not in current]
+    return {
+        "from_version": old.version,
+        "version": new.version,
+        "timestamp": new.timestamp,
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "conflictos": list(new.conflicts),
+        "total_vuelos": len(new.flights),
+    }
+
+
+# Campos que sobreviven a fields=compact (el resto, p. ej. verification_notes, se omite)
+COMPACT_FIELDS = ("icao24", "callsign", "lat", "lon", "alt", "velocity", "heading", "type")
+
+
+def select_fields(flights, fields):
+    """Proyecta cada registro a `fields` (None = todos los campos)."""
+    if fields is None:
+        return list(flights)
+    return [{k: f[k] for k in fields if k in f} for f in flights]
+
+
+def to_columns(flights, fields=COMPACT_FIELDS):
+    """
+    Formato columnar: {"fields": [...], "rows": n, "columns": {campo: [valores]}}.
+    Los nombres de campo aparecen una sola vez en lugar de una por vuelo;
+    un campo ausente en un registro se envía como None.
+    """
+    flights = list(flights)
+    if fields is None:
+        fields = []
+        for f in flights:
+            fields.extend(k for k in f if k not in fields)
+    return {
+        "fields": list(fields),
+        "rows": len(flights),
+        "columns": {k: [f.get(k) for f in flights] for k in fields},
+    }
+
+
+class EventLog:
+    """
+    Bitácora en memoria con ids crecientes, para clientes que piden "lo nuevo
+    desde el id N" (/api/alerts-poll, el stream SSE). Guarda las últimas
+    `maxlen` entradas; on_append se llama tras cada inserción (p. ej. para
+    despertar a los streams).
+    """
+
+    def __init__(self, maxlen=500, on_append=None):
+        self._entries = deque(maxlen=int(maxlen))
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.last_id = 0
+        self.on_append = on_append
+
+    def publish(self, **fields):
+        return self.extend_entries([fields])[-1]
+
+    def extend_entries(self, items):
+        """Añade cada dict de items como entrada {"id", "timestamp", **campos}."""
+        added = []
+        with self._lock:
+            for fields in items:
+                entry = {"id": next(self._ids), "timestamp": time.time(), **fields}
+                self._entries.append(entry)
+                added.append(entry)
+            if added:
+                self.last_id = added[-1]["id"]
+        if added and self.on_append:
+            self.on_append()
+        return added
+
+    def since(self, since_id):
+        """Entradas con id > since_id (las más antiguas pueden haberse descartado)."""
+        with self._lock:
+            if since_id >= self.last_id:
+                return []
+            return [e for e in self._entries if e["id"] > since_id]
+
+
+class AlertLog(EventLog):
+    """Bitácora de alertas: entradas {"id", "timestamp", "version", "alert", "audio_url"}."""
+
+    def append(self, alert, audio_url=None, version=None):
+        return self.extend([alert], audio_url=audio_url, version=version)[-1]
+
+    def extend(self, alerts, audio_url=None, version=None):
+        return self.extend_entries([{"version": version, "alert": alert, "audio_url": audio_url} for alert in alerts])
+
+
+class ConflictRegistry:
+    """
+    Registro acotado de conflictos ya alertados.
+
+    Las claves son tuplas ordenadas: ("pair", icao_a, icao_b) con icao_a <= icao_b
+    o ("zone", icao, nombre_zona). observe() indica si un conflicto es nuevo
+    (hay que alertar) o continúa. Al terminar cada ciclo de detección sweep()
+    marca como separados los conflictos no observados; si siguen separados más
+    de rearm_after segundos se olvidan y una nueva convergencia vuelve a alertar.
+    Además hay expiración por TTL (sin observaciones) y un tope de tamaño LRU.
+    """
+
+    def __init__(self, ttl=600.0, max_entries=10000, rearm_after=20.0):
+        self.ttl = float(ttl)
+        self.max_entries = int(max_entries)
+        self.rearm_after = float(rearm_after)
+        # clave -> [last_seen, separated_at | None]; orden = menos recientemente observado primero
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rearms = 0
+
+    @staticmethod
+    def pair_key(icao1, icao2):
+        a, b = str(icao1), str(icao2)
+        return ("pair", a, b) if a <= b else ("pair", b, a)
+
+    @staticmethod
+    def zone_key(icao, zone_name):
+        return ("zone", str(icao), str(zone_name))
+
+    def observe(self, key, now=None):
+        """Registra que el conflicto está activo. Devuelve True si es nuevo (debe alertarse)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                entry[0] = now
+                entry[1] = None
+                self._entries.move_to_end(key)
+                return False
+            self.misses += 1
+            self._entries[key] = [now, None]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def sweep(self, active_keys, now=None):
+        """Fin de ciclo: marca separados los conflictos no observados, re-arma los vencidos y expira por TTL."""
+        now = time.time() if now is None else now
+        active_keys = set(active_keys)
+        with self._lock:
+            for key in list(self._entries):
+                entry = self._entries[key]
+                if now - entry[0] > self.ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                elif key in active_keys:
+                    continue
+                elif entry[1] is None:
+                    entry[1] = now
+                    if self.rearm_after <= 0:
+                        del self._entries[key]
+                        self.rearms += 1
+                elif now - entry[1] >= self.rearm_after:
+                    del self._entries[key]
+                    self.rearms += 1
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl,
+            "rearm_after_s": self.rearm_after,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rearms": self.rearms,
+        }
+
+
+class SnapshotPoller:
+    """
+    Hilo daemon que ejecuta refresh_fn() cada `interval` segundos.
+    refresh_fn debe publicar y devolver un FlightSnapshot nuevo (p. ej.
+    FlightMonitor.refresh); el poller lo expone y despierta a quien espere
+    una versión nueva. Si un refresco falla se conserva el último snapshot.
+    """
+
+    def __init__(self, refresh_fn, interval=10.0, name="flight-poller", history=30):
+        self.refresh_fn = refresh_fn
+        self.interval = max(float(interval), 0.5)
+        self.name = name
+        self._snapshot = EMPTY_SNAPSHOT
+        # Últimos snapshots publicados, para responder deltas desde una versión anterior
+        self._history = deque(maxlen=max(int(history), 1))
+        self._refresh_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refresh_count = 0
+        self.error_count = 0
+        self.last_refresh_ms = None
+        self._epoch = None
+        self._epoch_pid = None
+
+    @property
+    def epoch(self):
+        """Identificador de esta instancia; nuevo en cada proceso (también tras un fork)."""
+        pid = os.getpid()
+        if self._epoch_pid != pid:
+            self._epoch, self._epoch_pid = uuid.uuid4().hex[:8], pid
+        return self._epoch
+
+    def cursor(self, version):
+        """Cursor público de una versión: "<epoch>.<versión>"."""
+        return f"{self.epoch}.{version}"
+
+    def parse_cursor(self, value):
+        """Versión de un cursor de esta instancia; None si es de otra (o no es válido)."""
+        epoch, _, version = str(value or '').partition('.')
+        if epoch != self.epoch:
+            return None
+        try:
+            return int(version)
+        except ValueError:
+            return None
+
+    # -------------------------------------------------------------
+    # Publicación
+    # -------------------------------------------------------------
+    def refresh_once(self):
+        """Ejecuta un refresco en el hilo actual y publica el snapshot resultante."""
+        with self._refresh_lock:
+            started = time.perf_counter()
+            try:
+                snapshot = self.refresh_fn()
+            except Exception as e:
+                self.error_count += 1
+                logger.error("SnapshotPoller: refresco fallido, se conserva v%d: %s", self._snapshot.version, e)
+                return self._snapshot
+            self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 1)
+            with self._cond:
+                self._snapshot = snapshot
+                self._history.append(snapshot)
+                self.refresh_count += 1
+                self._cond.notify_all()
+            return snapshot
+
+    def current(self):
+        return self._snapshot
+
+    def get_version(self, version):
+        """Snapshot retenido con esa versión, o None si ya salió del historial."""
+        for snapshot in reversed(self._history):
+            if snapshot.version == version:
+                return snapshot
+        return None
+
+    def notify(self):
+        """Despierta a quien espera en wait_for() sin publicar un snapshot (p. ej. alertas nuevas)."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait_for(self, predicate, timeout=None):
+        """Espera hasta que predicate() sea verdadero, se detenga el poller o venza timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: predicate() or self._stop.is_set(), timeout)
+
+    def wait_for_version(self, version, timeout=None):
+        """Bloquea hasta que haya un snapshot con versión > version (o vence timeout). Devuelve el vigente."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._snapshot.version > version or self._stop.is_set(), timeout)
+            return self._snapshot
+
+    # -------------------------------------------------------------
+    # Ciclo de vida del hilo
+    # -------------------------------------------------------------
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        logger.info("SnapshotPoller '%s' iniciado (intervalo %.1fs)", self.name, self.interval)
+        return True
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.refresh_once()
+            # El intervalo se mide de inicio a inicio para no acumular la latencia de OpenSky
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "interval_s": self.interval,
+            "version": self._snapshot.version,
+            "epoch": self.epoch,
+            "snapshot_age_s": round(time.time() - self._snapshot.timestamp, 1) if self._snapshot.version else None,
+            "refresh_count": self.refresh_count,
+            "error_count": self.error_count,
+            "last_refresh_ms": self.last_refresh_ms,
+            "retained_versions": [s.version for s in (self._history[0], self._history[-1])] if self._history else [],
+        }
@@ -0,0 +1,132 @@
+"""
+Kernels geodésicos (haversine) escalares y vectorizados con NumPy.
+
+Todas las distancias están en kilómetros sobre una esfera de radio 6371 km,
+igual que la implementación escalar original de app.py. Las versiones de
+arrays aceptan listas o ndarrays en grados y propagan NaN para coordenadas
+faltantes en lugar de lanzar excepciones.
+"""
+from math import radians, cos, sin, asin, sqrt
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    km = EARTH_RADIUS_KM * c
+    return km
+
+
+def _haversine_rad(lat1, lon1, lat2, lon2):
+    """Núcleo común: entradas en radianes, con broadcasting de NumPy."""
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    # clip evita NaN por errores de redondeo (a ligeramente > 1 en antípodas)
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_many(lat, lon, lats, lons):
+    """Distancias de un punto (lat, lon) a muchos puntos (lats, lons). Devuelve ndarray (n,)."""
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    return _haversine_rad(np.radians(float(lat)), np.radians(float(lon)), lats, lons)
+
+
+def haversine_pairs(lat1, lon1, lat2, lon2):
+    """Distancias elemento a elemento entre dos listas de puntos de igual longitud."""
+    return _haversine_rad(
+        np.radians(np.asarray(lat1, dtype=float)),
+        np.radians(np.asarray(lon1, dtype=float)),
+        np.radians(np.asarray(lat2, dtype=float)),
+        np.radians(np.asarray(lon2, dtype=float)),
+    )
+
+
+def haversine_matrix(points_a, points_b=None):
+    """
+    Matriz de distancias entre puntos [[lat, lon], ...].
+    Con un solo argumento devuelve la matriz simétrica (n, n) de points_a.
+
+    Usa sin²(d/2) = (1 - cos d) / 2 para reducir la trigonometría a O(n + m)
+    y el resto a productos externos; el error frente a haversine_distance es
+    inferior a un metro.
+    """
+    a = np.radians(np.asarray(points_a, dtype=float).reshape(-1, 2))
+    b = a if points_b is None else np.radians(np.asarray(points_b, dtype=float).reshape(-1, 2))
+    cos_lat_a, sin_lat_a = np.cos(a[:, 0]), np.sin(a[:, 0])
+    cos_lon_a, sin_lon_a = np.cos(a[:, 1]), np.sin(a[:, 1])
+    cos_lat_b, sin_lat_b = np.cos(b[:, 0]), np.sin(b[:, 0])
+    cos_lon_b, sin_lon_b = np.cos(b[:, 1]), np.sin(b[:, 1])
+    cos_cos = np.outer(cos_lat_a, cos_lat_b)
+    cos_dlat = cos_cos + np.outer(sin_lat_a, sin_lat_b)
+    cos_dlon = np.outer(cos_lon_a, cos_lon_b)
+    cos_dlon += np.outer(sin_lon_a, sin_lon_b)
+    # h = (1 - cos dlat)/2 + cos(lat_a) cos(lat_b) (1 - cos dlon)/2, calculado en sitio
+    np.subtract(1.0, cos_dlon, out=cos_dlon)
+    cos_dlon *= cos_cos
+    np.subtract(1.0, cos_dlat, out=cos_dlat)
+    h = cos_dlat
+    h += cos_dlon
+    h *= 0.5
+    np.clip(h, 0.0, 1.0, out=h)
+    np.sqrt(h, out=h)
+    np.arcsin(h, out=h)
+    h *= 2.0 * EARTH_RADIUS_KM
+    if points_b is None:
+        np.fill_diagonal(h, 0.0)
+    return h
+
+
+def to_float_array(values):
+    """Convierte una secuencia a ndarray float; None o valores no numéricos pasan a NaN."""
+    out = np.empty(len(values), dtype=float)
+    for i, v in enumerate(values):
+        try:
+            out[i] = float(v) if v is not None else np.nan
+        except (TypeError, ValueError):
+            out[i] = np.nan
+    return out
+
+
+def simplify_track(lats, lons, tolerance_km):
+    """
+    Douglas–Peucker sobre una trayectoria en grados. Devuelve los índices
+    (ordenados) de los puntos que se conservan: siempre el primero y el
+    último, y los que se alejan más de `tolerance_km` del segmento que los
+    aproxima. Las distancias se miden en una proyección equirectangular
+    local (suficiente para tolerancias de metros a pocos km).
+    """
+    lat = np.asarray(lats, dtype=float)
+    lon = np.asarray(lons, dtype=float)
+    n = len(lat)
+    if n <= 2 or not tolerance_km or tolerance_km <= 0:
+        return np.arange(n)
+    scale = EARTH_RADIUS_KM * np.pi / 180.0
+    x = lon * scale * np.cos(np.radians(np.nanmean(lat)))
+    y = lat * scale
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    # Pila explícita en lugar de recursión: trayectorias de miles de puntos
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        dx, dy = x[j] - x[i], y[j] - y[i]
+        px, py = x[i + 1:j] - x[i], y[i + 1:j] - y[i]
+        seg2 = dx * dx + dy * dy
+        # Distancia al segmento (no a la recta): respeta giros y esperas en circuito
+        t = np.clip((px * dx + py * dy) / seg2, 0.0, 1.0) if seg2 > 0 else 0.0
+        d = np.hypot(px - t * dx, py - t * dy)
+        k = int(np.nanargmax(d)) if not np.all(np.isnan(d)) else 0
+        if d[k] > tolerance_km:
+            m = i + 1 + k
+            keep[m] = True
+            stack.append((i, m))
+            stack.append((m, j))
+    return np.flatnonzero(keep)
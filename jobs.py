@@ -0,0 +1,204 @@
+"""
+Cola de trabajos en memoria para cálculos lentos (rutas y rutas de emergencia).
+
+Cada carril ("lane") tiene su propia cola acotada y su propio grupo de hilos,
+de modo que una ráfaga de rutas normales nunca retrasa una ruta de
+emergencia. Los resultados terminados se conservan `retention_s` segundos
+(y como mucho `max_retained` trabajos); después se descartan.
+
+on_event(job) se llama en cada cambio de estado (queued, running, done,
+error) para publicar eventos, p. ej. en el stream SSE.
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, ERROR = "queued", "running", "done", "error"
+
+
+class JobQueueFull(Exception):
+    """El carril no admite más trabajos en cola."""
+
+
+class JobError(Exception):
+    """Error esperado de un trabajo (p. ej. datos inválidos) con el código HTTP a devolver."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Job:
+    __slots__ = ("id", "kind", "lane", "fn", "args", "kwargs", "status", "created", "started",
+                 "finished", "result", "error", "error_status", "_done")
+
+    def __init__(self, kind, lane, fn, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.lane = lane
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.error_status = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def summary(self):
+        """Estado sin el resultado (para listados y eventos)."""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "lane": self.lane,
+            "status": self.status,
+            "created": self.created,
+            "queue_ms": round((self.started - self.created) * 1000, 1) if self.started else None,
+            "run_ms": round((self.finished - self.started) * 1000, 1) if self.finished and self.started else None,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    lanes: {"nombre": hilos}. submit() encola en un carril y devuelve el Job;
+    get()/wait() lo consultan mientras siga retenido.
+    """
+
+    def __init__(self, lanes=None, max_queue=100, retention_s=600.0, max_retained=500, on_event=None, name="jobs"):
+        self.lanes = dict(lanes or {"normal": 4})
+        self.max_queue = int(max_queue)
+        self.retention_s = float(retention_s)
+        self.max_retained = int(max_retained)
+        self.on_event = on_event
+        self.name = name
+        self._queues = {lane: queue.Queue(maxsize=self.max_queue) for lane in self.lanes}
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._started = False
+        self._running = {lane: 0 for lane in self.lanes}
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    # -------------------------------------------------------------
+    # Hilos (se arrancan en el primer submit, después del fork de gunicorn)
+    # -------------------------------------------------------------
+    def _ensure_workers(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            counter = itertools.count(1)
+            for lane, workers in self.lanes.items():
+                for _ in range(max(int(workers), 1)):
+                    t = threading.Thread(target=self._worker, args=(lane,), name=f"{self.name}-{lane}-{next(counter)}", daemon=True)
+                    t.start()
+                    self._threads.append(t)
+
+    def _worker(self, lane):
+        q = self._queues[lane]
+        while True:
+            job = q.get()
+            try:
+                self._run(job)
+            finally:
+                q.task_done()
+
+    def _run(self, job):
+        with self._lock:
+            self._running[job.lane] += 1
+        job.started = time.time()
+        job.status = RUNNING
+        self._emit(job)
+        try:
+            job.result = job.fn(*job.args, **job.kwargs)
+            job.status = DONE
+        except JobError as e:
+            job.error, job.error_status, job.status = str(e), e.status, ERROR
+        except Exception as e:
+            logger.exception("Trabajo %s (%s) falló: %s", job.id, job.kind, e)
+            job.error, job.error_status, job.status = str(e), 500, ERROR
+        job.finished = time.time()
+        job.fn = job.args = job.kwargs = None
+        with self._lock:
+            self._running[job.lane] -= 1
+            if job.status == DONE:
+                self.completed += 1
+            else:
+                self.failed += 1
+        job._done.set()
+        self._emit(job)
+
+    def _emit(self, job):
+        if self.on_event:
+            try:
+                self.on_event(job)
+            except Exception as e:
+                logger.warning("JobQueue: on_event falló: %s", e)
+
+    # -------------------------------------------------------------
+    # API
+    # -------------------------------------------------------------
+    def submit(self, kind, fn, *args, lane="normal", **kwargs):
+        if lane not in self._queues:
+            raise ValueError(f"Carril desconocido: {lane}")
+        self._ensure_workers()
+        job = Job(kind, lane, fn, args, kwargs)
+        # Encolar y emitir "queued" bajo el lock: el worker no puede emitir
+        # "running" (toma el mismo lock en _run) antes que este evento
+        with self._lock:
+            self._evict_locked(time.time())
+            try:
+                self._queues[lane].put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise JobQueueFull(f"Cola '{lane}' llena ({self.max_queue} trabajos)")
+            self._jobs[job.id] = job
+            self.submitted += 1
+            self._emit(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict_locked(time.time())
+            return self._jobs.get(job_id)
+
+    def _evict_locked(self, now):
+        # Solo se descartan trabajos terminados: por antigüedad y, si sobran, los más viejos
+        finished = [j for j in self._jobs.values() if j.finished is not None]
+        excess = len(finished) - self.max_retained
+        for job in finished:
+            if now - job.finished > self.retention_s or excess > 0:
+                del self._jobs[job.id]
+                self.evicted += 1
+                excess -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lanes": {lane: {"workers": self.lanes[lane], "queued": q.qsize(), "running": self._running[lane]}
+                          for lane, q in self._queues.items()},
+                "max_queue": self.max_queue,
+                "retained": len(self._jobs),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "evicted": self.evicted,
+            }
@@ -0,0 +1,137 @@
+"""
+Clasificación de vuelos por prefijo de callsign (data/operator_mapping.json).
+
+Los prefijos se compilan una sola vez en un trie (dicts anidados por letra).
+Clasificar un callsign recorre como mucho tantas letras como el prefijo más
+largo, sin importar cuántos prefijos haya (miles en una tabla OACI
+completa). Se mantiene la regla original: si algún prefijo de carga coincide
+el vuelo es "carga"; en cualquier otro caso "comercial" (la mayoría de los
+vuelos desconocidos lo son). Un callsign vacío o no textual es "desconocido".
+
+OperatorMapping vuelve a compilar el trie cuando cambia el mtime del archivo,
+revisándolo como mucho cada `reload_interval_s` segundos.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CARGO, COMMERCIAL, UNKNOWN = "carga", "comercial", "desconocido"
+DEFAULT_TYPE = COMMERCIAL
+# Si un callsign coincide con prefijos de ambas listas gana el de mayor prioridad
+_PRIORITY = {CARGO: 2, COMMERCIAL: 1}
+_LABEL = ""  # clave de la etiqueta dentro de un nodo (no choca con ninguna letra)
+
+
+class OperatorMatcher:
+    """Trie inmutable de prefijos -> tipo de vuelo."""
+
+    def __init__(self, mapping):
+        self.root = {}
+        self.size = 0
+        self.max_depth = 0
+        for label, key in ((CARGO, "cargo_prefixes"), (COMMERCIAL, "commercial_prefixes")):
+            for prefix in mapping.get(key, []) or []:
+                self._insert(str(prefix).strip().upper(), label)
+
+    def _insert(self, prefix, label):
+        if not prefix:
+            return
+        node = self.root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        current = node.get(_LABEL)
+        if current is None or _PRIORITY[label] > _PRIORITY[current]:
+            node[_LABEL] = label
+        self.size += 1
+        self.max_depth = max(self.max_depth, len(prefix))
+
+    def classify(self, callsign):
+        if not callsign or not isinstance(callsign, str):
+            return UNKNOWN
+        text = callsign.strip().upper()
+        if not text:
+            return UNKNOWN
+        node = self.root
+        best = None
+        for ch in text[:self.max_depth]:
+            node = node.get(ch)
+            if node is None:
+                break
+            label = node.get(_LABEL)
+            if label == CARGO:
+                return CARGO
+            if label is not None:
+                best = label
+        return best or DEFAULT_TYPE
+
+    def classify_many(self, callsigns):
+        classify = self.classify
+        return [classify(c) for c in callsigns]
+
+
+class OperatorMapping:
+    """Matcher compilado desde un JSON, recompilado si el archivo cambia."""
+
+    def __init__(self, path, reload_interval_s=5.0):
+        self.path = Path(path)
+        self.reload_interval_s = float(reload_interval_s)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self.mapping = {"cargo_prefixes": [], "commercial_prefixes": []}
+        self.matcher = OperatorMatcher(self.mapping)
+        self.reloads = 0
+        self._load()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, "r", encoding="utf-8") as f:
+                mapping = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Error al cargar {self.path.name}: {e}")
+            return
+        try:
+            if not isinstance(mapping, dict):
+                raise ValueError(f"se esperaba un objeto JSON, no {type(mapping).__name__}")
+            matcher = OperatorMatcher(mapping)
+        except Exception as e:
+            # JSON válido con forma incorrecta: se conserva el matcher anterior y no se
+            # vuelve a intentar hasta que el archivo cambie otra vez
+            self._mtime = mtime
+            logger.warning(f"Error al cargar {self.path.name}: {e}")
+            return
+        # Se sustituye el matcher completo: los lectores nunca ven un trie a medio construir
+        self.matcher = matcher
+        self.mapping = mapping
+        self._mtime = mtime
+        self.reloads += 1
+        logger.info("Operator mapping cargado: %d prefijos", self.matcher.size)
+
+    def current(self):
+        """Matcher vigente; como mucho un stat() del archivo cada reload_interval_s."""
+        if self.reload_interval_s > 0:
+            now = time.monotonic()
+            if now >= self._next_check and self._lock.acquire(blocking=False):
+                try:
+                    self._next_check = now + self.reload_interval_s
+                    try:
+                        mtime = os.stat(self.path).st_mtime
+                    except OSError:
+                        mtime = self._mtime
+                    if mtime != self._mtime:
+                        self._load()
+                finally:
+                    self._lock.release()
+        return self.matcher
+
+    def classify(self, callsign):
+        return self.current().classify(callsign)
+
+    def classify_many(self, callsigns):
+        return self.current().classify_many(callsigns)
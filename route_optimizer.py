@@ -0,0 +1,321 @@
+"""
+Optimizador de rutas (camino abierto que empieza en el primer punto).
+
+La matriz de distancias se calcula una sola vez con geo.haversine_matrix y
+cada movimiento se evalúa en O(1) a partir de ella. La búsqueda usa listas
+de vecinos más cercanos y "don't-look bits": solo se revisan las ciudades
+cuyos extremos cambiaron en el último movimiento, y el bucle termina cuando
+ninguna ciudad admite mejora (óptimo local) o se agota el presupuesto de tiempo.
+
+Los motores son combinaciones de operadores de movimiento registrados en
+ENGINES (ver register_engine):
+
+- "2opt": inversión de un tramo del camino.
+- "oropt": reubicación de tramos de 1 a 3 puntos, opcionalmente invertidos
+  (Or-opt / Or-3opt).
+- "2opt+oropt": ambos vecindarios en la misma cola de don't-look bits.
+
+Con fixed_end=True el último punto queda fijo al final del camino (origen y
+destino anclados).
+"""
+import math
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from geo import haversine_matrix
+
+# Tamaño de las listas de vecinos candidatos por punto
+DEFAULT_NEIGHBORS = 10
+# Motor y presupuesto de tiempo por defecto (ms); ROUTE_TIME_BUDGET_MS=0 desactiva el límite
+DEFAULT_ENGINE = os.environ.get("ROUTE_ENGINE", "2opt+oropt")
+DEFAULT_TIME_BUDGET_MS = float(os.environ.get("ROUTE_TIME_BUDGET_MS", "250"))
+# Longitud máxima de tramo que mueve Or-opt
+OR_OPT_MAX_SEGMENT = 3
+# Mejoras menores a este umbral (km) se consideran ruido de punto flotante
+_EPS = 1e-9
+
+
+def build_distance_matrix(points):
+    """Matriz de distancias (km) como lista de listas, más rápida de indexar en bucles Python."""
+    return haversine_matrix(points).tolist()
+
+
+def neighbor_lists(dist, k=DEFAULT_NEIGHBORS):
+    """Para cada punto, los índices de sus k vecinos más cercanos ordenados por distancia."""
+    n = len(dist)
+    if n <= 1:
+        return [[] for _ in range(n)]
+    k = min(k, n - 1)
+    order = np.argsort(np.asarray(dist), axis=1, kind='stable')
+    neighbors = []
+    for i in range(n):
+        row = [int(j) for j in order[i] if j != i]
+        neighbors.append(row[:k])
+    return neighbors
+
+
+def path_length(dist, tour):
+    return sum(dist[tour[i]][tour[i + 1]] for i in range(len(tour) - 1))
+
+
+def nearest_neighbor_path(dist, start=0, end=None):
+    """Construcción voraz: desde start, siempre al punto no visitado más cercano; end (si se da) va al final."""
+    n = len(dist)
+    tour = [start]
+    unvisited = set(range(n))
+    unvisited.discard(start)
+    if end is not None:
+        unvisited.discard(end)
+    while unvisited:
+        row = dist[tour[-1]]
+        nearest = min(unvisited, key=row.__getitem__)
+        tour.append(nearest)
+        unvisited.remove(nearest)
+    if end is not None and end != start:
+        tour.append(end)
+    return tour
+
+
+class PathState:
+    """
+    Estado compartido por los operadores de movimiento: camino, posiciones,
+    matriz de distancias, listas de vecinos y contadores.
+    """
+
+    def __init__(self, tour, dist, neighbors, stats, fixed_end=False):
+        self.tour = tour
+        self.dist = dist
+        self.neighbors = neighbors
+        self.stats = stats
+        self.fixed_end = fixed_end
+        self.n = len(tour)
+        # Última posición que un movimiento puede alterar
+        self.last_movable = self.n - 2 if fixed_end else self.n - 1
+        self.pos = [0] * self.n
+        self.reindex(0, self.n - 1)
+
+    def reindex(self, lo, hi):
+        for k in range(lo, hi + 1):
+            self.pos[self.tour[k]] = k
+
+    def edge(self, k):
+        """Longitud de la arista (t[k], t[k+1]); 0 si k es la última posición."""
+        if k + 1 < self.n:
+            return self.dist[self.tour[k]][self.tour[k + 1]]
+        return 0.0
+
+
+def two_opt_move(state, a):
+    """
+    2-opt: un movimiento (p, q), p < q, elimina las aristas (t[p], t[p+1]) y
+    (t[q], t[q+1]) e invierte t[p+1..q]. Si q es la última posición no hay
+    segunda arista (extremo final libre). Devuelve las ciudades tocadas o None.
+    """
+    t, d, pos, n = state.tour, state.dist, state.pos, state.n
+    pa = pos[a]
+
+    def try_move(p, q):
+        if q > state.last_movable or q <= p + 1:
+            return None
+        state.stats['evaluations'] += 1
+        a1, b1, a2 = t[p], t[p + 1], t[q]
+        if q + 1 < n:
+            b2 = t[q + 1]
+            delta = d[a1][a2] + d[b1][b2] - d[a1][b1] - d[a2][b2]
+        else:
+            delta = d[a1][a2] - d[a1][b1]
+        if delta >= -_EPS:
+            return None
+        t[p + 1:q + 1] = t[p + 1:q + 1][::-1]
+        state.reindex(p + 1, q)
+        state.stats['moves'] += 1
+        touched = [t[p], t[p + 1], t[q]]
+        if q + 1 < n:
+            touched.append(t[q + 1])
+        return touched
+
+    # Caso sucesor: nuevas aristas (a, c) y (suc(a), suc(c))
+    if pa < n - 1:
+        d_ab = d[a][t[pa + 1]]
+        for c in state.neighbors[a]:
+            if d_ab - d[a][c] <= _EPS:
+                break
+            pc = pos[c]
+            touched = try_move(pa, pc) if pc > pa else try_move(pc, pa)
+            if touched:
+                return touched
+    # Caso predecesor: nuevas aristas (a, c) y (pred(a), pred(c)); el punto 0 no tiene predecesor
+    if pa > 0:
+        d_ab = d[a][t[pa - 1]]
+        for c in state.neighbors[a]:
+            if d_ab - d[a][c] <= _EPS:
+                break
+            pc = pos[c]
+            if pc == 0:
+                continue
+            touched = try_move(pa - 1, pc - 1) if pc > pa else try_move(pc - 1, pa - 1)
+            if touched:
+                return touched
+    return None
+
+
+def or_opt_move(state, a):
+    """
+    Or-opt: saca un tramo t[i..j] de 1 a OR_OPT_MAX_SEGMENT puntos que empieza
+    o termina en 'a' y lo reinserta (directo o invertido) junto a un vecino
+    cercano de sus extremos. Devuelve las ciudades tocadas o None.
+    """
+    t, d, pos, n = state.tour, state.dist, state.pos, state.n
+    pa = pos[a]
+    starts = set()
+    for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+        starts.add((pa, pa + length - 1))
+        starts.add((pa - length + 1, pa))
+    for i, j in sorted(starts):
+        # El punto 0 es fijo; con fixed_end también el último
+        if i < 1 or j > state.last_movable:
+            continue
+        s0, s1 = t[i], t[j]
+        prev = t[i - 1]
+        removal_gain = d[prev][s0] + state.edge(j)
+        if j + 1 < n:
+            removal_gain -= d[prev][t[j + 1]]
+        candidates = set()
+        for end in (s0, s1):
+            for c in state.neighbors[end]:
+                pc = pos[c]
+                candidates.add(pc)        # insertar después de c
+                candidates.add(pc - 1)    # insertar antes de c
+        for k in sorted(candidates):
+            # Insertar entre t[k] y t[k+1]; k fuera del tramo y de su arista previa
+            if k < 0 or i - 1 <= k <= j:
+                continue
+            if k + 1 >= n and state.fixed_end:
+                continue
+            state.stats['evaluations'] += 1
+            u = t[k]
+            old_edge = state.edge(k)
+            if k + 1 < n:
+                v = t[k + 1]
+                forward = d[u][s0] + d[s1][v]
+                backward = d[u][s1] + d[s0][v]
+            else:
+                forward = d[u][s0]
+                backward = d[u][s1]
+            reverse = backward < forward
+            delta = min(forward, backward) - old_edge - removal_gain
+            if delta >= -_EPS:
+                continue
+            segment = t[i:j + 1]
+            if reverse:
+                segment.reverse()
+            rest = t[:i] + t[j + 1:]
+            insert_at = k + 1 if k < i else k + 1 - len(segment)
+            rest[insert_at:insert_at] = segment
+            touched = [prev, s0, s1, u]
+            if j + 1 < n:
+                touched.append(t[j + 1])
+            if k + 1 < n:
+                touched.append(t[k + 1])
+            t[:] = rest
+            state.reindex(0, n - 1)
+            state.stats['moves'] += 1
+            return touched
+    return None
+
+
+# Motores disponibles: nombre -> lista de operadores move(state, ciudad) -> ciudades tocadas | None
+ENGINES = {}
+
+
+def register_engine(name, moves):
+    """Registra un motor como secuencia de operadores; se prueban en orden para cada ciudad activa."""
+    ENGINES[name] = tuple(moves)
+    return ENGINES[name]
+
+
+register_engine("2opt", [two_opt_move])
+register_engine("oropt", [or_opt_move])
+register_engine("2opt+oropt", [two_opt_move, or_opt_move])
+
+
+def local_search(state, moves, deadline=None):
+    """
+    Búsqueda local con don't-look bits: una ciudad fuera de la cola tiene su bit
+    encendido y solo vuelve a revisarse si un movimiento toca sus aristas.
+    Devuelve False si se agotó el presupuesto de tiempo antes del óptimo local.
+    """
+    queue = deque(state.tour)
+    active = [True] * state.n
+    while queue:
+        if deadline is not None and time.perf_counter() >= deadline:
+            return False
+        a = queue.popleft()
+        active[a] = False
+        state.stats['iterations'] += 1
+        for move in moves:
+            touched = move(state, a)
+            if touched:
+                for city in touched + [a]:
+                    if not active[city]:
+                        active[city] = True
+                        queue.append(city)
+                break
+    return True
+
+
+def optimize_tour(points, engine=None, fixed_end=False, time_budget_ms=None, neighbors=DEFAULT_NEIGHBORS):
+    """
+    Calcula un camino corto que empieza en points[0] y visita todos los puntos.
+    Con fixed_end=True el camino además termina en points[-1].
+
+    engine elige el motor de ENGINES (por defecto ROUTE_ENGINE) y
+    time_budget_ms limita el tiempo total (por defecto ROUTE_TIME_BUDGET_MS;
+    0 o None sin límite); al agotarse se devuelve la mejor ruta hasta el momento.
+
+    Devuelve (tour, distancia_km, stats) donde tour son índices de points y
+    stats incluye tiempos en ms, iteraciones, movimientos y evaluaciones.
+    """
+    t0 = time.perf_counter()
+    engine = engine or DEFAULT_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Motor de optimización desconocido: {engine}")
+    if time_budget_ms is None:
+        time_budget_ms = DEFAULT_TIME_BUDGET_MS
+    if math.isnan(time_budget_ms):
+        raise ValueError("time_budget_ms no puede ser NaN")
+    # 0, negativo o infinito: sin límite (solo para llamadas internas; la API acota el valor)
+    deadline = t0 + time_budget_ms / 1000.0 if 0 < time_budget_ms < math.inf else None
+    stats = {"n_points": len(points or []), "engine": engine, "fixed_end": bool(fixed_end),
+             "time_budget_ms": time_budget_ms, "budget_exhausted": False,
+             "iterations": 0, "moves": 0, "evaluations": 0}
+    if not points or len(points) <= 1:
+        stats.update({"matrix_ms": 0.0, "construct_ms": 0.0, "improve_ms": 0.0, "total_ms": 0.0,
+                      "initial_km": 0.0, "final_km": 0.0})
+        return list(range(len(points or []))), 0.0, stats
+
+    n = len(points)
+    dist = build_distance_matrix(points)
+    neigh = neighbor_lists(dist, neighbors)
+    t1 = time.perf_counter()
+    tour = nearest_neighbor_path(dist, 0, n - 1 if fixed_end else None)
+    initial = path_length(dist, tour)
+    t2 = time.perf_counter()
+    state = PathState(tour, dist, neigh, stats, fixed_end=fixed_end)
+    stats["budget_exhausted"] = not local_search(state, ENGINES[engine], deadline)
+    tour = state.tour
+    final = path_length(dist, tour)
+    t3 = time.perf_counter()
+
+    stats.update({
+        "matrix_ms": round((t1 - t0) * 1000, 3),
+        "construct_ms": round((t2 - t1) * 1000, 3),
+        "improve_ms": round((t3 - t2) * 1000, 3),
+        "total_ms": round((t3 - t0) * 1000, 3),
+        "initial_km": round(initial, 3),
+        "final_km": round(final, 3),
+    })
+    return tour, final, stats
@@ -0,0 +1,87 @@
+"""
+Costo por snapshot de decodificar una respuesta /states/all de OpenSky.
+
+Genera un payload sintético del tamaño de un snapshot global y mide, para
+cada backend JSON disponible (stdlib, orjson, msgspec):
+- parse: bytes -> dicts/listas
+- parse + decode_flight_records: hasta los registros de vuelo del monitor
+- parse + decode_states: hasta las columnas NumPy (sin registros)
+
+Uso: python scripts/bench_opensky_decode.py [--states 10000] [--repeat 10]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+# Ensure project root is on sys.path so `import app` works when running this script
+proj_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(proj_root))
+
+from services import fast_json
+from state_vectors import decode_states, POSITION_COLUMNS
+
+
+def synthetic_payload(n, seed=42):
+    rnd = random.Random(seed)
+    states = []
+    for i in range(n):
+        on_ground = rnd.random() < 0.1
+        states.append([
+            f"{rnd.getrandbits(24):06x}",
+            f"{rnd.choice(['AMX', 'VOI', 'FDX', 'UAL', 'N'])}{rnd.randint(1, 9999):<5}",
+            rnd.choice(["Mexico", "United States", "Canada", "Spain"]),
+            1700000000 + rnd.randint(0, 10),
+            1700000000 + rnd.randint(0, 10),
+            None if rnd.random() < 0.02 else round(rnd.uniform(-180, 180), 4),
+            None if rnd.random() < 0.02 else round(rnd.uniform(-90, 90), 4),
+            None if on_ground else round(rnd.uniform(0, 12000), 2),
+            on_ground,
+            round(rnd.uniform(0, 280), 2),
+            round(rnd.uniform(0, 360), 2),
+            None if on_ground else round(rnd.uniform(-20, 20), 2),
+            None,
+            None if on_ground else round(rnd.uniform(0, 12500), 2),
+            f"{rnd.randint(0, 7777):04d}",
+            False,
+            0,
+        ])
+    return json.dumps({"time": 1700000010, "states": states}).encode("utf-8")
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--states", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    import app  # decode_flight_records
+
+    payload = synthetic_payload(args.states)
+    print(f"Payload: {args.states} estados, {len(payload) / 1e6:.2f} MB (mejor de {args.repeat} repeticiones)\n")
+    print(f"{'backend':<10}{'parse ms':>12}{'+ registros ms':>18}{'+ columnas ms':>16}")
+    for name in ("stdlib", "orjson", "msgspec"):
+        backend, loads = fast_json._load_backend(name)
+        if backend != name:
+            print(f"{name:<10}{'(no instalado)':>12}")
+            continue
+        parse = timed(lambda: loads(payload), args.repeat)
+        records = timed(lambda: app.decode_flight_records(loads(payload)["states"]), args.repeat)
+        columns = timed(lambda: decode_states(loads(payload)["states"], POSITION_COLUMNS), args.repeat)
+        print(f"{name:<10}{parse:>12.1f}{records:>18.1f}{columns:>16.1f}")
+    print(f"\nBackend activo en la app: {fast_json.BACKEND}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Caché en memoria LRU con caducidad por entrada, segura entre hilos.
+
+Se usa como primer nivel de cachés más específicas (geocodificación, rutas).
+Cada entrada guarda su propio instante de expiración, de modo que un mismo
+caché puede mezclar TTL distintos (p. ej. resultados negativos más cortos).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Centinela de lookup(): distingue "no está" de un valor None cacheado
+MISSING = object()
+
+
+class TTLCache:
+    """LRU acotada a `maxsize` entradas; ttl=None significa sin caducidad."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = int(maxsize)
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        value = self.lookup(key)
+        return default if value is MISSING else value
+
+    def lookup(self, key):
+        """Como get(), pero devuelve el centinela MISSING si no hay entrada vigente (permite cachear None)."""
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] is not None and item[1] <= now:
+                del self._data[key]
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, ttl=MISSING):
+        ttl = self.ttl if ttl is MISSING else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.lookup(key) is not MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
@@ -0,0 +1,266 @@
+"""
+Caché persistente de clasificaciones de vuelos (carga / comercial) hechas por Gemini.
+
+Dos claves por veredicto:
+- ("icao", icao24): la aeronave concreta.
+- ("prefix", XXX): el prefijo OACI de 3 letras del callsign (el operador).
+  Solo se guarda si la confianza llega a `prefix_min_confidence`, y sirve
+  para aeronaves nuevas de un operador ya conocido.
+
+Cada entrada guarda tipo, confianza y operador con su propia caducidad: los
+veredictos de baja confianza caducan antes (`low_confidence_ttl`) para que se
+reconsulten. Las aeronaves que Gemini dejó sin veredicto (respuesta sin JSON
+o que omite el vuelo) se guardan con store_unresolved(): una entrada por
+icao24 con tipo None y caducidad corta (`unresolved_ttl`), para no volver a
+enviarlas en cada refresco. Igual que GeocodeCache, hay un nivel en memoria (TTLCache) y uno
+en SQLite compartido entre procesos y reinicios.
+
+ClassificationQueue saca las consultas a Gemini del ciclo de refresco: los
+vuelos sin veredicto se encolan y se clasifican en segundo plano.
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from services.cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+_PREFIX = re.compile(r"^([A-Z]{3})\d")
+
+
+def callsign_prefix(callsign):
+    """'AMX123 ' -> 'AMX'; None si el callsign no empieza con un designador OACI de 3 letras."""
+    match = _PREFIX.match(str(callsign or "").strip().upper())
+    return match.group(1) if match else None
+
+
+def cache_keys(icao24, callsign):
+    keys = []
+    if icao24:
+        keys.append(f"icao:{str(icao24).strip().lower()}")
+    prefix = callsign_prefix(callsign)
+    if prefix:
+        keys.append(f"prefix:{prefix}")
+    return keys
+
+
+class ClassificationCache:
+    """
+    lookup(icao24, callsign) -> {"type", "confidence", "operator_name", "source"} | None.
+    type es None para una aeronave sin resolver (store_unresolved).
+    """
+
+    def __init__(self, db_path=None, maxsize=20000, ttl=7 * 86400, low_confidence_ttl=3600,
+                 low_confidence=0.5, prefix_min_confidence=0.8, unresolved_ttl=900):
+        self.ttl = ttl
+        self.low_confidence_ttl = low_confidence_ttl
+        self.unresolved_ttl = unresolved_ttl
+        self.low_confidence = low_confidence
+        self.prefix_min_confidence = prefix_min_confidence
+        self.memory = TTLCache(maxsize=maxsize)
+        self.db_path = str(db_path) if db_path else None
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.prefix_hits = 0
+        self.unresolved_hits = 0
+        self.unresolved_stored = 0
+        self.misses = 0
+        if self.db_path:
+            try:
+                Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5.0)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS classification ("
+                    " key TEXT PRIMARY KEY, type TEXT, confidence REAL, operator_name TEXT, expires_at REAL)"
+                )
+                self._db.commit()
+                self._load()
+            except sqlite3.Error as e:
+                logger.warning("ClassificationCache: SQLite no disponible en %s (%s); solo caché en memoria", self.db_path, e)
+                self._db = None
+
+    def _load(self):
+        """Carga las entradas vigentes en memoria: lookup() queda en O(1) sin tocar disco."""
+        now = time.time()
+        with self._db_lock:
+            self._db.execute("DELETE FROM classification WHERE expires_at <= ?", (now,))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT key, type, confidence, operator_name, expires_at FROM classification ORDER BY expires_at"
+            ).fetchall()
+        for key, flight_type, confidence, operator_name, expires_at in rows:
+            verdict = {"type": flight_type, "confidence": confidence, "operator_name": operator_name}
+            self.memory.set(key, verdict, ttl=expires_at - now)
+        if rows:
+            logger.info("ClassificationCache: %d veredictos cargados desde %s", len(rows), self.db_path)
+
+    def lookup(self, icao24, callsign):
+        for key in cache_keys(icao24, callsign):
+            verdict = self.memory.lookup(key)
+            if verdict is not MISSING:
+                source = key.split(":", 1)[0]
+                self.hits += 1
+                if source == "prefix":
+                    self.prefix_hits += 1
+                if verdict["type"] is None:
+                    self.unresolved_hits += 1
+                return dict(verdict, source=source)
+        self.misses += 1
+        return None
+
+    def _ttl_for(self, confidence):
+        return self.low_confidence_ttl if confidence < self.low_confidence else self.ttl
+
+    def store(self, icao24, callsign, flight_type, confidence, operator_name=None):
+        """Guarda un veredicto por icao24 y, si la confianza basta, por prefijo de operador."""
+        try:
+            confidence = float(confidence)
+        except (TypeError, ValueError):
+            confidence = 0.5
+        verdict = {"type": flight_type, "confidence": confidence, "operator_name": operator_name}
+        ttl = self._ttl_for(confidence)
+        rows = []
+        for key in cache_keys(icao24, callsign):
+            if key.startswith("prefix:") and confidence < self.prefix_min_confidence:
+                continue
+            self.memory.set(key, verdict, ttl=ttl)
+            rows.append((key, flight_type, confidence, operator_name, time.time() + ttl))
+        self._write(rows)
+
+    def store_unresolved(self, icao24):
+        """Marca una aeronave como consultada sin veredicto durante unresolved_ttl."""
+        if not icao24 or self.unresolved_ttl <= 0:
+            return
+        key = cache_keys(icao24, None)[0]
+        # Un veredicto real vigente no se pisa con "sin resolver"
+        if self.memory.lookup(key) is not MISSING:
+            return
+        self.memory.set(key, {"type": None, "confidence": 0.0, "operator_name": None}, ttl=self.unresolved_ttl)
+        self.unresolved_stored += 1
+        self._write([(key, None, 0.0, None, time.time() + self.unresolved_ttl)])
+
+    def _write(self, rows):
+        if self._db is None or not rows:
+            return
+        try:
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO classification (key, type, confidence, operator_name, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("ClassificationCache: escritura fallida: %s", e)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self.memory), "hits": self.hits, "prefix_hits": self.prefix_hits,
+                "unresolved_hits": self.unresolved_hits, "unresolved_stored": self.unresolved_stored,
+                "misses": self.misses, "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "db_path": self.db_path if self._db is not None else None}
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+
+class ClassificationQueue:
+    """
+    Etapa asíncrona de clasificación: submit() encola vuelos sin veredicto y
+    un hilo los procesa en lotes con process_batch(lote). La cola está acotada
+    a `maxsize` aeronaves; si se llena se descartan las más antiguas (se
+    volverán a encolar en el siguiente refresco si siguen sin veredicto).
+    Una aeronave ya encolada o en proceso no se duplica.
+    """
+
+    def __init__(self, process_batch, batch_size=20, maxsize=500, error_backoff_s=5.0, name="classify"):
+        self.process_batch = process_batch
+        self.batch_size = max(int(batch_size), 1)
+        self.maxsize = max(int(maxsize), 1)
+        self.error_backoff_s = float(error_backoff_s)
+        self.name = name
+        self._pending = OrderedDict()
+        self._inflight = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.submitted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.batches = 0
+        self.failures = 0
+
+    @staticmethod
+    def flight_key(flight):
+        return flight.get("icao24") or flight.get("callsign")
+
+    def _ensure_worker(self):
+        # Con el lock tomado; el hilo se arranca en el primer submit (después del fork de gunicorn)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._worker, name=f"{self.name}-worker", daemon=True)
+            self._thread.start()
+
+    def submit(self, flights):
+        """Encola los vuelos (sin bloquear). Devuelve cuántos quedaron encolados de nuevo."""
+        added = 0
+        with self._cond:
+            for flight in flights:
+                key = self.flight_key(flight)
+                if not key or key in self._inflight:
+                    continue
+                if key in self._pending:
+                    self._pending[key] = flight
+                    continue
+                self._pending[key] = flight
+                added += 1
+                if len(self._pending) > self.maxsize:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+            self.submitted += added
+            if self._pending:
+                self._ensure_worker()
+                self._cond.notify()
+        return added
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                key, flight = self._pending.popitem(last=False)
+                self._inflight.add(key)
+                batch.append(flight)
+            return batch
+
+    def _worker(self):
+        while True:
+            batch = self._take_batch()
+            failed = False
+            try:
+                self.process_batch(batch)
+            except Exception as e:
+                failed = True
+                logger.warning("ClassificationQueue: lote de %d vuelos falló: %s", len(batch), e)
+            with self._cond:
+                self._inflight.difference_update(self.flight_key(f) for f in batch)
+                self.batches += 1
+                self.processed += len(batch)
+                if failed:
+                    self.failures += 1
+            if failed and self.error_backoff_s:
+                time.sleep(self.error_backoff_s)
+
+    def stats(self):
+        with self._cond:
+            return {"queued": len(self._pending), "inflight": len(self._inflight), "maxsize": self.maxsize,
+                    "submitted": self.submitted, "dropped": self.dropped, "processed": self.processed,
+                    "batches": self.batches, "failures": self.failures}
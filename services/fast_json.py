@@ -0,0 +1,54 @@
+"""
+Decodificador JSON rápido para respuestas grandes (OpenSky /states/all).
+
+Usa orjson o msgspec si están instalados y json de la biblioteca estándar en
+caso contrario; los tres devuelven los mismos dicts y listas. response_json()
+decodifica directamente los bytes de la respuesta: evita que requests
+decodifique primero a texto (y adivine la codificación) como hace r.json().
+
+Configuración por variables de entorno:
+- FAST_JSON_BACKEND: fuerza "orjson", "msgspec" o "stdlib" (auto por defecto)
+"""
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def _stdlib_loads(data):
+    return json.loads(data)
+
+
+def _load_backend(preferred=None):
+    candidates = [preferred] if preferred and preferred != "auto" else ["orjson", "msgspec", "stdlib"]
+    for name in candidates:
+        if name == "orjson":
+            try:
+                import orjson
+            except ImportError:
+                continue
+            return name, orjson.loads
+        if name == "msgspec":
+            try:
+                import msgspec
+            except ImportError:
+                continue
+            return name, msgspec.json.Decoder().decode
+        if name == "stdlib":
+            return name, _stdlib_loads
+    logger.warning("fast_json: backend '%s' no disponible; se usa json estándar", preferred)
+    return "stdlib", _stdlib_loads
+
+
+BACKEND, _loads = _load_backend(os.environ.get("FAST_JSON_BACKEND", "auto").strip().lower())
+
+
+def loads(data):
+    """Decodifica bytes o str a objetos de Python con el backend más rápido disponible."""
+    return _loads(data)
+
+
+def response_json(response):
+    """Equivalente a response.json() de requests, decodificando los bytes crudos."""
+    return _loads(response.content)
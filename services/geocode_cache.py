@@ -0,0 +1,169 @@
+"""
+Caché de geocodificación en dos niveles para call_geocode_address.
+
+1. TTLCache en memoria (LRU) por proceso.
+2. SQLite en disco compartido entre procesos y reinicios.
+
+Las consultas se normalizan (minúsculas, sin acentos ni puntuación, espacios
+colapsados) para que "Querétaro", "QUERETARO " y "queretaro." compartan
+entrada. Los números conservan signo y decimales: "19.4,-99.1" y
+"19.4, 99.1" son lugares distintos. Los resultados negativos (Nominatim no encontró nada) se guardan con
+un TTL más corto; los errores de red no se cachean. warm_up() precarga una
+lista de aeropuertos y ciudades (data/geocode_seed.json) sin caducidad.
+"""
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+from services.cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"-?\d+(?:\.\d+)?|[a-z0-9]+")
+
+
+def normalize_query(query):
+    text = unicodedata.normalize("NFKD", str(query)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(_TOKEN.findall(text.lower()))
+
+
+class GeocodeCache:
+    """
+    get(query) devuelve (True, (lat, lon) | None) si hay entrada vigente
+    (None = resultado negativo cacheado) o (False, None) si hay que consultar.
+    """
+
+    def __init__(self, db_path=None, maxsize=2048, ttl=30 * 86400, negative_ttl=3600):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = TTLCache(maxsize=maxsize)
+        self.db_path = str(db_path) if db_path else None
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.disk_hits = 0
+        self.negative_hits = 0
+        if self.db_path:
+            try:
+                Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5.0)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS geocode ("
+                    " key TEXT PRIMARY KEY, lat REAL, lon REAL, expires_at REAL, source TEXT)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("GeocodeCache: SQLite no disponible en %s (%s); solo caché en memoria", self.db_path, e)
+                self._db = None
+
+    def _memory_ttl(self, expires_at):
+        return None if expires_at is None else max(expires_at - time.time(), 0.0)
+
+    def get(self, query):
+        key = normalize_query(query)
+        if not key:
+            return False, None
+        value = self.memory.lookup(key)
+        if value is not MISSING:
+            if value is None:
+                self.negative_hits += 1
+            return True, value
+        if self._db is None:
+            return False, None
+        try:
+            with self._db_lock:
+                row = self._db.execute("SELECT lat, lon, expires_at FROM geocode WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("GeocodeCache: lectura fallida para '%s': %s", key, e)
+            return False, None
+        if row is None:
+            return False, None
+        lat, lon, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return False, None
+        coords = (lat, lon) if lat is not None and lon is not None else None
+        self.disk_hits += 1
+        if coords is None:
+            self.negative_hits += 1
+        self.memory.set(key, coords, ttl=self._memory_ttl(expires_at))
+        return True, coords
+
+    def set(self, query, coords, ttl=MISSING, source="nominatim"):
+        """Guarda coords (o None como resultado negativo) en ambos niveles."""
+        key = normalize_query(query)
+        if not key:
+            return
+        if ttl is MISSING:
+            ttl = self.ttl if coords is not None else self.negative_ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        coords = (float(coords[0]), float(coords[1])) if coords is not None else None
+        self.memory.set(key, coords, ttl=ttl)
+        if self._db is None:
+            return
+        lat, lon = coords if coords is not None else (None, None)
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO geocode (key, lat, lon, expires_at, source) VALUES (?, ?, ?, ?, ?)",
+                    (key, lat, lon, expires_at, source),
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("GeocodeCache: escritura fallida para '%s': %s", key, e)
+
+    def warm_up(self, seed_path):
+        """
+        Precarga entradas sin caducidad desde un JSON [{"names": [...], "lat": .., "lon": ..}, ...].
+        Devuelve el número de claves cargadas.
+        """
+        try:
+            with open(seed_path, "r", encoding="utf-8") as f:
+                seed = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("GeocodeCache: no se pudo leer la semilla %s: %s", seed_path, e)
+            return 0
+        rows = []
+        for item in seed:
+            try:
+                lat, lon = float(item["lat"]), float(item["lon"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            for name in item.get("names", []):
+                key = normalize_query(name)
+                if key:
+                    self.memory.set(key, (lat, lon), ttl=None)
+                    rows.append((key, lat, lon, None, "seed"))
+        if self._db is not None and rows:
+            try:
+                with self._db_lock:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO geocode (key, lat, lon, expires_at, source) VALUES (?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("GeocodeCache: carga de semilla fallida: %s", e)
+        logger.info("GeocodeCache: %d nombres precargados desde %s", len(rows), seed_path)
+        return len(rows)
+
+    def stats(self):
+        stats = {"memory": self.memory.stats(), "disk_hits": self.disk_hits, "negative_hits": self.negative_hits,
+                 "db_path": self.db_path if self._db is not None else None}
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    stats["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+            except sqlite3.Error:
+                pass
+        return stats
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
@@ -0,0 +1,199 @@
+"""
+Histórico de vectores de estado del colector (SQLite en modo WAL).
+
+Cada día UTC es una tabla propia (`states_YYYYMMDD`), de modo que:
+- las inserciones siempre van al final de la partición del día, en una sola
+  transacción por sondeo (executemany);
+- la retención borra días completos con DROP TABLE, sin DELETE fila a fila
+  ni índices fragmentados, y el espacio se devuelve con incremental_vacuum;
+- las consultas por rango de tiempo solo abren las particiones del rango.
+
+Cada partición tiene índices por (icao24, ts) para trayectorias y por ts para
+rangos de tiempo. Las lecturas usan conexiones propias de solo lectura: en
+WAL no bloquean al escritor, aunque este sea otro proceso (el colector).
+
+Las filas conservan los nombres del documento del colector (latitud,
+altitud, tipo, fecha_captura...), que es lo que espera
+GeminiService.predict_pattern().
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("fecha_captura", "icao24", "callsign", "pais_origen", "latitud", "longitud",
+           "altitud", "velocidad", "direccion", "tipo")
+_PARTITION = re.compile(r"^states_(\d{8})$")
+_DAY = 86400
+
+
+def partition_name(ts):
+    """Tabla del día UTC de `ts` (epoch en segundos)."""
+    return "states_" + datetime.fromtimestamp(int(ts), timezone.utc).strftime("%Y%m%d")
+
+
+def _partition_start(name):
+    day = datetime.strptime(_PARTITION.match(name).group(1), "%Y%m%d").replace(tzinfo=timezone.utc)
+    return int(day.timestamp())
+
+
+class HistoryStore:
+    """append_snapshot() desde el colector; query()/track() para leer rangos de tiempo."""
+
+    def __init__(self, db_path, retention_days=28, retention_check_s=3600):
+        self.db_path = str(db_path)
+        self.retention_days = float(retention_days)
+        self.retention_check_s = float(retention_check_s)
+        self._lock = threading.Lock()
+        self._partitions = set()
+        self._next_retention = 0.0
+        self.rows_written = 0
+        self.snapshots_written = 0
+        self.partitions_dropped = 0
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10.0)
+        # auto_vacuum solo tiene efecto en una base nueva (antes de crear tablas)
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # En WAL, synchronous=NORMAL no corrompe la base; como mucho pierde el último sondeo
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._partitions.update(self.partitions())
+
+    def partitions(self, db=None):
+        """Nombres de las particiones existentes, de la más antigua a la más reciente."""
+        rows = (db or self._db).execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'states_%'").fetchall()
+        return sorted(name for (name,) in rows if _PARTITION.match(name))
+
+    def _ensure_partition(self, name):
+        if name in self._partitions:
+            return
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} ("
+            " fecha_captura INTEGER NOT NULL, icao24 TEXT NOT NULL, callsign TEXT, pais_origen TEXT,"
+            " latitud REAL, longitud REAL, altitud REAL, velocidad REAL, direccion REAL, tipo TEXT)"
+        )
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {name}_icao_ts ON {name} (icao24, fecha_captura)")
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {name}_ts ON {name} (fecha_captura)")
+        self._partitions.add(name)
+
+    def append_snapshot(self, ts, rows):
+        """
+        Inserta un sondeo completo en una transacción. `rows` son tuplas en el
+        orden de COLUMNS sin fecha_captura (icao24, callsign, ..., tipo).
+        """
+        ts = int(ts)
+        name = partition_name(ts)
+        count = 0
+        with self._lock:
+            try:
+                with self._db:
+                    self._ensure_partition(name)
+                    cur = self._db.executemany(
+                        f"INSERT INTO {name} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                        ((ts, *row) for row in rows),
+                    )
+                    count = cur.rowcount
+            except sqlite3.Error as e:
+                # Si la tabla se borró desde otro proceso se vuelve a crear en el siguiente sondeo
+                self._partitions.discard(name)
+                logger.warning("HistoryStore: escritura fallida en %s: %s", name, e)
+                return 0
+            self.rows_written += count
+            self.snapshots_written += 1
+        if time.monotonic() >= self._next_retention:
+            self.enforce_retention()
+        return count
+
+    def enforce_retention(self, now=None):
+        """Borra las particiones de días completos más antiguos que retention_days y compacta."""
+        self._next_retention = time.monotonic() + self.retention_check_s
+        if self.retention_days <= 0:
+            return []
+        cutoff = (now if now is not None else time.time()) - self.retention_days * _DAY
+        dropped = []
+        with self._lock:
+            try:
+                for name in self.partitions():
+                    if _partition_start(name) + _DAY <= cutoff:
+                        self._db.execute(f"DROP TABLE IF EXISTS {name}")
+                        self._partitions.discard(name)
+                        dropped.append(name)
+                if dropped:
+                    self._db.commit()
+                    # execute() solo avanza un paso (una página); executescript lo ejecuta completo
+                    self._db.executescript("PRAGMA incremental_vacuum")
+                    self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                logger.warning("HistoryStore: retención fallida: %s", e)
+        if dropped:
+            self.partitions_dropped += len(dropped)
+            logger.info("HistoryStore: %d particiones borradas (%s)", len(dropped), ", ".join(dropped))
+        return dropped
+
+    def _reader(self):
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=10.0)
+
+    def _partitions_between(self, db, start, end):
+        return [name for name in self.partitions(db)
+                if _partition_start(name) <= end and _partition_start(name) + _DAY > start]
+
+    def query(self, start, end, icao24=None, bbox=None, by_aircraft=False, batch_size=5000):
+        """
+        Genera las filas (tuplas en el orden de COLUMNS) con start <= fecha_captura <= end,
+        ordenadas por tiempo (por aeronave y tiempo si `icao24` o `by_aircraft`;
+        en ese caso el orden es dentro de cada partición diaria).
+        `bbox` = (lat_min, lon_min, lat_max, lon_max).
+        Lee de a `batch_size` filas: no carga el rango completo en memoria.
+        """
+        start, end = int(start), int(end)
+        where = ["fecha_captura BETWEEN ? AND ?"]
+        params = [start, end]
+        if icao24:
+            where.append("icao24 = ?")
+            params.append(str(icao24).strip().lower())
+        if bbox:
+            lat_min, lon_min, lat_max, lon_max = bbox
+            where.append("latitud BETWEEN ? AND ? AND longitud BETWEEN ? AND ?")
+            params.extend([lat_min, lat_max, lon_min, lon_max])
+        order = "icao24, fecha_captura" if icao24 or by_aircraft else "fecha_captura"
+        db = self._reader()
+        try:
+            for name in self._partitions_between(db, start, end):
+                cur = db.execute(f"SELECT {', '.join(COLUMNS)} FROM {name} WHERE {' AND '.join(where)} ORDER BY {order}", params)
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+        finally:
+            db.close()
+
+    def track(self, icao24, start, end):
+        """Posiciones de una aeronave en el rango, como dicts del colector."""
+        return [dict(zip(COLUMNS, row)) for row in self.query(start, end, icao24=icao24)]
+
+    def documents(self, start, end, limit=None):
+        """Filas del rango como dicts del colector (entrada de GeminiService.predict_pattern)."""
+        out = []
+        for row in self.query(start, end):
+            out.append(dict(zip(COLUMNS, row)))
+            if limit and len(out) >= limit:
+                break
+        return out
+
+    def stats(self):
+        with self._lock:
+            parts = self.partitions()
+        return {"db_path": self.db_path, "partitions": len(parts),
+                "oldest": parts[0] if parts else None, "newest": parts[-1] if parts else None,
+                "rows_written": self.rows_written, "snapshots_written": self.snapshots_written,
+                "partitions_dropped": self.partitions_dropped, "retention_days": self.retention_days}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
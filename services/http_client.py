@@ -0,0 +1,245 @@
+"""
+Transporte HTTP compartido para todas las llamadas salientes.
+
+Una requests.Session por host (keep-alive y pool de conexiones propio),
+reintentos con backoff exponencial y jitter para errores de conexión y 5xx,
+y timeouts por host. Los hosts con RateLimiter (set_rate_limit) no usan los
+reintentos de urllib3: HttpClient reintenta él mismo y pide turno al
+limitador antes de cada intento, de modo que los reintentos también
+respetan la tasa. stats() informa cuántas peticiones reutilizaron una
+conexión abierta en lugar de abrir una nueva (TCP + TLS).
+
+Configuración por variables de entorno:
+- HTTP_POOL_MAXSIZE: conexiones por host (10)
+- HTTP_RETRIES: reintentos por petición (2)
+- HTTP_BACKOFF: factor de backoff en segundos (0.3)
+- HTTP_BACKOFF_JITTER: jitter aleatorio máximo en segundos (0.3)
+"""
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Timeouts (conexión, lectura) en segundos por host; DEFAULT_TIMEOUT para el resto
+DEFAULT_TIMEOUT = (5.0, 15.0)
+HOST_TIMEOUTS = {
+    "opensky-network.org": (5.0, 15.0),
+    "auth.opensky-network.org": (5.0, 10.0),
+    "nominatim.openstreetmap.org": (3.0, 8.0),
+    "api.elevenlabs.io": (5.0, 10.0),
+    "127.0.0.1": (1.0, 6.0),
+    "localhost": (1.0, 6.0),
+}
+# 429 no se reintenta: insistir contra un límite de tasa solo lo empeora
+RETRY_STATUS = (500, 502, 503, 504)
+
+
+def _build_retry(retries, backoff_factor, backoff_jitter):
+    kwargs = dict(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS,
+        # Sin raise_on_status: tras agotar reintentos se devuelve la respuesta y el llamador decide
+        raise_on_status=False,
+    )
+    try:
+        return Retry(backoff_jitter=backoff_jitter, **kwargs)
+    except TypeError:
+        # urllib3 < 2 no soporta backoff_jitter
+        return Retry(**kwargs)
+
+
+class RateLimiter:
+    """
+    Limitador de tasa global (por proceso) con reservas: cada acquire() reserva
+    el siguiente hueco libre y duerme fuera del lock hasta que llega, así que
+    varios hilos quedan espaciados 1/rate segundos sin serializar el resto.
+    """
+
+    def __init__(self, rate_per_s):
+        self.interval = 1.0 / float(rate_per_s) if rate_per_s and float(rate_per_s) > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited_s = 0.0
+
+    def acquire(self):
+        if self.interval <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+            wait = slot - now
+            self.acquired += 1
+            self.waited_s += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def stats(self):
+        return {"rate_per_s": round(1.0 / self.interval, 3) if self.interval else None,
+                "acquired": self.acquired, "waited_s": round(self.waited_s, 3)}
+
+
+class HttpClient:
+    """Sesiones por host con pool, reintentos y métricas de reutilización de conexiones."""
+
+    def __init__(self, pool_maxsize=10, retries=2, backoff_factor=0.3, backoff_jitter=0.3, timeouts=None):
+        self.pool_maxsize = int(pool_maxsize)
+        self.retries = int(retries)
+        self.backoff_factor = float(backoff_factor)
+        self.backoff_jitter = float(backoff_jitter)
+        self.timeouts = dict(HOST_TIMEOUTS if timeouts is None else timeouts)
+        self._sessions = {}
+        self._counters = {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def set_rate_limit(self, host, limiter):
+        """Aplica `limiter` (RateLimiter) a cada intento contra `host`, reintentos incluidos."""
+        with self._lock:
+            self._limiters[host] = limiter
+            # La sesión se recrea sin reintentos de urllib3 (no pasarían por el limitador)
+            session = self._sessions.pop(host, None)
+        if session is not None:
+            session.close()
+
+    def _new_session(self, host):
+        session = requests.Session()
+        limited = host in self._limiters
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0 if limited else _build_retry(self.retries, self.backoff_factor, self.backoff_jitter),
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def session_for(self, url):
+        host = urlsplit(url).hostname or ""
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._sessions[host] = self._new_session(host)
+                self._counters.setdefault(host, {"requests": 0, "errors": 0, "retries": 0})
+        return host, session
+
+    def timeout_for(self, host):
+        return self.timeouts.get(host, DEFAULT_TIMEOUT)
+
+    def _backoff(self, attempt):
+        time.sleep(self.backoff_factor * (2 ** attempt) + random.uniform(0, self.backoff_jitter))
+
+    def _limited_request(self, limiter, session, counters, method, url, timeout, **kwargs):
+        """Mismos reintentos que Retry (conexión y 5xx), cada intento con su turno del limitador."""
+        idempotent = method.upper() in Retry.DEFAULT_ALLOWED_METHODS
+        attempts = self.retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            limiter.acquire()
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    raise
+            else:
+                if last or response.status_code not in RETRY_STATUS:
+                    return response
+                response.close()
+            with self._lock:
+                counters["retries"] += 1
+            self._backoff(attempt)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        host, session = self.session_for(url)
+        counters = self._counters[host]
+        limiter = self._limiters.get(host)
+        if limiter is not None:
+            try:
+                response = self._limited_request(limiter, session, counters, method, url,
+                                                 timeout or self.timeout_for(host), **kwargs)
+            except requests.RequestException:
+                with self._lock:
+                    counters["requests"] += 1
+                    counters["errors"] += 1
+                raise
+            with self._lock:
+                counters["requests"] += 1
+                if response.status_code >= 400:
+                    counters["errors"] += 1
+            return response
+        try:
+            response = session.request(method, url, timeout=timeout or self.timeout_for(host), **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                counters["requests"] += 1
+                counters["errors"] += 1
+            raise
+        retries = getattr(getattr(response.raw, "retries", None), "history", ()) or ()
+        with self._lock:
+            counters["requests"] += 1
+            counters["retries"] += len(retries)
+            if response.status_code >= 400:
+                counters["errors"] += 1
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """
+        Por host: peticiones, errores, reintentos, conexiones abiertas (nuevas)
+        según los pools de urllib3 y la tasa de reutilización resultante.
+        """
+        with self._lock:
+            hosts = list(self._sessions.items())
+            counters = {h: dict(c) for h, c in self._counters.items()}
+        result = {}
+        for host, session in hosts:
+            new_connections = 0
+            pool_requests = 0
+            for adapter in {id(a): a for a in session.adapters.values()}.values():
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is not None:
+                        new_connections += pool.num_connections
+                        pool_requests += pool.num_requests
+            entry = counters.get(host, {})
+            entry["connections_opened"] = new_connections
+            entry["pool_requests"] = pool_requests
+            entry["reuse_rate"] = round(1 - new_connections / pool_requests, 3) if pool_requests else None
+            result[host] = entry
+        return result
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+# Cliente compartido por el proceso (app, colector y clientes de servicios)
+http_client = HttpClient(
+    pool_maxsize=os.environ.get("HTTP_POOL_MAXSIZE", "10"),
+    retries=os.environ.get("HTTP_RETRIES", "2"),
+    backoff_factor=os.environ.get("HTTP_BACKOFF", "0.3"),
+    backoff_jitter=os.environ.get("HTTP_BACKOFF_JITTER", "0.3"),
+)
@@ -30,6 +30,9 @@ from datetime import datetime
 
 import requests
 
+from services.fast_json import response_json
+from services.http_client import http_client
+
 logger = logging.getLogger("opensky_api")
 logger.addHandler(logging.NullHandler())
 
@@ -88,21 +91,98 @@ class StateVector(object):
         "category",
     ]
 
-    # We are not using namedtuple here as state vectors from the server might be extended; zip() will ignore additional
-    #  entries in this case
+    # We are not using namedtuple here as state vectors from the server might be extended or shortened: the vector
+    #  wraps the array as received (no copy, no per-instance __dict__) and fields beyond its length read as None.
+    #  Setting an attribute therefore writes into that array (the raw ``states`` row of the API response, shared
+    #  with every other StateVector over it); wrap ``list(arr)`` to modify a private copy.
+    __slots__ = ("_arr",)
+
     def __init__(self, arr):
         """
         Initializes the StateVector object.
 
-        :param list arr: the array representation of a state vector as received by the API.
+        :param list arr: the array representation of a state vector as received by the API. It is not copied:
+            attribute assignments modify it in place.
         """
-        self.__dict__ = dict(zip(StateVector.keys, arr))
+        self._arr = arr
+
+    def as_dict(self):
+        """Returns the fields of this state vector as a new dict."""
+        return dict(zip(StateVector.keys, self._arr))
 
     def __repr__(self):
-        return "StateVector(%s)" % repr(self.__dict__.values())
+        return "StateVector(%s)" % repr(self.as_dict().values())
 
     def __str__(self):
-        return pprint.pformat(self.__dict__, indent=4)
+        return pprint.pformat(self.as_dict(), indent=4)
+
+
+class _StateField(object):
+    """Descriptor mapping a StateVector attribute to a position of the wrapped array."""
+
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        arr = obj._arr
+        return arr[self.index] if self.index < len(arr) else None
+
+    def __set__(self, obj, value):
+        arr = obj._arr
+        if not isinstance(arr, list):
+            arr = obj._arr = list(arr)
+        if self.index >= len(arr):
+            arr.extend([None] * (self.index + 1 - len(arr)))
+        arr[self.index] = value
+
+
+for _index, _key in enumerate(StateVector.keys):
+    setattr(StateVector, _key, _StateField(_index))
+del _index, _key
+
+
+class StateVectors(object):
+    """Read-only sequence of `StateVector` over the raw ``states`` array of an API response.
+
+    Rows are wrapped on access instead of up front, so building an `OpenSkyStates` costs O(1) regardless of the
+    number of aircraft. `iter_view()` iterates without allocating: it yields the same `StateVector`, re-pointed at
+    each row, so it must not be kept across iterations.
+    """
+
+    __slots__ = ("_rows",)
+
+    def __init__(self, rows):
+        self._rows = rows if rows is not None else []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [StateVector(a) for a in self._rows[index]]
+        return StateVector(self._rows[index])
+
+    def __iter__(self):
+        for a in self._rows:
+            yield StateVector(a)
+
+    def iter_view(self):
+        view = StateVector(None)
+        for a in self._rows:
+            view._arr = a
+            yield view
+
+    @property
+    def raw(self):
+        """The underlying list of arrays as received from the API."""
+        return self._rows
+
+    def __repr__(self):
+        return "<StateVectors n=%d>" % len(self._rows)
 
 
 class OpenSkyStates(object):
@@ -110,7 +190,7 @@ class OpenSkyStates(object):
 
     |  **time**: `int` - in seconds since epoch (Unix time stamp). Gives the validity period of all states.
       All vectors represent the state of a vehicle with the interval :math:`[time - 1, time]`.
-    |  **states**: `list` [`StateVector`] - a list of `StateVector` or is None if there have been no states received.
+    |  **states**: `StateVectors` - a lazy sequence of `StateVector` (empty if there have been no states received).
     """
 
     def __init__(self, states_dict):
@@ -121,10 +201,7 @@ class OpenSkyStates(object):
             at a particular time.
         """
         self.__dict__ = states_dict
-        if self.states is not None:
-            self.states = [StateVector(a) for a in self.states]
-        else:
-            self.states = []
+        self.states = StateVectors(self.__dict__.get("states"))
 
     def __repr__(self):
         return "<OpenSkyStates@%s>" % str(self.__dict__)
@@ -285,15 +362,14 @@ class OpenSkyApi(object):
         :param dict params: request parameters.
         :rtype: dict|None
         """
-        r = requests.get(
+        r = http_client.get(
             "{0:s}{1:s}".format(self._api_url, url_post),
             auth=self._auth,
             params=params,
-            timeout=15.00,
         )
         if r.status_code == 200:
             self._last_requests[callee] = time.time()
-            return r.json()
+            return response_json(r)
         else:
             logger.debug(
                 "Response not OK. Status {0:d} - {1:s}".format(r.status_code, r.reason)
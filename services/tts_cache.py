@@ -0,0 +1,212 @@
+"""
+Caché de audio TTS direccionada por contenido.
+
+La clave es sha256 del texto y de todos los parámetros que cambian el audio
+(voz, modelo, formato, stability, ...), así que la misma frase con la misma
+voz se sintetiza una sola vez. Los MP3 se guardan en disco como
+static/audio/tts_<clave>.mp3 (servibles tal cual como estáticos) con un tope
+de tamaño total; al superarlo se borran los menos usados (LRU por mtime, que
+sobrevive a reinicios).
+
+get_or_synthesize() evita que dos hilos sinteticen a la vez la misma frase;
+begin_synthesis()/end_synthesis() dan la misma garantía a quien sintetiza
+por fragmentos (streaming) en lugar de en una sola llamada.
+
+Configuración por variables de entorno:
+- TTS_CACHE_DIR: carpeta de los MP3 (static/audio)
+- TTS_CACHE_MAX_MB: tamaño máximo en MB (200)
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+FILE_PREFIX = "tts_"
+
+
+def tts_cache_key(text, voice_id, model_id, output_format=None, **settings):
+    """Hash estable del texto y los parámetros de síntesis (settings: stability, similarity_boost, ...)."""
+    payload = {
+        "text": " ".join(str(text).split()),
+        "voice_id": voice_id,
+        "model_id": model_id,
+        "output_format": output_format,
+        "settings": {k: v for k, v in sorted(settings.items()) if v is not None},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """MP3 en `folder` acotados a `max_bytes`; las claves vienen de tts_cache_key()."""
+
+    def __init__(self, folder="static/audio", max_bytes=200 * 1024 * 1024, url_prefix="/static/audio"):
+        self.folder = Path(folder)
+        self.max_bytes = int(max_bytes)
+        self.url_prefix = url_prefix.rstrip("/")
+        self._index = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.synthesized = 0
+        try:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            files = sorted(self.folder.glob(f"{FILE_PREFIX}*.mp3"), key=lambda p: p.stat().st_mtime)
+        except OSError as e:
+            logger.warning("TTSCache: carpeta %s no disponible: %s", self.folder, e)
+            files = []
+        for path in files:
+            size = path.stat().st_size
+            self._index[path.stem[len(FILE_PREFIX):]] = size
+            self.total_bytes += size
+
+    def path_for(self, key):
+        return self.folder / f"{FILE_PREFIX}{key}.mp3"
+
+    def url_for(self, key):
+        return f"{self.url_prefix}/{FILE_PREFIX}{key}.mp3"
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._index
+
+    def get(self, key):
+        """Bytes del audio cacheado o None; marca la entrada como usada recientemente."""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+        path = self.path_for(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path, None)
+        except OSError:
+            # Borrado por fuera (otro proceso o limpieza manual)
+            with self._lock:
+                size = self._index.pop(key, None)
+                if size is not None:
+                    self.total_bytes -= size
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        if not data or self.max_bytes <= 0:
+            return
+        path = self.path_for(key)
+        tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("TTSCache: no se pudo guardar %s: %s", path, e)
+            return
+        with self._lock:
+            self.total_bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            victims = []
+            while self.total_bytes > self.max_bytes and len(self._index) > 1:
+                old_key, size = self._index.popitem(last=False)
+                self.total_bytes -= size
+                self.evictions += 1
+                victims.append(old_key)
+        for old_key in victims:
+            try:
+                self.path_for(old_key).unlink()
+            except OSError:
+                pass
+
+    def get_or_synthesize(self, key, synthesize):
+        """
+        Devuelve el audio de `key`, llamando a synthesize() -> bytes | None solo
+        si no está en caché. Los hilos que piden la misma clave a la vez
+        esperan a la primera síntesis en lugar de repetirla. None no se cachea.
+        """
+        data = self.get(key)
+        if data is not None:
+            return data
+        event = self.begin_synthesis(key)
+        if event is not None:
+            event.wait()
+            return self.get(key)
+        data = None
+        try:
+            data = synthesize()
+            return data
+        finally:
+            self.end_synthesis(key, data)
+
+    def begin_synthesis(self, key):
+        """
+        Reserva la síntesis de `key`. Devuelve None si el llamador queda como
+        dueño (debe llamar a end_synthesis) o el Event de la síntesis en curso
+        de otro hilo, que se activa al terminar (con o sin éxito).
+        """
+        with self._lock:
+            event = self._inflight.get(key)
+            if event is not None:
+                return event
+            self._inflight[key] = threading.Event()
+            return None
+
+    def end_synthesis(self, key, data=None):
+        """Libera la reserva de begin_synthesis(); guarda `data` si hay audio."""
+        try:
+            if data:
+                self.synthesized += 1
+                self.put(key, data)
+        finally:
+            with self._lock:
+                event = self._inflight.pop(key, None)
+            if event is not None:
+                event.set()
+
+    def presynthesize(self, items, synthesize):
+        """
+        Precarga frases fijas: items es [(clave, texto)] y synthesize(texto)
+        devuelve bytes. Devuelve cuántas se sintetizaron (las ya cacheadas no cuentan).
+        """
+        started = time.monotonic()
+        done = 0
+        for key, text in items:
+            if key in self:
+                continue
+            try:
+                if self.get_or_synthesize(key, lambda t=text: synthesize(t)):
+                    done += 1
+            except Exception as e:
+                logger.warning("TTSCache: presíntesis fallida para '%s': %s", str(text)[:40], e)
+        logger.info("TTSCache: %d frases presintetizadas en %.1f s", done, time.monotonic() - started)
+        return done
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "files": len(self._index),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "synthesized": self.synthesized,
+            }
+
+
+# Caché compartida por el proceso (app y servicios de ElevenLabs)
+tts_cache = TTSCache(
+    folder=os.environ.get("TTS_CACHE_DIR", "static/audio"),
+    max_bytes=float(os.environ.get("TTS_CACHE_MAX_MB", "200")) * 1024 * 1024,
+)
@@ -0,0 +1,122 @@
+"""
+Decodificación columnar de los vectores de estado de OpenSky (/states/all).
+
+La respuesta trae `states` como lista de filas de 17 (o 18) campos. En lugar
+de recorrer fila a fila con comprobaciones de longitud y float() dentro de
+try, decode_states() extrae cada columna pedida de una vez y la convierte con
+una sola llamada a NumPy: los valores faltantes (None) quedan como NaN. Las
+columnas de texto son arrays de objetos str ("" si falta) y las banderas
+arrays bool.
+
+StateColumns.valid_position() y take() permiten filtrar con máscaras antes
+de construir registros, y column_list() devuelve una columna como lista de
+Python con None en lugar de NaN, lista para armar los dicts de la API.
+"""
+import numpy as np
+
+from geo import to_float_array
+
+# Índices de campo de un vector de estado de OpenSky
+ICAO24, CALLSIGN, ORIGIN_COUNTRY, TIME_POSITION, LAST_CONTACT, LONGITUDE, LATITUDE, BARO_ALTITUDE, \
+    ON_GROUND, VELOCITY, TRUE_TRACK, VERTICAL_RATE, SENSORS, GEO_ALTITUDE, SQUAWK, SPI, POSITION_SOURCE = range(17)
+N_FIELDS = 17
+
+FLOAT_COLUMNS = {
+    "time_position": TIME_POSITION,
+    "last_contact": LAST_CONTACT,
+    "lon": LONGITUDE,
+    "lat": LATITUDE,
+    "baro_altitude": BARO_ALTITUDE,
+    "velocity": VELOCITY,
+    "true_track": TRUE_TRACK,
+    "vertical_rate": VERTICAL_RATE,
+    "geo_altitude": GEO_ALTITUDE,
+}
+TEXT_COLUMNS = {"icao24": ICAO24, "callsign": CALLSIGN, "origin_country": ORIGIN_COUNTRY, "squawk": SQUAWK}
+BOOL_COLUMNS = {"on_ground": ON_GROUND, "spi": SPI}
+INT_COLUMNS = {"position_source": POSITION_SOURCE}
+ALL_COLUMNS = tuple(FLOAT_COLUMNS) + tuple(TEXT_COLUMNS) + tuple(BOOL_COLUMNS) + tuple(INT_COLUMNS)
+# Columnas que usan el monitor de vuelos y el colector
+POSITION_COLUMNS = ("icao24", "callsign", "origin_country", "lat", "lon", "baro_altitude", "velocity", "true_track")
+
+
+def _float_column(values):
+    try:
+        # None -> NaN en la conversión de NumPy; todo ocurre en C
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        # Algún valor no numérico (p. ej. texto): conversión elemento a elemento
+        return to_float_array(values)
+
+
+def _text_column(values, strip=False):
+    if strip:
+        values = [v.strip() if isinstance(v, str) else "" for v in values]
+    elif None in values:
+        values = ["" if v is None else v for v in values]
+    out = np.empty(len(values), dtype=object)
+    out[:] = values
+    return out
+
+
+def _column(rows, idx, complete):
+    if complete:
+        return [r[idx] for r in rows]
+    return [r[idx] if len(r) > idx else None for r in rows]
+
+
+class StateColumns:
+    """Columnas decodificadas (`fields`) de un lote de vectores de estado, todas de la misma longitud."""
+
+    __slots__ = ("fields", "size") + ALL_COLUMNS
+
+    def __len__(self):
+        return self.size
+
+    def valid_position(self):
+        """Máscara de filas con latitud y longitud numéricas."""
+        return ~(np.isnan(self.lat) | np.isnan(self.lon))
+
+    def take(self, index):
+        """Nuevas columnas con las filas de una máscara bool o lista de índices."""
+        out = StateColumns.__new__(StateColumns)
+        out.fields = self.fields
+        for name in self.fields:
+            setattr(out, name, getattr(self, name)[index])
+        out.size = len(getattr(out, self.fields[0])) if self.fields else 0
+        return out
+
+    def column_list(self, name):
+        """Columna como lista de Python con None en lugar de NaN."""
+        values = getattr(self, name)
+        if values.dtype.kind == "f":
+            return np.where(np.isnan(values), None, values).tolist()
+        return values.tolist()
+
+
+def decode_states(states, fields=ALL_COLUMNS):
+    """
+    Convierte la lista `states` de OpenSky en StateColumns con las columnas
+    `fields` (NaN / "" / False / -1 para lo que falta o no es válido).
+    """
+    rows = states or []
+    # Las filas cortas (campos opcionales ausentes) obligan a comprobar la longitud
+    complete = not rows or min(map(len, rows)) >= N_FIELDS
+    out = StateColumns.__new__(StateColumns)
+    out.fields = tuple(fields)
+    out.size = len(rows)
+    for name in out.fields:
+        if name in FLOAT_COLUMNS:
+            value = _float_column(_column(rows, FLOAT_COLUMNS[name], complete))
+        elif name in TEXT_COLUMNS:
+            idx = TEXT_COLUMNS[name]
+            value = _text_column(_column(rows, idx, complete), strip=(idx == CALLSIGN))
+        elif name in BOOL_COLUMNS:
+            value = np.array([bool(v) for v in _column(rows, BOOL_COLUMNS[name], complete)], dtype=bool)
+        elif name in INT_COLUMNS:
+            raw = _float_column(_column(rows, INT_COLUMNS[name], complete))
+            value = np.where(np.isnan(raw), -1, raw).astype(np.int8)
+        else:
+            raise ValueError(f"Columna desconocida: {name}")
+        setattr(out, name, value)
+    return out
@@ -0,0 +1,87 @@
+import tempfile
+import threading
+import types
+import unittest
+from unittest import mock
+
+import app
+from services.tts_cache import TTSCache
+
+
+class FakeTTS:
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def convert(self, text, **kwargs):
+        self.calls += 1
+        for i in range(3):
+            yield f"chunk{i}|".encode()
+            self.started.set()
+            self.release.wait(5)
+
+
+class TestAudioStream(unittest.TestCase):
+    def setUp(self):
+        app.audio_streams.clear()
+        self.tts = FakeTTS()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for patcher in (mock.patch.object(app, "ELEVENLABS_CLIENT", types.SimpleNamespace(text_to_speech=self.tts)),
+                        mock.patch.object(app, "tts_cache", TTSCache(tmp.name))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app.app.test_client()
+
+    def test_url_streams_then_replays_from_cache(self):
+        url = app.register_alert_audio("ALERTA: prueba")
+        self.assertTrue(url.startswith("/api/audio/"))
+        self.assertEqual(self.tts.calls, 0)
+        first = self.client.get(url)
+        self.assertEqual(first.mimetype, "audio/mpeg")
+        self.assertEqual(first.data, b"chunk0|chunk1|chunk2|")
+        second = self.client.get(url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(self.tts.calls, 1)
+        # Ya cacheada: la misma frase apunta directamente al MP3 estático
+        self.assertTrue(app.register_alert_audio("ALERTA: prueba").startswith("/static/audio/tts_"))
+
+    def test_concurrent_clients_share_one_synthesis(self):
+        url = app.register_alert_audio("ALERTA: broadcast")
+        self.tts.release.clear()
+        results = []
+
+        def fetch():
+            results.append(app.app.test_client().get(url).data)
+
+        threads = [threading.Thread(target=fetch) for _ in range(3)]
+        threads[0].start()
+        self.assertTrue(self.tts.started.wait(5))
+        for t in threads[1:]:
+            t.start()
+        self.tts.release.set()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(results, [b"chunk0|chunk1|chunk2|"] * 3)
+        self.assertEqual(self.tts.calls, 1)
+
+    def test_disconnected_owner_still_fills_cache(self):
+        url = app.register_alert_audio("ALERTA: desconexion")
+        response = self.client.get(url, buffered=False)
+        response.close()
+        key = url.rsplit("/", 1)[-1]
+        self.assertEqual(app.tts_cache.get(key), b"chunk0|chunk1|chunk2|")
+        self.assertEqual(self.tts.calls, 1)
+
+    def test_unknown_token(self):
+        self.assertEqual(self.client.get("/api/audio/nope").status_code, 404)
+
+    def test_critical_route_returns_url_only(self):
+        futures = app.start_route_ai({}, 900, True, False)
+        self.assertTrue(futures["audio"].result(timeout=1).startswith("/api/audio/"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import app
+from services.classification_cache import ClassificationCache, ClassificationQueue, callsign_prefix
+
+
+class TestClassificationCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = os.path.join(self.tmp.name, "cls.sqlite3")
+
+    def test_prefix(self):
+        self.assertEqual(callsign_prefix("fdx123 "), "FDX")
+        self.assertIsNone(callsign_prefix("N123AB"))
+        self.assertIsNone(callsign_prefix(None))
+
+    def test_icao_then_prefix_and_persistence(self):
+        cache = ClassificationCache(self.db)
+        cache.store("abc123", "FDX901", "carga", 0.95, "FedEx")
+        cache.store("def456", "XYZ100", "comercial", 0.6)
+        self.assertEqual(cache.lookup("ABC123", None)["source"], "icao")
+        # Operador conocido con confianza alta: aeronave nueva resuelta por prefijo
+        self.assertEqual(cache.lookup("fff000", "FDX17")["type"], "carga")
+        self.assertIsNone(cache.lookup("eee000", "XYZ200"))
+        cache.close()
+        reopened = ClassificationCache(self.db)
+        self.assertEqual(reopened.lookup("abc123", "FDX901")["operator_name"], "FedEx")
+        reopened.close()
+
+    def test_low_confidence_expires_sooner(self):
+        cache = ClassificationCache(None, ttl=100, low_confidence_ttl=0)
+        cache.store("abc123", None, "carga", 0.2)
+        self.assertIsNone(cache.lookup("abc123", None))
+
+
+class TestBatchValidation(unittest.TestCase):
+    def test_only_unseen_flights_are_sent_in_chunks(self):
+        calls = []
+
+        def fake_batch(batch, api_key):
+            calls.append(len(batch))
+            return [{"index": i, "type": "comercial", "confidence": 0.7, "operator_name": "X"} for i in range(len(batch))]
+
+        flights = [{"icao24": f"t{i:05d}", "callsign": f"N{i}"} for i in range(45)]
+        with mock.patch.object(app, "classification_cache", ClassificationCache(None)), \
+                mock.patch.object(app, "gemini_classify_batch", fake_batch), \
+                mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "test"}):
+            first = app.validate_flights_batch_with_gemini(flights)
+            self.assertEqual(calls, [20, 20, 5])
+            self.assertTrue(all(f["verified"] for f in first))
+            second = app.validate_flights_batch_with_gemini(flights + [{"icao24": "nuevo1", "callsign": "N999"}])
+            self.assertEqual(calls, [20, 20, 5, 1])
+            self.assertEqual(sum(f["verification_source"] == "icao" for f in second), 45)
+
+
+class TestClassificationQueue(unittest.TestCase):
+    def test_drop_oldest_and_dedupe(self):
+        release = threading.Event()
+        seen = []
+
+        def process(batch):
+            release.wait(2)
+            seen.extend(f["icao24"] for f in batch)
+
+        q = ClassificationQueue(process, batch_size=1, maxsize=3, error_backoff_s=0)
+        q.submit([{"icao24": "a"}])
+        while q.stats()["inflight"] == 0:
+            time.sleep(0.01)
+        # "a" está en proceso: no se vuelve a encolar; al pasar de 3 se descarta "b"
+        q.submit([{"icao24": k} for k in ("a", "b", "c", "d", "c", "e")])
+        self.assertEqual(q.stats()["dropped"], 1)
+        release.set()
+        while q.stats()["processed"] < 4:
+            time.sleep(0.01)
+        self.assertEqual(seen, ["a", "c", "d", "e"])
+
+    def test_refresh_does_not_wait_for_gemini(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_batch(batch, api_key):
+            started.set()
+            release.wait(2)
+            return [{"index": i, "type": "carga", "confidence": 0.9, "operator_name": "X"} for i in range(len(batch))]
+
+        cache = ClassificationCache(None)
+        with mock.patch.object(app, "classification_cache", cache), \
+                mock.patch.object(app, "gemini_classify_batch", slow_batch), \
+                mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "test"}):
+            first = app.enrich_flights([{"icao24": "q00001", "callsign": "N1"}])
+            self.assertFalse(first[0]["verified"])
+            self.assertTrue(started.wait(2))
+            release.set()
+            while cache.lookup("q00001", "N1") is None:
+                time.sleep(0.01)
+            later = app.enrich_flights([{"icao24": "q00001", "callsign": "N1"}])
+            self.assertEqual((later[0]["type"], later[0]["verified"]), ("carga", True))
+
+    def test_omitted_flights_are_not_resent_and_trigger_backoff(self):
+        calls = []
+
+        def partial_batch(batch, api_key):
+            calls.append([f["icao24"] for f in batch])
+            # Gemini omite el índice 1
+            return [{"index": 0, "type": "carga", "confidence": 0.9, "operator_name": "X"}]
+
+        cache = ClassificationCache(None)
+        queue = ClassificationQueue(app._classify_queued_batch, batch_size=20, error_backoff_s=0)
+        flights = [{"icao24": "p00001", "callsign": "N1"}, {"icao24": "p00002", "callsign": "N2"}]
+        with mock.patch.object(app, "classification_cache", cache), \
+                mock.patch.object(app, "classification_queue", queue), \
+                mock.patch.object(app, "gemini_classify_batch", partial_batch), \
+                mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "test"}):
+            app.enrich_flights(flights)
+            while queue.stats()["processed"] < 2:
+                time.sleep(0.01)
+            self.assertEqual(queue.stats()["failures"], 1)
+            self.assertIsNone(cache.lookup("p00002", "N2")["type"])
+            later = app.enrich_flights(flights)
+            self.assertEqual(calls, [["p00001", "p00002"]])
+            self.assertEqual(queue.stats()["submitted"], 2)
+            self.assertEqual([f["verified"] for f in later], [True, False])
+            self.assertEqual(later[1]["type"], "comercial")
+
+    def test_reply_without_json_marks_whole_batch_unresolved(self):
+        cache = ClassificationCache(None)
+        with mock.patch.object(app, "classification_cache", cache), \
+                mock.patch.object(app, "gemini_classify_batch", lambda batch, key: None), \
+                mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "test"}):
+            with self.assertRaises(ValueError):
+                app._classify_queued_batch([{"icao24": "r00001", "callsign": "N1"}])
+        self.assertIsNone(cache.lookup("r00001", "N1")["type"])
+        self.assertEqual(cache.stats()["unresolved_stored"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,10 @@
+import json
+import os
+import tempfile
+import time
 import unittest
-from app import classify_flight
+from app import classify_flight, classify_flights
+from operator_matcher import OperatorMapping, OperatorMatcher
 
 
 class TestClassifyFlight(unittest.TestCase):
@@ -21,5 +26,52 @@ class TestClassifyFlight(unittest.TestCase):
         self.assertEqual(classify_flight("ZZZ123"), "comercial")
 
 
+class TestOperatorMatcher(unittest.TestCase):
+    def test_batch_matches_single(self):
+        callsigns = ["FDX123", " ups9 ", "AAL100", "ZZZ1", "", None, "KQ555"]
+        self.assertEqual(classify_flights(callsigns), [classify_flight(c) for c in callsigns])
+
+    def test_cargo_wins_over_commercial(self):
+        matcher = OperatorMatcher({"cargo_prefixes": ["AB"], "commercial_prefixes": ["ABC", "AB"]})
+        self.assertEqual(matcher.classify("ABC12"), "carga")
+        self.assertEqual(matcher.classify("A1"), "comercial")
+
+    def test_large_table(self):
+        prefixes = [a + b + c for a in "ABCDEFGHIJ" for b in "ABCDEFGHIJ" for c in "ABCDEFGHIJ"]
+        matcher = OperatorMatcher({"cargo_prefixes": prefixes[::2], "commercial_prefixes": prefixes[1::2]})
+        self.assertEqual(matcher.size, 1000)
+        self.assertEqual(matcher.classify("AAA1"), "carga")
+        self.assertEqual(matcher.classify("AAB1"), "comercial")
+
+    def test_hot_reload(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "mapping.json")
+            with open(path, "w") as f:
+                json.dump({"cargo_prefixes": ["XYZ"]}, f)
+            mapping = OperatorMapping(path, reload_interval_s=0.01)
+            self.assertEqual(mapping.classify("XYZ1"), "carga")
+            with open(path, "w") as f:
+                json.dump({"cargo_prefixes": ["QQQ"]}, f)
+            os.utime(path, (time.time() + 5, time.time() + 5))
+            time.sleep(0.02)
+            self.assertEqual(mapping.classify("XYZ1"), "comercial")
+            self.assertEqual(mapping.classify("QQQ1"), "carga")
+            # Un JSON inválido no borra el matcher vigente
+            with open(path, "w") as f:
+                f.write("{")
+            os.utime(path, (time.time() + 10, time.time() + 10))
+            time.sleep(0.02)
+            self.assertEqual(mapping.classify("QQQ1"), "carga")
+            # JSON válido con forma incorrecta: tampoco lanza ni sustituye el matcher
+            for n, body in enumerate((["QQQ"], {"cargo_prefixes": 5})):
+                with open(path, "w") as f:
+                    json.dump(body, f)
+                os.utime(path, (time.time() + 20 + n, time.time() + 20 + n))
+                time.sleep(0.02)
+                self.assertEqual(mapping.classify("QQQ1"), "carga")
+                self.assertEqual(mapping.classify("QQQ1"), "carga")
+            self.assertEqual(mapping.reloads, 2)
+
+
 if __name__ == '__main__':
     unittest.main()
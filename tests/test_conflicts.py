@@ -0,0 +1,58 @@
+import random
+import unittest
+
+from app import FlightMonitor, spatial_candidate_pairs
+
+
+def _random_flights(n, seed, lat_range=(14.0, 33.0), lon_range=(-118.0, -86.0)):
+    rnd = random.Random(seed)
+    flights = []
+    for i in range(n):
+        flights.append({
+            "icao24": f"{i:06x}",
+            "callsign": f"TST{i}",
+            "lat": rnd.uniform(*lat_range),
+            "lon": rnd.uniform(*lon_range),
+            "alt": rnd.choice([None, rnd.uniform(0, 12000)]),
+        })
+    return flights
+
+
+def _detect(flights, brute_force):
+    monitor = FlightMonitor()
+    monitor.flights = [dict(f) for f in flights]
+    monitor.conflict_zones = []
+    return monitor.detect_conflicts(brute_force=brute_force)
+
+
+class TestSpatialConflicts(unittest.TestCase):
+    def test_grid_matches_brute_force_dense(self):
+        # Zona pequeña para forzar muchos conflictos
+        flights = _random_flights(400, seed=1, lat_range=(19.3, 19.7), lon_range=(-99.6, -99.1))
+        self.assertEqual(_detect(flights, False), _detect(flights, True))
+
+    def test_grid_matches_brute_force_sparse(self):
+        flights = _random_flights(1500, seed=2)
+        self.assertEqual(_detect(flights, False), _detect(flights, True))
+
+    def test_antimeridian_and_missing_coords(self):
+        flights = [
+            {"icao24": "a", "callsign": "A", "lat": 10.0, "lon": 179.99, "alt": 3000},
+            {"icao24": "b", "callsign": "B", "lat": 10.0, "lon": -179.99, "alt": 3100},
+            {"icao24": "c", "callsign": "C", "lat": None, "lon": -99.0, "alt": 3000},
+            {"icao24": "d", "callsign": "D", "lat": float("nan"), "lon": -99.0, "alt": 3000},
+        ]
+        conflicts, _ = _detect(flights, False)
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(spatial_candidate_pairs(flights), [(0, 1)])
+
+    def test_altitude_bands_prune_pairs(self):
+        flights = [
+            {"icao24": "a", "lat": 19.5, "lon": -99.2, "alt": 1000},
+            {"icao24": "b", "lat": 19.5, "lon": -99.2, "alt": 11000},
+        ]
+        self.assertEqual(spatial_candidate_pairs(flights), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import json
+import unittest
+
+from services import fast_json
+
+
+class _Response:
+    def __init__(self, content):
+        self.content = content
+
+
+class TestFastJson(unittest.TestCase):
+    PAYLOAD = {"time": 1700000000, "states": [["abc123", "AMX100  ", "México", None, 1700000001, -99.1, 19.4, None, False]]}
+
+    def test_loads_matches_stdlib(self):
+        raw = json.dumps(self.PAYLOAD, ensure_ascii=False).encode("utf-8")
+        self.assertEqual(fast_json.loads(raw), json.loads(raw))
+        self.assertEqual(fast_json.loads(raw.decode("utf-8")), self.PAYLOAD)
+
+    def test_response_json_uses_raw_bytes(self):
+        raw = json.dumps(self.PAYLOAD).encode("utf-8")
+        self.assertEqual(fast_json.response_json(_Response(raw)), self.PAYLOAD)
+
+    def test_forced_and_unknown_backend(self):
+        self.assertEqual(fast_json._load_backend("stdlib")[0], "stdlib")
+        with self.assertLogs("services.fast_json", level="WARNING"):
+            name, loads = fast_json._load_backend("no-existe")
+        self.assertEqual(name, "stdlib")
+        self.assertEqual(loads(b"[1, null]"), [1, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+import unittest
+from unittest import mock
+
+import app
+from app import FlightMonitor
+from flight_state import AlertLog, ConflictRegistry, FlightSnapshot, FrozenFlight, SnapshotPoller, diff_snapshots, to_columns
+
+
+class TestFrozenSnapshots(unittest.TestCase):
+    def test_frozen_flight_rejects_mutation(self):
+        flight = FrozenFlight({"icao24": "abc", "lat": 19.4})
+        with self.assertRaises(TypeError):
+            flight["lat"] = 20.0
+        with self.assertRaises(TypeError):
+            flight.update(lat=20.0)
+        moved = flight.evolve(lat=20.0)
+        self.assertEqual(flight["lat"], 19.4)
+        self.assertEqual(moved["lat"], 20.0)
+
+    def test_snapshot_precomputes_stats(self):
+        snapshot = FlightSnapshot(1, 0.0, [
+            {"type": "carga", "alt": 1000},
+            {"type": "comercial", "alt": 3000},
+            {"type": "comercial", "alt": None},
+        ], [], [])
+        self.assertEqual(snapshot.stats["total_flights"], 3)
+        self.assertEqual(snapshot.stats["cargo_flights"], 1)
+        self.assertEqual(snapshot.stats["passenger_flights"], 2)
+        with self.assertRaises(AttributeError):
+            snapshot.flights = ()
+
+    def test_refresh_swaps_in_new_snapshot(self):
+        monitor = FlightMonitor()
+        before = monitor.snapshot
+        lats = [f["lat"] for f in before.flights]
+        monitor.fetch_opensky_data = lambda: [dict(f, lat=f["lat"] + 0.1) for f in monitor.flights]
+        after = monitor.refresh()
+        self.assertIs(monitor.snapshot, after)
+        self.assertEqual(after.version, before.version + 1)
+        # El snapshot anterior sigue intacto para los lectores que lo tenían
+        self.assertEqual([f["lat"] for f in before.flights], lats)
+        self.assertTrue(all(isinstance(f, FrozenFlight) for f in after.flights))
+
+    def test_poller_keeps_last_snapshot_on_error(self):
+        monitor = FlightMonitor()
+        poller = SnapshotPoller(monitor.refresh, interval=60)
+        monitor.fetch_opensky_data = lambda: list(monitor.flights)
+        good = poller.refresh_once()
+
+        def boom():
+            raise RuntimeError("fallo")
+        poller.refresh_fn = boom
+        self.assertIs(poller.refresh_once(), good)
+        self.assertEqual(poller.stats()["error_count"], 1)
+
+
+class TestSnapshotPoller(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.failing = False
+
+    def refresh(self):
+        if self.failing:
+            raise RuntimeError("OpenSky caído")
+        self.calls += 1
+        return FlightSnapshot(self.calls, 0.0, [{"icao24": "a", "type": "carga", "alt": 1000}], [], [])
+
+    def test_background_refresh_error_and_stats(self):
+        poller = SnapshotPoller(self.refresh, interval=0.5)
+        self.assertEqual(poller.current().version, 0)
+        self.assertTrue(poller.start())
+        self.addCleanup(poller.stop)
+        self.assertFalse(poller.start())
+        first = poller.wait_for_version(0, timeout=5)
+        self.assertEqual(first.version, 1)
+        self.failing = True
+        # Un refresco fallido conserva el último snapshot publicado
+        self.assertIs(poller.refresh_once(), first)
+        stats = poller.stats()
+        self.assertTrue(stats["running"])
+        self.assertEqual((stats["version"], stats["refresh_count"], stats["error_count"]), (1, 1, 1))
+        self.assertIsNotNone(stats["last_refresh_ms"])
+        poller.stop()
+        self.assertFalse(poller.running)
+
+    def test_vuelos_reads_snapshot_without_refreshing(self):
+        poller = SnapshotPoller(self.refresh)
+        poller.refresh_once()
+        with mock.patch.object(app, "flight_poller", poller), mock.patch.object(app, "get_flight_snapshot", poller.current):
+            client = app.app.test_client()
+            for _ in range(3):
+                body = client.get("/api/vuelos").get_json()
+                self.assertEqual(body["vuelos"][0]["icao24"], "a")
+        self.assertEqual(self.calls, 1)
+
+
+class TestConflictRegistry(unittest.TestCase):
+    def test_pair_key_is_order_independent(self):
+        self.assertEqual(ConflictRegistry.pair_key("b1", "a2"), ConflictRegistry.pair_key("a2", "b1"))
+
+    def test_alerts_once_and_rearms_after_separation(self):
+        registry = ConflictRegistry(ttl=600, rearm_after=20)
+        key = ConflictRegistry.pair_key("abc", "def")
+        self.assertTrue(registry.observe(key, now=0))
+        registry.sweep([key], now=0)
+        self.assertFalse(registry.observe(key, now=10))
+        registry.sweep([key], now=10)
+        # Se separan un ciclo y vuelven a converger dentro del margen: sin alerta nueva
+        registry.sweep([], now=20)
+        self.assertFalse(registry.observe(key, now=30))
+        registry.sweep([key], now=30)
+        # Separados más de rearm_after: la siguiente convergencia vuelve a alertar
+        registry.sweep([], now=40)
+        registry.sweep([], now=60)
+        self.assertNotIn(key, registry)
+        self.assertTrue(registry.observe(key, now=70))
+        stats = registry.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["rearms"]), (2, 2, 1))
+
+    def test_ttl_and_size_cap(self):
+        registry = ConflictRegistry(ttl=100, max_entries=2, rearm_after=1000)
+        registry.observe(("zone", "a", "z"), now=0)
+        registry.observe(("zone", "b", "z"), now=1)
+        registry.observe(("zone", "c", "z"), now=2)
+        self.assertEqual(len(registry), 2)
+        self.assertEqual(registry.stats()["evictions"], 1)
+        self.assertTrue(registry.observe(("zone", "b", "z"), now=500))
+        self.assertEqual(registry.stats()["expirations"], 1)
+
+    def test_monitor_does_not_repeat_alerts(self):
+        monitor = FlightMonitor()
+        flights = [
+            {"icao24": "aaa111", "callsign": "AAA1", "lat": 19.40, "lon": -99.10, "alt": 3000},
+            {"icao24": "bbb222", "callsign": "BBB2", "lat": 19.41, "lon": -99.10, "alt": 3000},
+        ]
+        _, first = monitor.detect_conflicts(flights=flights)
+        _, second = monitor.detect_conflicts(flights=flights)
+        self.assertTrue(any("Conflicto" in a["title"] for a in first))
+        self.assertFalse(any("Conflicto" in a["title"] for a in second))
+
+
+class TestStreamingHelpers(unittest.TestCase):
+    def test_diff_snapshots(self):
+        old = FlightSnapshot(1, 0.0, [
+            {"icao24": "a", "lat": 19.0, "lon": -99.0, "type": "carga"},
+            {"icao24": "b", "lat": 19.5, "lon": -99.5, "type": "comercial"},
+        ], [], [])
+        new = FlightSnapshot(2, 1.0, [
+            {"icao24": "a", "lat": 19.1, "lon": -99.0, "type": "carga"},
+            {"icao24": "c", "lat": 20.0, "lon": -98.0, "type": "comercial"},
+        ], [], [])
+        delta = diff_snapshots(old, new)
+        self.assertEqual((delta["from_version"], delta["version"]), (1, 2))
+        self.assertEqual(delta["changed"], [{"key": "a", "lat": 19.1}])
+        self.assertEqual([f["icao24"] for f in delta["added"]], ["c"])
+        self.assertEqual(delta["removed"], ["b"])
+
+    def test_alert_log_since(self):
+        woken = []
+        log = AlertLog(maxlen=3, on_append=lambda: woken.append(True))
+        log.extend([{"title": str(i)} for i in range(5)], version=7)
+        self.assertEqual(log.last_id, 5)
+        self.assertEqual([e["id"] for e in log.since(0)], [3, 4, 5])
+        self.assertEqual([e["id"] for e in log.since(4)], [5])
+        self.assertEqual(log.since(5), [])
+        self.assertEqual(woken, [True])
+
+    def test_columns_and_history(self):
+        flights = [{"icao24": "a", "lat": 19.0, "verification_notes": "larga"}, {"icao24": "b", "lat": 20.0}]
+        cols = to_columns(flights, ("icao24", "lat", "alt"))
+        self.assertEqual(cols["rows"], 2)
+        self.assertEqual(cols["columns"], {"icao24": ["a", "b"], "lat": [19.0, 20.0], "alt": [None, None]})
+        versions = iter(range(1, 10))
+        poller = SnapshotPoller(lambda: FlightSnapshot(next(versions), 0.0, flights, [], []), history=2)
+        for _ in range(3):
+            poller.refresh_once()
+        self.assertIsNone(poller.get_version(1))
+        self.assertEqual(poller.get_version(2).version, 2)
+
+
+class TestInstanceCursor(unittest.TestCase):
+    def setUp(self):
+        flights = [{"icao24": "a", "lat": 19.0}]
+        versions = iter(range(1, 10))
+        self.poller = SnapshotPoller(lambda: FlightSnapshot(next(versions), 0.0, [dict(flights[0], lat=19.0 + len(flights))], [], []), history=5)
+        self.poller.refresh_once()
+        self.poller.refresh_once()
+        for patcher in (mock.patch.object(app, "flight_poller", self.poller),
+                        mock.patch.object(app, "get_flight_snapshot", self.poller.current)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app.app.test_client()
+
+    def test_cursor_round_trip(self):
+        cursor = self.poller.cursor(2)
+        self.assertEqual(self.poller.parse_cursor(cursor), 2)
+        self.assertIsNone(self.poller.parse_cursor("otro." + "2"))
+        self.assertIsNone(self.poller.parse_cursor("2"))
+        self.assertNotEqual(SnapshotPoller(lambda: None).epoch, self.poller.epoch)
+
+    def test_cursor_from_another_instance_gets_full_list(self):
+        own = self.client.get(f"/api/vuelos?since={self.poller.cursor(1)}").get_json()
+        self.assertTrue(own["delta"])
+        self.assertEqual(own["cursor"], self.poller.cursor(2))
+        # Mismo número de versión pero de un proceso anterior: nunca un delta ni un 304
+        foreign = self.client.get("/api/vuelos?since=deadbeef.1").get_json()
+        self.assertFalse(foreign["delta"])
+        self.assertEqual(len(foreign["vuelos"]), 1)
+        response = self.client.get("/api/vuelos", headers={"If-None-Match": '"v2-json--"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get("/api/vuelos", headers={"If-None-Match": response.headers["ETag"]}).status_code, 304)
+
+    def test_stream_cap_sends_extra_clients_to_polling(self):
+        for patcher in (mock.patch.object(app, "SSE_MAX_STREAMS", 1),
+                        mock.patch.object(app, "sse_streams", {"active": 0, "max": 1, "opened": 0, "rejected": 0})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        first = self.client.get("/api/stream", buffered=False)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(next(first.response).startswith(b"retry: "))
+        rejected = self.client.get("/api/stream")
+        self.assertEqual(rejected.status_code, 503)
+        self.assertEqual(rejected.headers["Retry-After"], str(app.SSE_RETRY_AFTER_S))
+        self.assertIn("/api/alerts-poll", rejected.get_json()["fallback"])
+        # Al cerrar la conexión el hueco queda libre para el siguiente cliente
+        first.close()
+        self.assertEqual(app.sse_streams["active"], 0)
+        second = self.client.get("/api/stream", buffered=False)
+        self.assertEqual(second.status_code, 200)
+        second.close()
+        self.assertEqual(app.sse_streams, {"active": 0, "max": 1, "opened": 2, "rejected": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+
+from geo import haversine_distance, haversine_many, haversine_pairs, haversine_matrix, simplify_track, to_float_array
+
+
+POINTS = [[19.4363, -99.0721], [20.5218, -103.3112], [25.7785, -100.1069], [21.0365, -86.8771]]
+
+
+class TestHaversineKernels(unittest.TestCase):
+    def test_matrix_matches_scalar(self):
+        matrix = haversine_matrix(POINTS)
+        for i, a in enumerate(POINTS):
+            for j, b in enumerate(POINTS):
+                self.assertAlmostEqual(matrix[i, j], haversine_distance(a[0], a[1], b[0], b[1]), places=3)
+
+    def test_one_to_many_and_pairs(self):
+        lats = [p[0] for p in POINTS]
+        lons = [p[1] for p in POINTS]
+        many = haversine_many(19.4363, -99.0721, lats, lons)
+        pairs = haversine_pairs([19.4363] * 4, [-99.0721] * 4, lats, lons)
+        np.testing.assert_allclose(many, pairs)
+        self.assertAlmostEqual(many[0], 0.0)
+
+    def test_missing_values_become_nan(self):
+        lats = to_float_array([19.4, None, "x"])
+        self.assertTrue(np.isnan(lats[1]) and np.isnan(lats[2]))
+        dist = haversine_many(19.4, -99.1, lats, [-99.1, -99.1, -99.1])
+        self.assertFalse(np.isnan(dist[0]))
+        self.assertTrue(np.isnan(dist[1]))
+
+
+    def test_simplify_track_keeps_corners(self):
+        # Tramo recto de 0.1° con una esquina en el índice 10 y ruido de ~1 m
+        lats = [19.0 + 0.01 * i for i in range(11)] + [19.1] * 10
+        lons = [-99.0] * 11 + [-99.0 + 0.01 * (i + 1) for i in range(10)]
+        lats[5] += 0.00001
+        keep = simplify_track(lats, lons, tolerance_km=0.05)
+        self.assertEqual(keep.tolist(), [0, 10, 20])
+        self.assertEqual(len(simplify_track(lats, lons, tolerance_km=0)), 21)
+        self.assertEqual(simplify_track([19.0, 19.1], [-99.0, -99.1], 1.0).tolist(), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from services.cache import MISSING, TTLCache
+from services.geocode_cache import GeocodeCache, normalize_query
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_and_expiry(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", None)
+        self.assertIsNone(cache.get("b", "x"))
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIs(cache.lookup("b"), MISSING)
+        cache.set("d", 4, ttl=-1)
+        self.assertIs(cache.lookup("d"), MISSING)
+        stats = cache.stats()
+        self.assertEqual((stats["evictions"], stats["expirations"]), (2, 1))
+
+
+class TestGeocodeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "geo.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_normalized_keys(self):
+        self.assertEqual(normalize_query("  Querétaro, QRO. "), normalize_query("queretaro qro"))
+        # Signo y decimales forman parte de la clave: son coordenadas distintas
+        self.assertNotEqual(normalize_query("19.4,-99.1"), normalize_query("19.4, 99.1"))
+        self.assertNotEqual(normalize_query("19.4, -99.1"), normalize_query("194, -991"))
+        self.assertEqual(normalize_query("19.4,-99.1"), normalize_query(" 19.4 , -99.1 "))
+
+    def test_persists_across_instances_and_negative_ttl(self):
+        cache = GeocodeCache(self.db, negative_ttl=0.05)
+        cache.set("Ciudad de México", (19.43, -99.13))
+        cache.set("lugar inexistente", None)
+        self.assertEqual(cache.get("lugar inexistente"), (True, None))
+        cache.close()
+        reopened = GeocodeCache(self.db)
+        self.assertEqual(reopened.get("CIUDAD DE MEXICO"), (True, (19.43, -99.13)))
+        self.assertEqual(reopened.stats()["disk_hits"], 1)
+        time.sleep(0.1)
+        self.assertEqual(reopened.get("lugar inexistente"), (False, None))
+        reopened.close()
+
+    def test_warm_up_from_seed(self):
+        seed = os.path.join(self.tmp.name, "seed.json")
+        with open(seed, "w", encoding="utf-8") as f:
+            json.dump([{"names": ["MEX", "AICM"], "lat": 19.4363, "lon": -99.0721}], f)
+        cache = GeocodeCache(None)
+        self.assertEqual(cache.warm_up(seed), 2)
+        self.assertEqual(cache.get("aicm"), (True, (19.4363, -99.0721)))
+
+
+if __name__ == '__main__':
+    unittest.main()
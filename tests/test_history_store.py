@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import app
+from services.history_store import COLUMNS, HistoryStore, partition_name
+
+DAY = 86400
+T0 = (int(time.time()) // DAY - 1) * DAY  # ayer 00:00 UTC: dentro de la retención
+
+
+def _row(icao, lat, lon, tipo="comercial"):
+    return (icao, "AMX100", "Mexico", lat, lon, 10000.0, 230.0, 90.0, tipo)
+
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(os.path.join(self.tmp.name, "history.sqlite3"), retention_days=2)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_append_and_query_by_time_icao_and_bbox(self):
+        self.store.append_snapshot(T0 + 10, [_row("abc123", 19.4, -99.1), _row("def456", 25.0, -100.0)])
+        self.store.append_snapshot(T0 + 25, [_row("abc123", 19.5, -99.0)])
+        self.store.append_snapshot(T0 + DAY + 5, [_row("abc123", 20.0, -98.0, "carga")])
+        self.assertEqual(self.store.partitions(), [partition_name(T0), partition_name(T0 + DAY)])
+
+        rows = list(self.store.query(T0, T0 + 2 * DAY))
+        self.assertEqual([r[0] for r in rows], [T0 + 10, T0 + 10, T0 + 25, T0 + DAY + 5])
+
+        track = self.store.track("ABC123", T0, T0 + 2 * DAY)
+        self.assertEqual([p["latitud"] for p in track], [19.4, 19.5, 20.0])
+        self.assertEqual(set(track[0]), set(COLUMNS))
+        self.assertEqual(track[-1]["tipo"], "carga")
+
+        in_box = list(self.store.query(T0, T0 + DAY, bbox=(24.0, -101.0, 26.0, -99.5)))
+        self.assertEqual([r[1] for r in in_box], ["def456"])
+        self.assertEqual(len(list(self.store.query(T0 + 11, T0 + 24))), 0)
+
+    def test_retention_drops_whole_days(self):
+        for day in range(4):
+            self.store.append_snapshot(T0 + day * DAY, [_row("abc123", 19.0, -99.0)])
+        self.assertEqual(len(self.store.partitions()), 4)
+        pages_before = self.store._db.execute("PRAGMA page_count").fetchone()[0]
+        dropped = self.store.enforce_retention(now=T0 + 4 * DAY)
+        self.assertEqual(self.store._db.execute("PRAGMA freelist_count").fetchone()[0], 0)
+        self.assertLess(self.store._db.execute("PRAGMA page_count").fetchone()[0], pages_before)
+        self.assertEqual(dropped, [partition_name(T0), partition_name(T0 + DAY)])
+        self.assertEqual(len(self.store.documents(T0, T0 + 5 * DAY)), 2)
+        self.assertEqual(self.store.stats()["partitions"], 2)
+
+
+class TestHistoryEndpoints(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = HistoryStore(os.path.join(tmp.name, "history.sqlite3"))
+        self.addCleanup(self.store.close)
+        patcher = mock.patch.object(app, "history_store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app.app.test_client()
+        # abc123 vuela en línea recta hacia el norte: 30 posiciones cada 15 s
+        for i in range(30):
+            self.store.append_snapshot(T0 + 15 * i, [_row("abc123", 19.0 + 0.01 * i, -99.0), _row("def456", 25.0, -100.0 + 0.01 * i)])
+
+    def _lines(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        return [json.loads(line) for line in response.data.decode().splitlines()]
+
+    def test_track_is_simplified(self):
+        (track,) = self._lines(f"/api/tracks/abc123?from={T0}&to={T0 + 3600}")
+        self.assertEqual(track["n_raw"], 30)
+        self.assertEqual([p[0] for p in track["points"]], [T0, T0 + 15 * 29])
+        (raw,) = self._lines(f"/api/tracks/abc123?from={T0}&to={T0 + 3600}&tolerance_m=0")
+        self.assertEqual(len(raw["points"]), 30)
+
+    def test_replay_groups_by_aircraft_and_filters_bbox(self):
+        lines = self._lines(f"/api/replay?from={T0}&to={T0 + 3600}")
+        self.assertEqual([l["icao24"] for l in lines], ["abc123", "def456"])
+        lines = self._lines(f"/api/replay?from={T0}&to={T0 + 3600}&bbox=24,-101,26,-99")
+        self.assertEqual([l["icao24"] for l in lines], ["def456"])
+
+    def test_invalid_range(self):
+        self.assertEqual(self.client.get(f"/api/replay?from={T0}&to={T0 + 86400}").status_code, 400)
+        self.assertEqual(self.client.get("/api/tracks/abc123?from=ayer").status_code, 400)
+        self.assertEqual(self.client.get("/api/replay?bbox=1,2,3").status_code, 400)
+        for query in ("from=nan", "from=inf&to=inf", "from=-inf", f"from={T0}&to=nan"):
+            self.assertEqual(self.client.get(f"/api/replay?{query}").status_code, 400, query)
+            self.assertEqual(self.client.get(f"/api/tracks/abc123?{query}").status_code, 400, query)
+        self.assertEqual(self.client.get("/api/tracks/abc123?tolerance_m=nan").status_code, 400)
+        self.assertEqual(self.client.get("/api/replay?bbox=nan,-101,26,-99").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
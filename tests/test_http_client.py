@@ -0,0 +1,73 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from services.http_client import HttpClient, RateLimiter
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    failures_left = 0
+
+    def do_GET(self):
+        if self.path == "/flaky" and _Handler.failures_left > 0:
+            _Handler.failures_left -= 1
+            status, body = 503, b"busy"
+        else:
+            status, body = 200, b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_connections_are_reused(self):
+        client = HttpClient(retries=0)
+        for _ in range(5):
+            self.assertEqual(client.get(self.base + "/ok").json(), {"ok": True})
+        stats = client.stats()["127.0.0.1"]
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["reuse_rate"], 0.8)
+        client.close()
+
+    def test_retries_server_errors(self):
+        _Handler.failures_left = 2
+        client = HttpClient(retries=2, backoff_factor=0, backoff_jitter=0)
+        response = client.get(self.base + "/flaky")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.stats()["127.0.0.1"]["retries"], 2)
+        client.close()
+
+
+    def test_rate_limit_applies_to_every_attempt(self):
+        _Handler.failures_left = 2
+        client = HttpClient(retries=2, backoff_factor=0, backoff_jitter=0)
+        limiter = RateLimiter(1000)
+        client.set_rate_limit("127.0.0.1", limiter)
+        response = client.get(self.base + "/flaky")
+        self.assertEqual(response.status_code, 200)
+        # Dos 503 reintentados más el intento bueno: tres turnos del limitador
+        self.assertEqual(limiter.acquired, 3)
+        self.assertEqual(client.stats()["127.0.0.1"]["retries"], 2)
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import app
+from jobs import JobError, JobQueue, JobQueueFull
+
+
+class TestJobQueue(unittest.TestCase):
+    def test_emergency_lane_not_blocked_by_normal(self):
+        release = threading.Event()
+        q = JobQueue(lanes={"emergency": 1, "normal": 1}, max_queue=10)
+        slow = [q.submit("optimize-route", release.wait, 5) for _ in range(3)]
+        urgent = q.submit("emergency-route", lambda: "ok", lane="emergency")
+        self.assertTrue(urgent.wait(2))
+        self.assertEqual(urgent.result, "ok")
+        self.assertNotEqual(slow[-1].status, "done")
+        release.set()
+        for job in slow:
+            self.assertTrue(job.wait(2))
+
+    def test_job_error_status(self):
+        def bad():
+            raise JobError("entrada inválida", 400)
+
+        def boom():
+            raise RuntimeError("fallo")
+
+        q = JobQueue()
+        a, b = q.submit("x", bad), q.submit("y", boom)
+        a.wait(2)
+        b.wait(2)
+        self.assertEqual((a.status, a.error_status, a.error), ("error", 400, "entrada inválida"))
+        self.assertEqual((b.status, b.error_status), ("error", 500))
+        self.assertEqual(q.stats()["failed"], 2)
+
+    def test_queue_full_and_retention(self):
+        release = threading.Event()
+        q = JobQueue(lanes={"normal": 1}, max_queue=1, retention_s=0.05, max_retained=10)
+        running = q.submit("x", release.wait, 5)
+        while running.status != "running":
+            time.sleep(0.01)
+        queued = q.submit("x", lambda: 1)
+        with self.assertRaises(JobQueueFull):
+            q.submit("x", lambda: 2)
+        release.set()
+        self.assertTrue(queued.wait(2))
+        time.sleep(0.1)
+        self.assertIsNone(q.get(queued.id))
+        self.assertEqual(q.stats()["rejected"], 1)
+
+    def test_events_on_transitions(self):
+        seen = []
+        q = JobQueue(on_event=lambda job: seen.append(job.status))
+        q.submit("x", lambda: None).wait(2)
+        time.sleep(0.05)
+        self.assertEqual(seen, ["queued", "running", "done"])
+
+
+class TestJobEndpoints(unittest.TestCase):
+    def test_submit_and_wait(self):
+        client = app.app.test_client()
+        body = {"origen": [19.4363, -99.0721], "destino": [20.6173, -100.1857], "restricciones": []}
+        submitted = client.post('/api/jobs/optimize-route', json=body)
+        self.assertEqual(submitted.status_code, 202)
+        status = client.get(submitted.json["status_url"] + "?wait=20").json
+        self.assertEqual(status["job"]["status"], "done")
+        self.assertTrue(status["result"]["ruta_coordenadas"])
+
+    def test_route_job_defers_ai(self):
+        client = app.app.test_client()
+        app.route_cache.clear()
+        release = threading.Event()
+
+        def slow_analysis(_datos):
+            release.wait(10)
+            return "Análisis diferido"
+
+        body = {"origen": [19.4363, -99.0721], "destino": [20.5218, -103.3112], "restricciones": [], "ai_deadline_ms": 0}
+        with mock.patch.object(app, "call_gemini_analysis", slow_analysis):
+            submitted = client.post('/api/jobs/optimize-route', json=body)
+            result = client.get(submitted.json["status_url"] + "?wait=20").json["result"]
+            # La geometría llega sin esperar al análisis, que sigue en su propio trabajo
+            self.assertTrue(result["ruta_coordenadas"])
+            self.assertEqual(result["ai_pending"], ["analisis"])
+            release.set()
+            deferred = client.get(result["status_url"] + "?wait=10").json
+        self.assertEqual(deferred["job"]["kind"], "route-ai")
+        self.assertEqual(deferred["result"]["analisis_ia_texto"], "Análisis diferido")
+
+    def test_validation_error_and_unknown(self):
+        client = app.app.test_client()
+        job_id = client.post('/api/jobs/emergency-route', json={}).json["job"]["job_id"]
+        status = client.get(f'/api/jobs/{job_id}?wait=5').json
+        self.assertEqual((status["job"]["status"], status["error_status"]), ("error", 400))
+        self.assertEqual(client.get('/api/jobs/nope').status_code, 404)
+        self.assertEqual(client.post('/api/jobs/nope', json={}).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
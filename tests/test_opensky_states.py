@@ -0,0 +1,39 @@
+import unittest
+
+from services.opensky_api import OpenSkyStates, StateVector
+
+
+ROW = ["abc123", "AMX100  ", "Mexico", 1700000000, 1700000001, -99.1, 19.4, 1000.0, False, 200.0, 90.0, 0.0, None, 1050.0, "1234", False, 0]
+
+
+class TestStateVector(unittest.TestCase):
+    def test_attribute_api(self):
+        sv = StateVector(list(ROW))
+        self.assertEqual((sv.icao24, sv.latitude, sv.geo_altitude), ("abc123", 19.4, 1050.0))
+        # Campo ausente en vectores cortos (sin category): None en lugar de AttributeError
+        self.assertIsNone(sv.category)
+        self.assertFalse(hasattr(sv, "__dict__"))
+        self.assertEqual(sv.as_dict()["callsign"], "AMX100  ")
+        sv.category = 4
+        self.assertEqual(sv.category, 4)
+        self.assertEqual(len(ROW), 17)
+
+    def test_assignment_writes_through_to_row(self):
+        row = list(ROW)
+        StateVector(row).velocity = 0.0
+        self.assertEqual(row[9], 0.0)
+        self.assertEqual(StateVector(row).velocity, 0.0)
+
+    def test_lazy_states(self):
+        states = OpenSkyStates({"time": 1, "states": [list(ROW), ROW[:7]]})
+        self.assertEqual(states.time, 1)
+        self.assertEqual(len(states.states), 2)
+        self.assertIsNone(states.states[1].baro_altitude)
+        self.assertEqual([sv.icao24 for sv in states.states], ["abc123", "abc123"])
+        views = [id(sv) for sv in states.states.iter_view()]
+        self.assertEqual(len(set(views)), 1)
+        self.assertEqual(len(OpenSkyStates({"time": 1, "states": None}).states), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
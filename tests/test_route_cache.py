@@ -0,0 +1,99 @@
+import json
+import threading
+import unittest
+from unittest import mock
+
+import app
+
+
+class TestRouteCache(unittest.TestCase):
+    def setUp(self):
+        app.route_cache.clear()
+        self.client = app.app.test_client()
+
+    def test_key_is_canonical(self):
+        a = app.route_cache_key([19.43631, -99.07209], [20.5218, -103.3112], [[20.0, -100.0], [19.0, -99.0]], force_audio=False)
+        b = app.route_cache_key([19.43629, -99.07211], [20.5218, -103.3112], [[19.0, -99.0], [20.0, -100.0]], force_audio=False)
+        c = app.route_cache_key([19.43631, -99.07209], [20.5218, -103.3112], [[20.0, -100.0], [19.0, -99.0]], force_audio=True)
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_repeat_request_hits_cache(self):
+        body = {"origen": [19.4363, -99.0721], "destino": [20.6173, -100.1857], "restricciones": [[19.9, -99.6], [19.6, -99.3]]}
+        first = self.client.post('/api/optimize-route', json=body)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers['X-Route-Cache'], 'MISS')
+        body["restricciones"].reverse()
+        second = self.client.post('/api/optimize-route', json=body)
+        self.assertEqual(second.headers['X-Route-Cache'], 'HIT')
+        self.assertEqual(second.json, first.json)
+        forced = self.client.post('/api/optimize-route', json=body, headers={'Cache-Control': 'no-cache'})
+        self.assertEqual(forced.headers['X-Route-Cache'], 'BYPASS')
+
+    def test_client_cannot_disable_time_budget(self):
+        body = {"origen": [19.4363, -99.0721], "destino": [20.6173, -100.1857], "restricciones": [[19.9, -99.6]]}
+        # json.dumps escribe NaN/Infinity tal cual, como los aceptaría el servidor
+        for value in (0, -5, float("nan"), float("inf"), float("-inf")):
+            response = self.client.post('/api/optimize-route', data=json.dumps(dict(body, time_budget_ms=value)), content_type='application/json')
+            self.assertEqual(response.status_code, 400, value)
+        response = self.client.post('/api/optimize-route', json=dict(body, time_budget_ms=10 ** 9))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["optimizer_stats"]["time_budget_ms"], app.ROUTE_TIME_BUDGET_MS_MAX)
+
+    def test_unknown_engine_is_rejected(self):
+        body = {"origen": [19.4363, -99.0721], "destino": [20.6173, -100.1857]}
+        for engine in (["x"], {"a": 1}, 3, "nope"):
+            response = self.client.post('/api/optimize-route', json=dict(body, engine=engine))
+            self.assertEqual(response.status_code, 400, engine)
+            self.assertIn("Motor", response.json["error"])
+        job_id = self.client.post('/api/jobs/optimize-route', json=dict(body, engine=["x"])).json["job"]["job_id"]
+        status = self.client.get(f'/api/jobs/{job_id}?wait=5').json
+        self.assertEqual((status["job"]["status"], status["error_status"]), ("error", 400))
+
+
+class TestDeferredRouteAI(unittest.TestCase):
+    def test_zero_deadline_returns_job(self):
+        app.route_cache.clear()
+        release = threading.Event()
+
+        def slow_analysis(_datos):
+            release.wait(10)
+            return "Análisis de prueba"
+
+        client = app.app.test_client()
+        body = {"origen": [19.4363, -99.0721], "destino": [19.3371, -99.5660], "restricciones": [], "ai_deadline_ms": 0}
+        with mock.patch.object(app, "call_gemini_analysis", slow_analysis):
+            first = client.post('/api/optimize-route', json=body).json
+            self.assertTrue(first["ruta_coordenadas"])
+            # El análisis sigue bloqueado: la respuesta siempre trae el trabajo pendiente
+            self.assertEqual(first["ai_pending"], ["analisis"])
+            self.assertIsNone(first["analisis_ia_texto"])
+            self.assertEqual(first["status_url"], f'/api/jobs/{first["job_id"]}')
+            self.assertIn(client.get(first["status_url"]).json["job"]["status"], ("queued", "running"))
+            release.set()
+            job = client.get(f'{first["status_url"]}?wait=10').json
+        self.assertEqual(job["job"]["status"], "done")
+        self.assertEqual(job["job"]["kind"], "route-ai")
+        self.assertEqual(job["result"]["analisis_ia_texto"], "Análisis de prueba")
+        # Al terminar, la respuesta completa queda en la caché de rutas
+        cached = client.post('/api/optimize-route', json=body)
+        self.assertEqual(cached.headers['X-Route-Cache'], 'HIT')
+        self.assertEqual(cached.json["analisis_ia_texto"], "Análisis de prueba")
+        self.assertNotIn("job_id", cached.json)
+        self.assertEqual(client.get('/api/ai-jobs/desconocido').status_code, 404)
+
+    def test_ai_deadline_is_validated_and_clamped(self):
+        app.route_cache.clear()
+        client = app.app.test_client()
+        for raw in ("-1", "NaN", "Infinity", "1e400", '"x"'):
+            response = client.post('/api/optimize-route', data=f'{{"origen": [19.4, -99.1], "destino": [20.6, -103.3], "ai_deadline_ms": {raw}}}', content_type='application/json')
+            self.assertEqual(response.status_code, 400, raw)
+        body = {"origen": [19.4, -99.1], "destino": [20.6, -103.3], "ai_deadline_ms": 1e300}
+        with mock.patch.object(app, "wait_futures", wraps=app.wait_futures) as waited:
+            response = client.post('/api/optimize-route', json=body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(waited.call_args.kwargs["timeout"], app.AI_DEADLINE_S)
+
+
+if __name__ == '__main__':
+    unittest.main()
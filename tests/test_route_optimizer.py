@@ -0,0 +1,82 @@
+import itertools
+import random
+import unittest
+
+from route_optimizer import ENGINES, build_distance_matrix, nearest_neighbor_path, optimize_tour, path_length
+
+
+def _random_points(n, seed):
+    rnd = random.Random(seed)
+    return [[rnd.uniform(14.0, 33.0), rnd.uniform(-118.0, -86.0)] for _ in range(n)]
+
+
+def _is_two_opt_optimal(dist, tour):
+    n = len(tour)
+    for p in range(n - 1):
+        for q in range(p + 2, n):
+            old = dist[tour[p]][tour[p + 1]] + (dist[tour[q]][tour[q + 1]] if q + 1 < n else 0)
+            new = dist[tour[p]][tour[q]] + (dist[tour[p + 1]][tour[q + 1]] if q + 1 < n else 0)
+            if new < old - 1e-6:
+                return False
+    return True
+
+
+class TestOptimizeTour(unittest.TestCase):
+    def test_reaches_two_opt_local_optimum(self):
+        for seed in range(5):
+            points = _random_points(40, seed)
+            tour, km, stats = optimize_tour(points, engine="2opt", time_budget_ms=0, neighbors=39)
+            dist = build_distance_matrix(points)
+            self.assertEqual(tour[0], 0)
+            self.assertEqual(sorted(tour), list(range(40)))
+            self.assertAlmostEqual(km, path_length(dist, tour), places=6)
+            self.assertTrue(_is_two_opt_optimal(dist, tour))
+            self.assertLessEqual(km, path_length(dist, nearest_neighbor_path(dist)) + 1e-9)
+
+    def test_stats_reported(self):
+        _, _, stats = optimize_tour(_random_points(12, 7))
+        for key in ("matrix_ms", "construct_ms", "improve_ms", "total_ms", "iterations", "moves", "evaluations"):
+            self.assertIn(key, stats)
+        self.assertGreaterEqual(stats["iterations"], 12)
+
+    def test_fixed_end_keeps_endpoints(self):
+        for engine in ENGINES:
+            points = _random_points(25, 11)
+            tour, km, stats = optimize_tour(points, engine=engine, fixed_end=True, time_budget_ms=0)
+            self.assertEqual(tour[0], 0)
+            self.assertEqual(tour[-1], 24)
+            self.assertEqual(sorted(tour), list(range(25)))
+            self.assertTrue(stats["fixed_end"])
+
+    def test_fixed_end_close_to_exact_optimum(self):
+        for seed in range(4):
+            points = _random_points(8, 100 + seed)
+            dist = build_distance_matrix(points)
+            best = min(path_length(dist, [0] + list(p) + [7]) for p in itertools.permutations(range(1, 7)))
+            _, km, _ = optimize_tour(points, fixed_end=True, time_budget_ms=0, neighbors=7)
+            self.assertLessEqual(km, best * 1.05)
+
+    def test_or_opt_not_worse_than_two_opt(self):
+        total_2opt = total_combined = 0.0
+        for seed in range(5):
+            points = _random_points(60, 200 + seed)
+            total_2opt += optimize_tour(points, engine="2opt", fixed_end=True, time_budget_ms=0)[1]
+            total_combined += optimize_tour(points, engine="2opt+oropt", fixed_end=True, time_budget_ms=0)[1]
+        self.assertLessEqual(total_combined, total_2opt)
+
+    def test_time_budget_is_respected(self):
+        _, _, stats = optimize_tour(_random_points(300, 3), time_budget_ms=1)
+        self.assertTrue(stats["budget_exhausted"])
+        self.assertLess(stats["improve_ms"], 200)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            optimize_tour(_random_points(5, 1), engine="nope")
+
+    def test_trivial_inputs(self):
+        self.assertEqual(optimize_tour([])[0:2], ([], 0.0))
+        self.assertEqual(optimize_tour([[19.4, -99.1]])[0:2], ([0], 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import math
+import unittest
+
+import app
+from state_vectors import decode_states
+
+
+def _row(icao, callsign, lon, lat, alt=1000.0, velocity=200.0, track=90.0):
+    return [icao, callsign, "Mexico", 1700000000, 1700000001, lon, lat, alt, False, velocity, track, 0.0, None, alt, "1234", False, 0]
+
+
+class TestDecodeStates(unittest.TestCase):
+    def test_columns_and_missing_values(self):
+        states = [
+            _row("abc123", "AMX100  ", -99.1, 19.4),
+            _row("def456", None, None, 19.5),
+            ["ghi789", "FDX1", "USA", None, None, -99.0, 19.0],  # fila corta
+            _row("jkl000", "UPS2", -98.0, 20.0, alt="n/a"),
+        ]
+        cols = decode_states(states)
+        self.assertEqual(len(cols), 4)
+        self.assertEqual(cols.callsign.tolist(), ["AMX100", "", "FDX1", "UPS2"])
+        self.assertTrue(math.isnan(cols.lon[1]))
+        self.assertTrue(math.isnan(cols.baro_altitude[2]))
+        self.assertTrue(math.isnan(cols.baro_altitude[3]))
+        self.assertEqual(cols.position_source.tolist(), [0, 0, -1, 0])
+        self.assertEqual(cols.valid_position().tolist(), [True, False, True, True])
+
+    def test_empty(self):
+        self.assertEqual(len(decode_states(None)), 0)
+        self.assertEqual(app.decode_flight_records([]), [])
+
+    def test_records_match_previous_format(self):
+        records = app.decode_flight_records([_row("abc123", "AMX100 ", -99.1, 19.4, velocity=None), _row(None, "X", None, None)], now_ts=5)
+        self.assertEqual(records, [{
+            "icao24": "abc123", "callsign": "AMX100", "origin_country": "Mexico", "lat": 19.4, "lon": -99.1,
+            "alt": 1000.0, "velocity": None, "heading": 90.0, "type": "desconocido", "destination": None, "fetched_at": 5,
+        }])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import tempfile
+import threading
+import time
+import unittest
+
+from services.tts_cache import TTSCache, tts_cache_key
+
+
+class TestTTSCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_key_depends_on_voice_settings(self):
+        a = tts_cache_key("Ruta  calculada", "voz", "modelo", "mp3", stability=0.3)
+        self.assertEqual(a, tts_cache_key("Ruta calculada ", "voz", "modelo", "mp3", stability=0.3))
+        self.assertNotEqual(a, tts_cache_key("Ruta calculada", "voz", "modelo", "mp3", stability=0.7))
+        self.assertNotEqual(a, tts_cache_key("Ruta calculada", "otra", "modelo", "mp3", stability=0.3))
+
+    def test_lru_eviction_by_size(self):
+        cache = TTSCache(self.tmp.name, max_bytes=250)
+        for key in ("a", "b"):
+            cache.put(key, b"x" * 100)
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("c", b"x" * 100)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertFalse(cache.path_for("b").exists())
+        self.assertEqual(cache.stats()["evictions"], 1)
+        # El índice se reconstruye desde disco al reiniciar
+        self.assertEqual(TTSCache(self.tmp.name, max_bytes=250).stats()["files"], 2)
+
+    def test_concurrent_requests_synthesize_once(self):
+        cache = TTSCache(self.tmp.name)
+        calls = []
+
+        def synthesize():
+            calls.append(1)
+            time.sleep(0.05)
+            return b"mp3"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_synthesize("k", synthesize))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [b"mp3"] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_synthesis_not_cached(self):
+        cache = TTSCache(self.tmp.name)
+        self.assertIsNone(cache.get_or_synthesize("k", lambda: None))
+        self.assertNotIn("k", cache)
+        self.assertEqual(cache.presynthesize([("p", "frase")], lambda text: text.encode()), 1)
+        self.assertEqual(cache.presynthesize([("p", "frase")], lambda text: text.encode()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
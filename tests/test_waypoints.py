@@ -0,0 +1,47 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import app
+from services.http_client import RateLimiter
+
+
+class TestResolveWaypoints(unittest.TestCase):
+    def test_dedup_and_order(self):
+        calls = []
+        lock = threading.Lock()
+
+        def fake_geocode(query):
+            with lock:
+                calls.append(query)
+            return None if query == "nada" else (1.0, 2.0)
+
+        with mock.patch.object(app, "call_geocode_address", side_effect=fake_geocode):
+            result = app.resolve_waypoints([[19.4, -99.1], "Toluca", {"lat": 20, "lon": -100}, "TOLUCA ", "nada", "", None])
+        self.assertEqual(result, [[19.4, -99.1], [1.0, 2.0], [20.0, -100.0], [1.0, 2.0], None, None, None])
+        self.assertEqual(sorted(calls), ["Toluca", "nada"])
+
+    def test_signed_coordinates_are_not_merged(self):
+        with mock.patch.object(app, "call_geocode_address", side_effect=lambda q: (19.4, -99.1) if "-" in q else (19.4, 99.1)) as geocode:
+            result = app.resolve_waypoints(["19.4,-99.1", "19.4, 99.1"])
+        self.assertEqual(result, [[19.4, -99.1], [19.4, 99.1]])
+        self.assertEqual(geocode.call_count, 2)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_spaces_concurrent_callers(self):
+        limiter = RateLimiter(20)
+        stamps = []
+        threads = [threading.Thread(target=lambda: (limiter.acquire(), stamps.append(time.monotonic()))) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stamps.sort()
+        self.assertGreaterEqual(stamps[-1] - stamps[0], 0.14)
+        self.assertEqual(limiter.stats()["acquired"], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()